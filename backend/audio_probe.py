@@ -0,0 +1,423 @@
+"""Определение формата, кодека и длительности аудио по заголовкам контейнера, без декодирования.
+
+Читаются только нужные участки файла (заголовки, атомы moov, последняя страница OGG),
+поэтому разбор занимает микросекунды и не зависит от длины записи.
+"""
+
+import os
+import struct
+from dataclasses import asdict, dataclass, replace
+from typing import BinaryIO, List, Optional, Tuple
+
+
+# Расширение -> MIME-тип для форматов, которые принимает Whisper
+AUDIO_MIME_TYPES = {
+    "ogg": "audio/ogg",
+    "m4a": "audio/mp4",
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "webm": "audio/webm",
+    "flac": "audio/flac",
+    "aac": "audio/aac",
+}
+
+# Сколько байт заголовка нужно для sniff_audio_format
+SNIFF_BYTES = 12
+
+
+def sniff_audio_format(head: bytes) -> Optional[str]:
+    """Возвращает расширение по сигнатуре контейнера или None, если формат не распознан."""
+    if head.startswith(b"OggS"):
+        return "ogg"
+    if len(head) >= 8 and head[4:8] == b"ftyp":
+        return "m4a"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "wav"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    if head.startswith(b"ID3"):
+        return "mp3"
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0:
+        # Кадровая синхронизация: layer 00 - это ADTS (AAC), иначе MPEG audio
+        return "aac" if (head[1] & 0x06) == 0 else "mp3"
+    return None
+
+
+def sniff_stream(stream, default: str = "m4a") -> Tuple[str, str]:
+    """Определяет формат по началу потока и возвращает позицию чтения на место.
+
+    Возвращает (расширение, MIME-тип).
+    """
+    position = stream.tell()
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(position)
+    ext = sniff_audio_format(head) or default
+    return ext, AUDIO_MIME_TYPES.get(ext, "application/octet-stream")
+
+
+@dataclass
+class AudioInfo:
+    format: str
+    codec: Optional[str] = None
+    # None, если длительность нельзя определить по заголовкам (например, webm)
+    duration: Optional[float] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    bitrate: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        info = asdict(self)
+        if self.duration is not None:
+            info["duration"] = round(self.duration, 3)
+        return info
+
+
+# Больше этого moov не читаем целиком (обычно он занимает десятки килобайт)
+MAX_MOOV_BYTES = 16 * 1024 * 1024
+# Хвост OGG, в котором ищется последняя страница (максимальная страница ~64 КБ)
+OGG_TAIL_BYTES = 65536 + 4096
+
+
+def probe_audio(path: str) -> Optional[AudioInfo]:
+    """Разбирает заголовки файла. Возвращает None, если формат не распознан или файл битый."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            ext = sniff_audio_format(f.read(SNIFF_BYTES))
+            if ext is None:
+                return None
+            f.seek(0)
+            parser = _PARSERS.get(ext)
+            info = parser(f, size) if parser else AudioInfo(format=ext)
+    except (OSError, struct.error, ValueError, IndexError, ZeroDivisionError) as e:
+        print(f"[Probe] Не удалось разобрать {os.path.basename(path)}: {e}")
+        return None
+    if info.bitrate is None and info.duration:
+        info.bitrate = int(size * 8 / info.duration)
+    return info
+
+
+def probe_segments(paths: List[str]) -> Optional[AudioInfo]:
+    """Сводная информация по записи из нескольких сегментов: длительности складываются."""
+    infos = [probe_audio(path) for path in paths]
+    if not infos or infos[0] is None:
+        return None
+    combined = replace(infos[0], bitrate=None)
+    durations = [info.duration if info else None for info in infos]
+    combined.duration = None if None in durations else sum(durations)
+    return combined
+
+
+def _read_exact(f: BinaryIO, n: int) -> bytes:
+    data = f.read(n)
+    if len(data) < n:
+        raise ValueError("неожиданный конец файла")
+    return data
+
+
+# --- MP4 / M4A ---
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Атомы внутри буфера: (тип, начало содержимого, конец атома)."""
+    pos = start
+    end = len(data) if end is None else end
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _find_box(data: bytes, path: Tuple[bytes, ...], start: int = 0, end: Optional[int] = None):
+    for kind, body, box_end in _iter_boxes(data, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return body, box_end
+            found = _find_box(data, path[1:], body, box_end)
+            if found:
+                return found
+    return None
+
+
+def _read_moov(f: BinaryIO, size: int) -> bytes:
+    """Пропускает атомы верхнего уровня (в том числе mdat) через seek до moov."""
+    pos = 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        box_size, kind = struct.unpack(">I4s", _read_exact(f, 8))
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", _read_exact(f, 8))[0]
+            header = 16
+        elif box_size == 0:
+            box_size = size - pos
+        if box_size < header:
+            break
+        if kind == b"moov":
+            if box_size > MAX_MOOV_BYTES:
+                raise ValueError("слишком большой moov")
+            return _read_exact(f, box_size - header)
+        pos += box_size
+    raise ValueError("нет атома moov")
+
+
+def _media_header(data: bytes, body: int) -> Tuple[int, int]:
+    """timescale и duration из mvhd/mdhd (версии 0 и 1)."""
+    version = data[body]
+    if version == 1:
+        return struct.unpack_from(">IQ", data, body + 20)
+    return struct.unpack_from(">II", data, body + 12)
+
+
+def _parse_mp4(f: BinaryIO, size: int) -> AudioInfo:
+    moov = _read_moov(f, size)
+    info = AudioInfo(format="m4a")
+
+    mvhd = _find_box(moov, (b"mvhd",))
+    if mvhd:
+        timescale, duration = _media_header(moov, mvhd[0])
+        if timescale:
+            info.duration = duration / timescale
+
+    # Звуковая дорожка: у неё hdlr = soun; её mdhd точнее mvhd (без edit list)
+    for kind, body, end in _iter_boxes(moov):
+        if kind != b"trak":
+            continue
+        hdlr = _find_box(moov, (b"mdia", b"hdlr"), body, end)
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b"soun":
+            continue
+        mdhd = _find_box(moov, (b"mdia", b"mdhd"), body, end)
+        if mdhd:
+            timescale, duration = _media_header(moov, mdhd[0])
+            if timescale:
+                info.duration = duration / timescale
+        stsd = _find_box(moov, (b"mdia", b"minf", b"stbl", b"stsd"), body, end)
+        if stsd:
+            # version/flags, entry_count, затем первая запись: size, format, 6 reserved, data_ref_index
+            entry = stsd[0] + 8
+            info.codec = moov[entry + 4:entry + 8].decode("latin-1").strip()
+            channels, _, _, _, rate = struct.unpack_from(">HHHHI", moov, entry + 24)
+            info.channels = channels
+            info.sample_rate = rate >> 16
+            entry_end = entry + struct.unpack_from(">I", moov, entry)[0]
+            esds = _find_box(moov, (b"esds",), entry + 36, min(entry_end, stsd[1]))
+            if esds:
+                _apply_esds(moov[esds[0] + 4:esds[1]], info)
+        break
+    return info
+
+
+def _read_descriptor(data: bytes, pos: int) -> Tuple[int, int, int]:
+    """Дескриптор MPEG-4: (тег, начало содержимого, конец)."""
+    tag = data[pos]
+    pos += 1
+    length = 0
+    for _ in range(4):
+        byte = data[pos]
+        pos += 1
+        length = (length << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            break
+    return tag, pos, pos + length
+
+
+def _apply_esds(esds: bytes, info: AudioInfo) -> None:
+    """Средний битрейт и число каналов из esds: в sample entry AAC каналы часто записаны как 2."""
+    tag, pos, end = _read_descriptor(esds, 0)
+    if tag != 0x03:
+        return
+    flags = esds[pos + 2]
+    pos += 3
+    if flags & 0x80:
+        pos += 2
+    if flags & 0x40:
+        pos += 1 + esds[pos]
+    if flags & 0x20:
+        pos += 2
+    tag, pos, end = _read_descriptor(esds, pos)
+    if tag != 0x04:
+        return
+    info.codec = "aac" if esds[pos] == 0x40 else info.codec
+    avg_bitrate = struct.unpack_from(">I", esds, pos + 9)[0]
+    if avg_bitrate:
+        info.bitrate = avg_bitrate
+    if pos + 13 < end:
+        tag, pos, _ = _read_descriptor(esds, pos + 13)
+        if tag == 0x05 and pos + 2 <= len(esds):
+            # AudioSpecificConfig: 5 бит тип объекта, 4 бита индекс частоты, 4 бита каналы
+            config = int.from_bytes(esds[pos:pos + 2], "big")
+            channels = (config >> 3) & 0xF
+            if channels:
+                info.channels = channels
+
+
+# --- OGG (Opus / Vorbis) ---
+
+def _parse_ogg(f: BinaryIO, size: int) -> AudioInfo:
+    header = _read_exact(f, 27)
+    segments = header[26]
+    packet = f.read(sum(_read_exact(f, segments)))
+    info = AudioInfo(format="ogg")
+    pre_skip = 0
+    if packet.startswith(b"OpusHead"):
+        info.codec = "opus"
+        info.channels = packet[9]
+        pre_skip = struct.unpack_from("<H", packet, 10)[0]
+        info.sample_rate = struct.unpack_from("<I", packet, 12)[0] or 48000
+        # Гранулы Opus всегда в отсчётах 48 кГц, независимо от исходной частоты
+        granule_rate = 48000
+    elif packet.startswith(b"\x01vorbis"):
+        info.codec = "vorbis"
+        info.channels = packet[11]
+        info.sample_rate = struct.unpack_from("<I", packet, 12)[0]
+        granule_rate = info.sample_rate
+    else:
+        return info
+
+    # Длительность - позиция гранулы последней страницы
+    tail_start = max(0, size - OGG_TAIL_BYTES)
+    f.seek(tail_start)
+    tail = f.read()
+    last = tail.rfind(b"OggS")
+    while last >= 0:
+        if last + 14 <= len(tail):
+            granule = struct.unpack_from("<q", tail, last + 6)[0]
+            if granule >= 0:
+                info.duration = max(0, granule - pre_skip) / granule_rate
+                break
+        last = tail.rfind(b"OggS", 0, last)
+    return info
+
+
+# --- WAV ---
+
+WAV_CODECS = {1: "pcm", 3: "pcm_float", 6: "alaw", 7: "mulaw", 0xFFFE: "extensible"}
+
+
+def _parse_wav(f: BinaryIO, size: int) -> AudioInfo:
+    info = AudioInfo(format="wav")
+    pos = 12
+    byte_rate = 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        chunk, chunk_size = struct.unpack("<4sI", _read_exact(f, 8))
+        if chunk == b"fmt ":
+            tag, channels, rate, byte_rate = struct.unpack("<HHII", _read_exact(f, 12))
+            info.codec = WAV_CODECS.get(tag, f"0x{tag:04x}")
+            info.channels = channels
+            info.sample_rate = rate
+            info.bitrate = byte_rate * 8
+        elif chunk == b"data":
+            # При записи потоком размер data бывает не заполнен - берём остаток файла
+            data_size = min(chunk_size, size - pos - 8)
+            if byte_rate:
+                info.duration = data_size / byte_rate
+            break
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return info
+
+
+# --- FLAC ---
+
+def _parse_flac(f: BinaryIO, size: int) -> AudioInfo:
+    # fLaC, заголовок блока STREAMINFO (4 байта), затем 34 байта STREAMINFO
+    block = _read_exact(f, 42)[8:]
+    packed = int.from_bytes(block[10:18], "big")
+    rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    return AudioInfo(
+        format="flac",
+        codec="flac",
+        sample_rate=rate,
+        channels=channels,
+        duration=total_samples / rate if rate and total_samples else None,
+    )
+
+
+# --- MP3 ---
+
+MP3_BITRATES = {
+    # (MPEG-1?, layer) -> кбит/с по индексу
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+# Сколько байт от начала аудио просматривать в поисках первого кадра
+MP3_SCAN_BYTES = 64 * 1024
+
+
+def _parse_mp3(f: BinaryIO, size: int) -> AudioInfo:
+    start = 0
+    head = _read_exact(f, 10)
+    if head.startswith(b"ID3"):
+        # Размер тега ID3v2 - syncsafe integer (по 7 бит в байте)
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+    f.seek(start)
+    buf = f.read(MP3_SCAN_BYTES)
+
+    for offset in range(len(buf) - 4):
+        if buf[offset] != 0xFF or (buf[offset + 1] & 0xE0) != 0xE0:
+            continue
+        version_bits = (buf[offset + 1] >> 3) & 0x3
+        layer = 4 - ((buf[offset + 1] >> 1) & 0x3)
+        bitrate_index = buf[offset + 2] >> 4
+        rate_index = (buf[offset + 2] >> 2) & 0x3
+        if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+        mpeg1 = version_bits == 3
+        bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+        rate = MP3_SAMPLE_RATES[version_bits][rate_index]
+        mono = (buf[offset + 3] >> 6) == 3
+        break
+    else:
+        return AudioInfo(format="mp3", codec="mp3")
+
+    info = AudioInfo(format="mp3", codec=f"mp{layer}", sample_rate=rate, channels=1 if mono else 2)
+    samples_per_frame = 384 if layer == 1 else (1152 if mpeg1 or layer == 2 else 576)
+
+    # VBR: число кадров лежит в заголовке Xing/Info или VBRI первого кадра
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    frames = None
+    xing = offset + 4 + side_info
+    if buf[xing:xing + 4] in (b"Xing", b"Info") and len(buf) >= xing + 12:
+        flags = struct.unpack_from(">I", buf, xing + 4)[0]
+        if flags & 0x1:
+            frames = struct.unpack_from(">I", buf, xing + 8)[0]
+    elif buf[offset + 36:offset + 40] == b"VBRI" and len(buf) >= offset + 54:
+        frames = struct.unpack_from(">I", buf, offset + 50)[0]
+
+    if frames:
+        info.duration = frames * samples_per_frame / rate
+    else:
+        # CBR: длительность по размеру аудиоданных (без тега ID3v1 в конце)
+        audio_bytes = size - start - offset
+        f.seek(max(0, size - 128))
+        if f.read(3) == b"TAG":
+            audio_bytes -= 128
+        info.bitrate = bitrate
+        info.duration = audio_bytes * 8 / bitrate
+    return info
+
+
+_PARSERS = {
+    "m4a": _parse_mp4,
+    "ogg": _parse_ogg,
+    "wav": _parse_wav,
+    "flac": _parse_flac,
+    "mp3": _parse_mp3,
+}
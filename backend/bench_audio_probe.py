@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Замер скорости разбора заголовков аудио (audio_probe) на корпусе файлов
+
+Использование:
+    python bench_audio_probe.py                 # все аудио из backend/data
+    python bench_audio_probe.py <файл|папка>... [--repeat N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from audio_probe import AUDIO_MIME_TYPES, probe_audio
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.splitext(name)[1].lstrip(".").lower() in AUDIO_MIME_TYPES:
+                    files.append(os.path.join(path, name))
+        elif os.path.isfile(path):
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк audio_probe.probe_audio")
+    parser.add_argument("paths", nargs="*", default=[DATA_DIR])
+    parser.add_argument("--repeat", type=int, default=20, help="сколько раз разбирать каждый файл")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths)
+    if not files:
+        print("❌ Аудиофайлы не найдены")
+        sys.exit(1)
+
+    timings_us = []
+    recognized = 0
+    total_duration = 0.0
+    formats = {}
+    for path in files:
+        info = probe_audio(path)
+        if info is not None:
+            formats[info.format] = formats.get(info.format, 0) + 1
+            if info.duration is not None:
+                recognized += 1
+                total_duration += info.duration
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            probe_audio(path)
+            timings_us.append((time.perf_counter() - started) * 1e6)
+
+    timings_us.sort()
+    p95 = timings_us[int(len(timings_us) * 0.95) - 1] if len(timings_us) >= 20 else timings_us[-1]
+    print(f"📁 Файлов: {len(files)}, форматы: {formats}")
+    print(f"⏱️  Длительность определена: {recognized}/{len(files)}, всего {total_duration:.1f} с аудио")
+    print(f"⚡ Разбор одного файла: медиана {statistics.median(timings_us):.1f} мкс, "
+          f"p95 {p95:.1f} мкс, максимум {timings_us[-1]:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Память и скорость поиска задач в jobs: прежний dataclass против компактной записи
+
+Использование:
+    python bench_job_memory.py                          # 10k, 100k, 1M задач
+    python bench_job_memory.py --counts 10000 100000 --text-chars 600 --long-share 0.1
+
+Каждый замер - отдельный процесс: RSS до и после создания N задач (с путями, таймлайном,
+AudioInfo и текстом результата, как у незабранных задач), затем случайные поиски по id
+с чтением статуса и текста. Тексты собираются из словаря, поэтому сжимаются примерно
+как настоящая речь; доля long-share - длинные записи в 20 раз больше обычных.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from audio_probe import AudioInfo
+from job_store import JobStatus, TranscriptionJob
+from tenants import ClientPolicy
+from tracing import JobTrace
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+WORDS = ("привет как дела сегодня встреча перенесли на завтра отправь пожалуйста документ "
+         "проверь почту позвони мне после обеда нужно купить хлеб молоко и сыр задача готова "
+         "спасибо хорошо договорились напомни через час отчёт по проекту созвон в пятницу").split()
+STAGES = ("persisted", "queued", "provider_request_sent", "first_byte", "completed")
+
+
+class LegacyTrace:
+    """JobTrace до перехода на __slots__."""
+
+    def __init__(self) -> None:
+        self.started_wall = time.time()
+        self.started_mono = time.monotonic()
+        self.marks = {"received": self.started_mono}
+
+
+@dataclass
+class LegacyJob:
+    """TranscriptionJob до компактной записи: dataclass с __dict__, статус строкой, текст целиком."""
+    audio_path: str
+    transcription_path: str
+    status: str = "processing"
+    transcription_text: Optional[str] = None
+    trace: LegacyTrace = field(default_factory=LegacyTrace)
+    batch_id: Optional[str] = None
+    callback_url: Optional[str] = None
+    callback_secret: Optional[str] = None
+    deadline: Optional[float] = None
+    cancelled: bool = False
+    segment_paths: List[str] = field(default_factory=list)
+    audio_info: Optional[AudioInfo] = None
+    expected_done: Optional[float] = None
+    in_flight_at_start: int = 0
+    source: str = "api"
+    created_at: float = field(default_factory=time.time)
+    client: Optional[ClientPolicy] = None
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # macOS: ru_maxrss в байтах (пиковое значение, для роста памяти этого достаточно)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def make_text(rng: random.Random, chars: int) -> str:
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def build(kind: str, count: int, text_chars: int, long_share: float) -> dict:
+    rng = random.Random(42)
+    # Готовые тексты переиспользуются, но каждой задаче достаётся своя копия строки
+    texts = [make_text(rng, text_chars) for _ in range(200)]
+    long_texts = [make_text(rng, text_chars * 20) for _ in range(20)]
+    client = ClientPolicy("anonymous")
+    job_class = LegacyJob if kind == "legacy" else TranscriptionJob
+    trace_class = LegacyTrace if kind == "legacy" else JobTrace
+    jobs = {}
+    before = rss_bytes()
+    started = time.perf_counter()
+    for index in range(count):
+        job_id = f"w0-{uuid.uuid4()}"
+        trace = trace_class()
+        for stage in STAGES:
+            trace.marks[stage] = trace.started_mono + rng.random()
+        base = rng.choice(long_texts) if rng.random() < long_share else rng.choice(texts)
+        jobs[job_id] = job_class(
+            audio_path=os.path.join(DATA_DIR, f"{job_id}.m4a"),
+            transcription_path=os.path.join(DATA_DIR, f"{job_id}.txt"),
+            trace=trace,
+            audio_info=AudioInfo("m4a", codec="aac", duration=rng.uniform(1, 60), sample_rate=44100,
+                                 channels=1, bitrate=64000),
+            # Источник приходит из поля формы - каждый раз новая строка
+            source="".join(["tele", "gram"]),
+            client=client,
+        )
+        job = jobs[job_id]
+        job.transcription_text = f"{index} {base}"
+        job.status = "ready" if kind == "legacy" else JobStatus.READY
+    build_s = time.perf_counter() - started
+    after = rss_bytes()
+
+    ids = list(jobs)
+    rng.shuffle(ids)
+    probes = ids[:min(len(ids), 200000)]
+    lookups = []
+    reads = []
+    for job_id in probes:
+        t0 = time.perf_counter_ns()
+        job = jobs[job_id]
+        ready = job.status == "ready"
+        t1 = time.perf_counter_ns()
+        if ready:
+            job.transcription_text
+        lookups.append(t1 - t0)
+        reads.append(time.perf_counter_ns() - t1)
+    return {
+        "kind": kind,
+        "count": count,
+        "rss_mb": (after - before) / 1e6,
+        "bytes_per_job": (after - before) / count,
+        "build_s": build_s,
+        "lookup_p50_us": statistics.median(lookups) / 1000,
+        "lookup_p99_us": percentile(lookups, 0.99) / 1000,
+        "text_p50_us": statistics.median(reads) / 1000,
+        "text_p99_us": percentile(reads, 0.99) / 1000,
+    }
+
+
+def percentile(values: List[int], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * share) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и поиск задач: прежняя и компактная запись")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--kinds", nargs="+", choices=("legacy", "compact"), default=["legacy", "compact"])
+    parser.add_argument("--text-chars", type=int, default=400, help="длина обычного текста результата, символов")
+    parser.add_argument("--long-share", type=float, default=0.05, help="доля длинных записей (x20)")
+    parser.add_argument("--child", nargs=2, metavar=("KIND", "COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, count = args.child
+        print(json.dumps(build(kind, int(count), args.text_chars, args.long_share)))
+        return
+
+    print(f"{'задач':>9} {'запись':>8} {'RSS, МБ':>9} {'байт/задача':>12} {'создание, с':>12} "
+          f"{'поиск, мкс p50/p99':>19} {'текст, мкс p50/p99':>19}")
+    results = {}
+    for count in args.counts:
+        for kind in args.kinds:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", kind, str(count),
+                 "--text-chars", str(args.text_chars), "--long-share", str(args.long_share)],
+                capture_output=True, text=True, check=True).stdout
+            result = results[(kind, count)] = json.loads(out)
+            print(f"{count:>9} {kind:>8} {result['rss_mb']:>9.1f} {result['bytes_per_job']:>12.0f} "
+                  f"{result['build_s']:>12.2f} {result['lookup_p50_us']:>9.2f} / {result['lookup_p99_us']:<7.2f}"
+                  f" {result['text_p50_us']:>9.2f} / {result['text_p99_us']:.2f}")
+        if ("legacy", count) in results and ("compact", count) in results:
+            saved = 1 - results[("compact", count)]["rss_mb"] / results[("legacy", count)]["rss_mb"]
+            print(f"{'':>9} компактная запись экономит {saved:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Сравнение локального форматирования (local_formatter) с форматированием через LLM
+
+Использование:
+    python bench_local_formatter.py                 # только локальный путь по backend/data/*.txt
+    python bench_local_formatter.py --llm           # плюс LLM через /api/chat бэкенда (нужен config.json)
+    python bench_local_formatter.py --llm --all     # LLM и для текстов, которые ушли бы локально
+"""
+
+import argparse
+import difflib
+import glob
+import os
+import statistics
+import time
+
+from local_formatter import FormattingPolicy, format_locally
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Сохранённые сообщения об ошибках провайдеров - не транскрипции
+SKIP_PREFIXES = ("Create transcript failed", "Ошибка", "Критическая ошибка", "Транскрипция пуста", "[fake]")
+
+
+def similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, " ".join(a.split()), " ".join(b.split())).ratio()
+
+
+def load_corpus(pattern: str):
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as handle:
+            text = handle.read().strip()
+        if text and not text.startswith(SKIP_PREFIXES):
+            texts.append((os.path.basename(path), text))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк локального форматирования против LLM")
+    parser.add_argument("--corpus", default=os.path.join(DATA_DIR, "*.txt"))
+    parser.add_argument("--llm", action="store_true", help="сравнить с форматированием через LLM")
+    parser.add_argument("--all", action="store_true", help="гонять LLM и для текстов локального уровня")
+    parser.add_argument("--threshold", type=float, default=None, help="порог сложности (по умолчанию из политики)")
+    args = parser.parse_args()
+
+    policy = FormattingPolicy()
+    if args.threshold is not None:
+        policy.llm_threshold = args.threshold
+
+    format_with_llm = None
+    if args.llm:
+        # Тот же промпт и тот же путь, что у бота
+        from telegram_bot import format_text_with_chatgpt as format_with_llm
+
+    texts = load_corpus(args.corpus)
+    if not texts:
+        print("❌ Тексты не найдены")
+        return
+
+    local_ms, llm_ms, similarities = [], [], []
+    local_count = 0
+    for name, text in texts:
+        complexity = policy.complexity(text)
+        is_local = complexity <= policy.llm_threshold
+        local_count += is_local
+
+        started = time.perf_counter()
+        local = format_locally(text, policy)
+        local_ms.append((time.perf_counter() - started) * 1000)
+
+        line = f"{name[:8]} сложность {complexity:4.2f} {'локально' if is_local else 'LLM     '} {local_ms[-1]:6.2f} мс"
+        if format_with_llm and (is_local or args.all):
+            started = time.perf_counter()
+            llm = format_with_llm(text)
+            llm_ms.append((time.perf_counter() - started) * 1000)
+            if llm:
+                similarities.append(similarity(local, llm))
+                line += f" | LLM {llm_ms[-1]:7.0f} мс, сходство {similarities[-1]:.3f}"
+        print(line)
+
+    print(f"\n📁 Текстов: {len(texts)}, локально: {local_count}, LLM: {len(texts) - local_count} "
+          f"(порог {policy.llm_threshold})")
+    print(f"⚡ Локально: медиана {statistics.median(local_ms):.2f} мс, максимум {max(local_ms):.2f} мс")
+    if llm_ms:
+        print(f"🐢 LLM: медиана {statistics.median(llm_ms):.0f} мс, максимум {max(llm_ms):.0f} мс")
+    if similarities:
+        print(f"🔍 Сходство локального результата с LLM (difflib): медиана {statistics.median(similarities):.3f}, "
+              f"минимум {min(similarities):.3f}")
+
+
+if __name__ == "__main__":
+    main()
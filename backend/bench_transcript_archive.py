@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Построение индекса и поиск в архиве транскрипций (transcript_archive)
+
+Использование:
+    python bench_transcript_archive.py                 # 100 000 записей
+    python bench_transcript_archive.py --entries 300000
+
+Записи собираются из предложений транскрипций backend/data/*.txt (реальный словарь),
+с временем, равномерно растущим в пределах последнего года. Архив пишется во временную папку.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from transcript_archive import TranscriptArchive
+from bench_local_formatter import DATA_DIR, load_corpus
+from local_formatter import split_sentences
+
+YEAR = 365 * 24 * 3600
+
+
+def timed(fn, repeat: int = 20):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк архива транскрипций")
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sentences = [s for _, text in load_corpus(os.path.join(DATA_DIR, "*.txt")) for s in split_sentences(text)]
+    if not sentences:
+        print("❌ Тексты не найдены")
+        return
+    rng = random.Random(args.seed)
+    now = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = TranscriptArchive(tmp)
+        started = time.perf_counter()
+        for i in range(args.entries):
+            text = " ".join(rng.choice(sentences) for _ in range(rng.randint(1, 6)))
+            # Записи приходят по времени, с небольшим разбросом (завершаются не в порядке постановки)
+            created_at = now - YEAR + YEAR * i / args.entries - rng.random() * 60
+            archive.add(f"rec-{i}", text, created_at=created_at,
+                        source=rng.choice(("api", "telegram", "session")), duration=rng.uniform(2, 120))
+        build = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(tmp, "entries.jsonl"))
+        stats = archive.stats()
+        print(f"📥 Добавление: {args.entries} записей за {build:.1f} с ({args.entries / build:.0f} зап/с), "
+              f"журнал {size / 2**20:.1f} МБ, термов {stats['terms']}")
+        archive.close()
+
+        started = time.perf_counter()
+        archive = TranscriptArchive(tmp)
+        archive.load()
+        print(f"🔁 Загрузка с диска: {time.perf_counter() - started:.1f} с")
+
+        # Термы разной частоты из самого словаря
+        by_frequency = sorted(archive._postings, key=lambda t: len(archive._postings[t]))
+        rare = next(t for t in by_frequency if len(archive._postings[t]) >= 4 and len(t) > 4)
+        medium = by_frequency[len(by_frequency) * 9 // 10]
+        common = by_frequency[-1]
+        prefix = next(t for t in reversed(by_frequency) if len(t) > 6)[:4]
+        week_ago = now - 7 * 24 * 3600
+        queries = [
+            ("редкий терм", dict(query=rare)),
+            ("средний терм", dict(query=medium)),
+            ("частый терм", dict(query=common)),
+            ("два терма", dict(query=f"{medium} {rare}")),
+            ("префикс", dict(query=prefix + "*")),
+            ("средний + неделя", dict(query=medium, since=week_ago)),
+            ("частый + источник", dict(query=common, source="telegram")),
+            ("последние за неделю", dict(since=week_ago)),
+        ]
+        print(f"\n{'запрос':<22} {'найдено':>8} {'медиана':>9} {'максимум':>9}")
+        for label, kwargs in queries:
+            median, worst, (total, _) = timed(lambda: archive.search(**kwargs))
+            shown = kwargs.get("query", "")
+            print(f"{label:<22} {total:>8} {median:>7.2f}мс {worst:>7.2f}мс  {shown}")
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Пиковая память при загрузке файла: requests files={...} против MultipartStream
+
+Использование:
+    python bench_upload_memory.py                    # файлы 1, 8, 32 МБ
+    python bench_upload_memory.py --sizes 1 64 256   # свои размеры, МБ
+
+Файлы отправляются на локальный приёмник, который вычитывает тело кусками и проверяет
+длину. Память меряется tracemalloc (выделения Python) по каждой загрузке отдельно.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from multipart_stream import MultipartStream
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    """Вычитывает тело, не храня его, и возвращает число принятых байт."""
+
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length") or 0)
+        received = 0
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            received += len(chunk)
+            remaining -= len(chunk)
+        body = str(received).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(upload) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    received = upload()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк памяти при потоковой загрузке multipart")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 8, 32], help="размеры файлов, МБ")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/upload"
+    session = requests.Session()
+
+    print(f"{'размер':>8} | {'files= пик':>12} {'время':>7} | {'поток пик':>12} {'время':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes:
+            path = os.path.join(tmp, f"audio_{size_mb}.m4a")
+            with open(path, "wb") as handle:
+                for _ in range(size_mb):
+                    handle.write(os.urandom(1024 * 1024))
+
+            def upload_files():
+                with open(path, "rb") as f:
+                    resp = session.post(url, files={"file": f}, data={"model": "whisper-1"})
+                return int(resp.text)
+
+            def upload_stream():
+                with MultipartStream(fields={"model": "whisper-1"},
+                                     files=[("file", os.path.basename(path), path, "audio/mp4")]) as body:
+                    resp = session.post(url, data=body, headers=body.headers)
+                    assert int(resp.text) == len(body), "приёмник получил не всё тело"
+                return int(resp.text)
+
+            files_peak, files_time, _ = measure(upload_files)
+            stream_peak, stream_time, _ = measure(upload_stream)
+            print(f"{size_mb:>6} МБ | {files_peak / 2**20:>9.2f} МБ {files_time:>6.2f}с | "
+                  f"{stream_peak / 2**20:>9.2f} МБ {stream_time:>6.2f}с")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
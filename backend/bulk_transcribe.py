@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Пакетная транскрибация папки с записями тем же движком, что и у сервера
+
+Использование:
+    python bulk_transcribe.py <папка> [--output папка] [--jobs 4] [--executor thread|process]
+    python bulk_transcribe.py data --recursive --timeout 120
+
+Результаты пишутся в <output>/<имя>.txt (по умолчанию <папка>/transcripts), каждый файл -
+атомарно через временный файл. Завершённые файлы отмечаются в <output>/manifest.jsonl:
+повторный запуск после прерывания пропускает их и продолжает с оставшихся.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from audio_probe import AUDIO_MIME_TYPES, probe_audio
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def find_audio_files(root: str, recursive: bool) -> List[str]:
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lstrip(".").lower() in AUDIO_MIME_TYPES:
+                files.append(os.path.join(dirpath, name))
+        if not recursive:
+            break
+        dirnames.sort()
+    return files
+
+
+def output_path_for(audio_path: str, root: str, output_dir: str) -> str:
+    relative = os.path.relpath(audio_path, root)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + ".txt")
+
+
+def load_manifest(path: str) -> Dict[str, dict]:
+    """Последняя запись по каждому файлу. Обрезанная при аварии последняя строка пропускается."""
+    entries: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["file"]] = entry
+    return entries
+
+
+def is_done(entry: Optional[dict], audio_path: str, out_path: str) -> bool:
+    """Файл уже расшифрован, не менялся с тех пор и результат на месте."""
+    if not entry or entry.get("status") != "done" or not os.path.exists(out_path):
+        return False
+    stat = os.stat(audio_path)
+    return entry.get("size") == stat.st_size and entry.get("mtime") == int(stat.st_mtime)
+
+
+def write_atomic(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def transcribe_one(audio_path: str, out_path: str, timeout: float) -> dict:
+    """Выполняется в пуле: транскрибирует один файл и атомарно пишет результат."""
+    # Импорт здесь: в пуле процессов сервер (конфиг, HTTP-сессия) поднимается в каждом процессе один раз
+    import server
+
+    started = time.monotonic()
+    stat = os.stat(audio_path)
+    info = probe_audio(audio_path)
+    entry = {
+        "file": audio_path,
+        "size": stat.st_size,
+        "mtime": int(stat.st_mtime),
+        "duration": round(info.duration, 3) if info and info.duration is not None else None,
+    }
+    try:
+        text = server.transcribe_file(audio_path, timeout=timeout)
+    except Exception as e:
+        text = None
+        entry["error"] = str(e)
+    if text is None:
+        entry["status"] = "error"
+        entry.setdefault("error", "движок не вернул результат")
+    else:
+        write_atomic(out_path, text)
+        entry["status"] = "done"
+        entry["output"] = out_path
+    entry["elapsed"] = round(time.monotonic() - started, 3)
+    return entry
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Progress:
+    """Пропускная способность и ETA: по секундам аудио, если длительности известны, иначе по файлам."""
+
+    def __init__(self, total_files: int, total_audio: float) -> None:
+        self.total_files = total_files
+        self.total_audio = total_audio
+        self.started = time.monotonic()
+        self.done_files = 0
+        self.done_audio = 0.0
+
+    def update(self, entry: dict, planned_duration: Optional[float]) -> str:
+        self.done_files += 1
+        self.done_audio += planned_duration or 0.0
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        files_left = self.total_files - self.done_files
+        if self.total_audio and self.done_audio:
+            speed = self.done_audio / elapsed
+            eta = (self.total_audio - self.done_audio) / speed
+            throughput = f"{speed:.1f}x реального времени"
+        else:
+            eta = files_left * elapsed / self.done_files
+            throughput = f"{self.done_files / elapsed:.2f} файл/с"
+        name = os.path.basename(entry["file"])
+        outcome = "✅" if entry["status"] == "done" else f"❌ {entry.get('error')}"
+        return (f"[{self.done_files}/{self.total_files}] {name}: {outcome} за {entry['elapsed']:.1f}с | "
+                f"{throughput} | ETA {format_eta(eta if files_left else 0)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная транскрибация папки с аудио")
+    parser.add_argument("input", help="папка с записями")
+    parser.add_argument("--output", help="куда писать .txt и manifest.jsonl (по умолчанию <input>/transcripts)")
+    parser.add_argument("--recursive", action="store_true", help="обходить вложенные папки")
+    parser.add_argument("--jobs", type=int, default=4, help="сколько файлов обрабатывать одновременно")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread",
+                        help="пул потоков (запросы к провайдеру) или процессов (локальные движки)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="таймаут на один файл, секунд")
+    parser.add_argument("--retry-errors", action="store_true", help="повторить файлы, завершившиеся ошибкой")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.input)
+    output_dir = os.path.abspath(args.output or os.path.join(root, "transcripts"))
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    pending = []
+    skipped = 0
+    for audio_path in find_audio_files(root, args.recursive):
+        out_path = output_path_for(audio_path, root, output_dir)
+        entry = manifest.get(audio_path)
+        if is_done(entry, audio_path, out_path) or (
+                entry and entry.get("status") == "error" and not args.retry_errors):
+            skipped += 1
+            continue
+        pending.append((audio_path, out_path))
+
+    print(f"📁 {root}: к обработке {len(pending)}, пропущено по манифесту {skipped}")
+    if not pending:
+        return
+
+    # Длительности читаются из заголовков заранее - это микросекунды на файл
+    durations = {}
+    for audio_path, _ in pending:
+        info = probe_audio(audio_path)
+        durations[audio_path] = info.duration if info else None
+    progress = Progress(len(pending), sum(d for d in durations.values() if d))
+    if progress.total_audio:
+        print(f"⏱️  Всего аудио: {format_eta(progress.total_audio)}")
+
+    executor_cls = ProcessPoolExecutor if args.executor == "process" else ThreadPoolExecutor
+    failed = 0
+    queue = list(reversed(pending))
+    with open(manifest_path, "a", encoding="utf-8") as manifest_file:
+        executor = executor_cls(max_workers=max(1, args.jobs))
+        in_flight = {}
+        try:
+            # Держим в пуле не больше jobs задач: прерывание не оставляет длинную очередь
+            while queue or in_flight:
+                while queue and len(in_flight) < max(1, args.jobs):
+                    audio_path, out_path = queue.pop()
+                    in_flight[executor.submit(transcribe_one, audio_path, out_path, args.timeout)] = audio_path
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    audio_path = in_flight.pop(future)
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        entry = {"file": audio_path, "status": "error", "error": str(e), "elapsed": 0.0}
+                    failed += entry["status"] != "done"
+                    manifest_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    manifest_file.flush()
+                    os.fsync(manifest_file.fileno())
+                    print(progress.update(entry, durations.get(audio_path)))
+        except KeyboardInterrupt:
+            print("\n⏹️  Прервано. Готовые файлы записаны в манифест - повторный запуск продолжит с оставшихся.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            sys.exit(130)
+        executor.shutdown()
+
+    elapsed = time.monotonic() - progress.started
+    print(f"🏁 Готово за {format_eta(elapsed)}: успешно {len(pending) - failed}, ошибок {failed}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Выбор модели и веб-поиска для каждого запроса к /api/chat.
+
+Веб-поиск добавляет секунды задержки, поэтому включается только для вопросов, которым нужны
+свежие данные. Служебные запросы бота (форматирование, краткая версия) идут без поиска
+и, если настроена, на быстрой модели.
+"""
+
+import json
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+
+ROUTE_KINDS = ("format", "summary", "ask")
+
+# Начало служебных промптов бота: по ним тип определяется, даже если kind не передан
+_KIND_PREFIXES = {
+    "format": ("отформатируй",),
+    "summary": ("создай короткую версию",),
+}
+
+# Признаки вопроса о текущих событиях (основы слов, ru/en)
+_FRESHNESS = re.compile(
+    r"\b(сегодня|сейчас|вчера|завтра|на этой неделе|новост|последн|актуальн|свеж|курс|погод|цен[аыу]|"
+    r"стоимост|расписани|сч[её]т матча)"
+    r"|\b(today|tonight|yesterday|tomorrow|now|latest|news|current|recent|prices?|weather|score|schedule|stocks?)\b",
+    re.IGNORECASE,
+)
+_URL = re.compile(r"https?://|www\.|\b[\w-]+\.(com|ru|org|net|io)\b", re.IGNORECASE)
+_YEAR = re.compile(r"\b(20\d\d)\b")
+
+
+@dataclass
+class RouteDecision:
+    kind: str
+    model: str
+    web_search: bool
+    reason: str
+
+
+def infer_kind(question: str) -> str:
+    head = question.lstrip().lower()
+    for kind, prefixes in _KIND_PREFIXES.items():
+        if head.startswith(prefixes):
+            return kind
+    return "ask"
+
+
+def needs_fresh_data(question: str) -> Optional[str]:
+    """Причина, по которой вопросу нужен веб-поиск, или None."""
+    match = _FRESHNESS.search(question)
+    if match:
+        return f"ключевое слово «{match.group(0)}»"
+    if _URL.search(question):
+        return "ссылка в вопросе"
+    current_year = time.gmtime().tm_year
+    for year in _YEAR.findall(question):
+        if int(year) >= current_year - 1:
+            return f"год {year}"
+    return None
+
+
+class ChatRouter:
+    """Решает, какой моделью и с какими инструментами отвечать на запрос."""
+
+    def __init__(self, default_model: str, fast_model: Optional[str] = None, web_search_enabled: bool = False,
+                 short_question_chars: int = 120, log_path: Optional[str] = None) -> None:
+        self.default_model = default_model
+        self.fast_model = fast_model or default_model
+        self.web_search_enabled = web_search_enabled
+        self.short_question_chars = short_question_chars
+        self.log_path = log_path
+        self._log_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict, default_model: str, web_search_enabled: bool) -> "ChatRouter":
+        return cls(
+            default_model=default_model,
+            fast_model=cfg.get("fast_model"),
+            web_search_enabled=web_search_enabled,
+            short_question_chars=int(cfg.get("short_question_chars", 120)),
+            log_path=cfg.get("log_path"),
+        )
+
+    def route(self, question: str, kind: Optional[str] = None, model: Optional[str] = None,
+              web_search: Optional[bool] = None) -> RouteDecision:
+        """kind, model и web_search из запроса имеют приоритет над автоматическим выбором."""
+        if kind not in ROUTE_KINDS:
+            kind = infer_kind(question)
+
+        if kind in ("format", "summary"):
+            # Текст уже есть целиком в промпте: поиск не нужен, достаточно быстрой модели
+            decision = RouteDecision(kind, self.fast_model, False, "служебный запрос")
+        else:
+            fresh = needs_fresh_data(question) if self.web_search_enabled else None
+            if fresh:
+                decision = RouteDecision(kind, self.default_model, True, f"нужны свежие данные: {fresh}")
+            elif len(question) <= self.short_question_chars:
+                decision = RouteDecision(kind, self.fast_model, False, "короткий вопрос")
+            else:
+                decision = RouteDecision(kind, self.default_model, False, "вопрос без свежих данных")
+
+        if model:
+            decision.model = model
+            decision.reason += ", модель задана в запросе"
+        if web_search is not None:
+            decision.web_search = bool(web_search)
+            decision.reason += ", веб-поиск задан в запросе"
+        return decision
+
+    def record(self, decision: RouteDecision, question: str, latency_ms: float, ok: bool) -> None:
+        """Логирует решение и итоговую задержку, чтобы по логу можно было подстроить политику."""
+        print(f"[Router] {decision.kind}: {decision.model}, web_search={decision.web_search} "
+              f"({decision.reason}) -> {latency_ms:.0f} мс{'' if ok else ', ошибка'}")
+        if not self.log_path:
+            return
+        entry = {
+            "ts": time.time(),
+            **asdict(decision),
+            "question_chars": len(question),
+            "latency_ms": round(latency_ms, 1),
+            "ok": ok,
+        }
+        try:
+            with self._log_lock:
+                with open(self.log_path, "a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"[Router] Не удалось записать лог в {self.log_path}: {e}")
@@ -0,0 +1,161 @@
+"""Многоходовые чат-сессии поверх OpenAI Responses API.
+
+Контекст хранится на стороне OpenAI: каждый следующий запрос ссылается на previous_response_id
+и содержит только новый вопрос. Локально держится окно последних реплик под бюджет токенов,
+чтобы восстановить контекст, если цепочка оборвалась или стала слишком длинной.
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~3 символа на токен для смеси русского и английского)."""
+    return max(1, len(text) // 3)
+
+
+@dataclass
+class ChatTurn:
+    role: str
+    content: str
+    tokens: int = 0
+
+    def __post_init__(self) -> None:
+        if not self.tokens:
+            self.tokens = estimate_tokens(self.content)
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    # id последнего ответа в цепочке Responses API (None - цепочки нет, контекст шлём сами)
+    previous_response_id: Optional[str] = None
+    # Сколько токенов контекста уже накоплено в цепочке на стороне OpenAI
+    chain_tokens: int = 0
+    history: List[ChatTurn] = field(default_factory=list)
+    # Сжатое содержание реплик, вытесненных из окна
+    summary: str = ""
+    last_activity: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def reset_chain(self) -> None:
+        """Следующий запрос пойдёт без previous_response_id, с локальным окном истории."""
+        self.previous_response_id = None
+        self.chain_tokens = 0
+
+    def context_input(self, system_prompt: str) -> List[dict]:
+        """Полный контекст для запроса без цепочки: системный промпт, сводка и окно реплик."""
+        messages = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Краткое содержание начала разговора: {self.summary}"})
+        messages.extend({"role": turn.role, "content": turn.content} for turn in self.history)
+        return messages
+
+    def record_exchange(self, question: str, answer: str, response_id: Optional[str],
+                        chain_tokens: int, token_budget: int) -> None:
+        self.history.append(ChatTurn("user", question))
+        self.history.append(ChatTurn("assistant", answer))
+        self.previous_response_id = response_id
+        self.chain_tokens = chain_tokens
+        trim_history(self, token_budget)
+        # Цепочка на стороне OpenAI растёт без ограничений: при превышении бюджета
+        # начинаем новую из локального окна (со сводкой вместо старых реплик)
+        if self.chain_tokens > token_budget:
+            print(f"[Chat] Сессия {self.session_id}: контекст {self.chain_tokens} токенов > {token_budget}, "
+                  f"начинаю новую цепочку")
+            self.reset_chain()
+
+
+# Сколько символов от каждой вытесненной реплики попадает в сводку
+SUMMARY_SNIPPET_CHARS = 200
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s")
+
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_SNIPPET_CHARS:
+        sentence = sentence[:SUMMARY_SNIPPET_CHARS].rstrip() + "…"
+    return sentence
+
+
+def trim_history(session: ChatSession, token_budget: int) -> None:
+    """Вытесняет старые реплики в сводку, пока окно не уложится в бюджет.
+
+    Сводка экстрактивная (первое предложение каждой реплики), без дополнительного запроса к модели.
+    Последний обмен вопрос-ответ всегда остаётся в окне.
+    """
+    def used() -> int:
+        return sum(turn.tokens for turn in session.history) + estimate_tokens(session.summary)
+
+    dropped: List[str] = []
+    while len(session.history) > 2 and used() > token_budget:
+        turn = session.history.pop(0)
+        prefix = "Пользователь" if turn.role == "user" else "Ассистент"
+        dropped.append(f"{prefix}: {_first_sentence(turn.content)}")
+    if dropped:
+        summary = " ".join(filter(None, [session.summary, *dropped]))
+        # Сводка не должна съедать больше четверти бюджета: отбрасываем самое старое
+        limit = max(1, token_budget // 4) * 3
+        if len(summary) > limit:
+            summary = "…" + summary[-limit:]
+        session.summary = summary
+
+
+class ChatSessionStore:
+    """LRU-хранилище сессий с удалением по простою."""
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 3600.0, token_budget: int = 4000) -> None:
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout = idle_timeout
+        self.token_budget = token_budget
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Префикс новых id (номер воркера в многопроцессном режиме)
+        self.id_prefix = ""
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "ChatSessionStore":
+        return cls(
+            max_sessions=int(cfg.get("max_sessions", 1000)),
+            idle_timeout=float(cfg.get("idle_timeout", 3600)),
+            token_budget=int(cfg.get("token_budget", 4000)),
+        )
+
+    def get_or_create(self, session_id: Optional[str]) -> Tuple[ChatSession, bool]:
+        """Возвращает (сессия, создана ли новая). Неизвестный или истёкший id - новая сессия."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id) if session_id else None
+            created = session is None
+            if created:
+                session = ChatSession(session_id=f"{self.id_prefix}{uuid.uuid4()}")
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session.session_id)
+            session.last_activity = now
+            return session, created
+
+    def discard(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict_expired(self, now: float) -> None:
+        # Сессии упорядочены по последней активности: истёкшие - в начале
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_activity <= self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
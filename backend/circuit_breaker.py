@@ -0,0 +1,176 @@
+"""Автоматы защиты (circuit breaker) для внешних провайдеров.
+
+Пока провайдер деградировал, каждый запрос держал поток до полного таймаута. Автомат
+считает ошибки и медленные ответы в скользящем окне и при превышении порогов размыкается:
+новые запросы отклоняются сразу. Через open_seconds пропускается пробный запрос
+(half-open), и по его исходу автомат замыкается или снова размыкается.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    """Сбой на стороне провайдера (5xx, 429, таймаут, обрыв соединения) - учитывается автоматом."""
+
+
+class ProviderTimeout(ProviderUnavailable):
+    """Провайдер не ответил за отведённое время."""
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлялся: автомат разомкнут."""
+
+    def __init__(self, name: str, retry_after: float) -> None:
+        super().__init__(f"{name}: автомат разомкнут, повтор через {retry_after:.0f} с")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: float = 15.0, slow_call_rate: float = 0.5,
+                 open_seconds: float = 30.0, half_open_calls: int = 1) -> None:
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        # (успех, медленный) последних вызовов
+        self._calls: deque = deque(maxlen=max(self.min_calls, window))
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def would_allow(self) -> bool:
+        """Пропустил бы автомат запрос сейчас (не занимая пробный слот)."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == CLOSED or (state == HALF_OPEN and self._trials < self.half_open_calls)
+
+    def allow(self) -> bool:
+        """Разрешает запрос. В half-open занимает один из пробных слотов."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            return False
+
+    def release_trial(self) -> None:
+        """Возвращает пробный слот вызова, исход которого не учитывается (отмена, дедлайн клиента).
+
+        Без этого half-open автомат остался бы с занятыми слотами и отклонял бы все запросы.
+        """
+        with self._lock:
+            if self._current_state(time.monotonic()) == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == HALF_OPEN:
+                if ok and not slow:
+                    self._transition(CLOSED, "пробный запрос успешен")
+                else:
+                    self._transition(OPEN, "пробный запрос неуспешен" if not ok else f"пробный запрос {elapsed:.1f} с")
+                return
+            if state == OPEN:
+                # Поздний результат запроса, начатого до размыкания
+                return
+            self._calls.append((ok, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(1 for call_ok, _ in self._calls if not call_ok) / len(self._calls)
+            slow_share = sum(1 for _, call_slow in self._calls if call_slow) / len(self._calls)
+            if failures >= self.failure_rate or slow_share >= self.slow_call_rate:
+                self._transition(OPEN, f"ошибок {failures:.0%}, медленных {slow_share:.0%} из {len(self._calls)}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            total = len(self._calls)
+            return {
+                "state": state,
+                "calls": total,
+                "failure_rate": round(sum(1 for ok, _ in self._calls if not ok) / total, 3) if total else 0.0,
+                "slow_rate": round(sum(1 for _, slow in self._calls if slow) / total, 3) if total else 0.0,
+                "retry_after": round(max(0.0, self._opened_at + self.open_seconds - time.monotonic()), 1)
+                if state == OPEN else 0.0,
+            }
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, "истёк интервал размыкания")
+        return self._state
+
+    def _transition(self, state: str, reason: str) -> None:
+        print(f"[Breaker] {self.name}: {self._state} -> {state} ({reason})")
+        self._state = state
+        self._trials = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state in (OPEN, CLOSED):
+            self._calls.clear()
+
+
+class BreakerRegistry:
+    """Автоматы по ключу провайдер:эндпоинт. Пороги общие, с переопределением по ключу."""
+
+    def __init__(self, defaults: Optional[dict] = None, overrides: Optional[Dict[str, dict]] = None) -> None:
+        self.defaults = defaults or {}
+        self.overrides = overrides or {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "BreakerRegistry":
+        cfg = dict(cfg)
+        overrides = cfg.pop("endpoints", None) or {}
+        return cls(defaults=cfg, overrides=overrides)
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                settings = {**self.defaults, **(self.overrides.get(name) or {})}
+                breaker = CircuitBreaker(
+                    name,
+                    window=int(settings.get("window", 20)),
+                    min_calls=int(settings.get("min_calls", 5)),
+                    failure_rate=float(settings.get("failure_rate", 0.5)),
+                    slow_call_seconds=float(settings.get("slow_call_seconds", 15.0)),
+                    slow_call_rate=float(settings.get("slow_call_rate", 0.5)),
+                    open_seconds=float(settings.get("open_seconds", 30.0)),
+                    half_open_calls=int(settings.get("half_open_calls", 1)),
+                )
+                self._breakers[name] = breaker
+            return breaker
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,169 @@
+"""Диагностика работающего сервера: сэмплирующий профилировщик, дамп потоков, снимки памяти.
+
+Ничего не работает, пока не вызвано: профилировщик опрашивает sys._current_frames() только
+на время профилирования, tracemalloc включается первым запросом снимка и выключается явно.
+Результат профилирования - свёрнутые стеки (collapsed stacks) для flamegraph.pl и speedscope.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Метка HTTP-запроса, который обслуживает поток (заполняется, только когда диагностика включена)
+request_labels: Dict[int, str] = {}
+
+_JOB_THREAD_RE = re.compile(r"^(job|segment)-(.+)$")
+_DEFAULT_THREAD_RE = re.compile(r"^Thread-\d+ \((.+)\)$")
+_ID_SUFFIX_RE = re.compile(r"-[0-9a-fw][0-9a-f-]{7,}.*$")
+
+
+def thread_job(name: str) -> Optional[str]:
+    """Id задачи (или сессии) по имени потока job-<id> / segment-<id>-<номер>."""
+    match = _JOB_THREAD_RE.match(name)
+    return match.group(2) if match else None
+
+
+def thread_group(name: str) -> str:
+    """Имя потока без номеров и id: потоки одного вида сливаются в одну ветку графа."""
+    match = _DEFAULT_THREAD_RE.match(name)
+    if match:
+        return match.group(1)
+    return _ID_SUFFIX_RE.sub("", name)
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, root: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    # Свёрнутый формат: от корня к листу через ';', метки без ';' и пробелов по краям
+    return ";".join(label.replace(";", ",") for label in reversed(labels))
+
+
+class SamplingProfiler:
+    """Сэмплирует стеки всех потоков с заданным интервалом (время по стенным часам:
+    ожидающие потоки тоже видны - это и нужно, чтобы найти, где они блокируются)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float = 0.005,
+                include_idle: bool = True) -> Optional[dict]:
+        """Собирает стеки seconds секунд. None - профилирование уже идёт в другом запросе."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            stacks: Counter = Counter()
+            own = threading.get_ident()
+            samples = 0
+            started = time.monotonic()
+            deadline = started + seconds
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    if not include_idle and _is_idle(frame):
+                        continue
+                    stacks[collapse_stack(frame, thread_group(names.get(ident, str(ident))))] += 1
+                samples += 1
+                time.sleep(interval)
+            return {"stacks": stacks, "samples": samples, "elapsed": time.monotonic() - started}
+        finally:
+            self._lock.release()
+
+
+# Листовые функции, в которых поток ждёт, а не работает
+_IDLE_FUNCTIONS = {"wait", "wait_for", "select", "accept", "_wait_for_tstate_lock", "get", "sleep",
+                   "readinto", "recv_into", "poll", "serve_forever", "_worker_loop", "_next_due"}
+
+
+def _is_idle(frame) -> bool:
+    return frame.f_code.co_name in _IDLE_FUNCTIONS
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def thread_dump() -> List[dict]:
+    """Стеки всех потоков (от корня к листу) с задачей или запросом, которые они обслуживают."""
+    frames = sys._current_frames()
+    threads = []
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        stack = []
+        while frame is not None:
+            stack.append(f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}")
+            frame = frame.f_back
+        threads.append({
+            "name": thread.name,
+            "ident": thread.ident,
+            "daemon": thread.daemon,
+            "job": thread_job(thread.name),
+            "request": request_labels.get(thread.ident),
+            "stack": list(reversed(stack)),
+        })
+    return threads
+
+
+class AllocationTracker:
+    """Разница снимков tracemalloc между вызовами: что выросло с прошлого снимка."""
+
+    def __init__(self) -> None:
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> None:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+            self._baseline = self._take()
+
+    def stop(self) -> None:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+
+    def diff(self, top: int = 20, key_type: str = "lineno") -> dict:
+        """Топ-N мест по росту памяти с прошлого снимка; новый снимок становится базой."""
+        with self._lock:
+            snapshot = self._take()
+            baseline = self._baseline or snapshot
+            stats = snapshot.compare_to(baseline, key_type)
+            self._baseline = snapshot
+            current, peak = tracemalloc.get_traced_memory()
+            return {
+                "traced_current": current,
+                "traced_peak": peak,
+                "top": [{
+                    "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size": stat.size,
+                    "size_diff": stat.size_diff,
+                    "count": stat.count,
+                    "count_diff": stat.count_diff,
+                } for stat in stats[:max(1, top)]],
+            }
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
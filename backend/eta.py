@@ -0,0 +1,91 @@
+"""Оценка времени завершения задач транскрибации для подсказок клиентам, когда опрашивать."""
+
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+
+class CompletionEstimator:
+    """Скользящая линейная модель: время обработки = a + b * длительность аудио + c * задач в работе.
+
+    Коэффициенты пересчитываются методом наименьших квадратов по последним window задачам.
+    Пока наблюдений меньше min_samples, используется априорная оценка.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 8,
+                 prior_base: float = 1.0, prior_per_audio_second: float = 0.1,
+                 min_eta: float = 0.2) -> None:
+        self.min_samples = max(3, min_samples)
+        self.prior = (prior_base, prior_per_audio_second, 0.0)
+        self.min_eta = min_eta
+        # (длительность аудио, задач в работе, фактическое время обработки)
+        self._samples: deque = deque(maxlen=max(self.min_samples, window))
+        self._coefficients: Tuple[float, float, float] = self.prior
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "CompletionEstimator":
+        return cls(
+            window=int(cfg.get("window", 200)),
+            min_samples=int(cfg.get("min_samples", 8)),
+            prior_base=float(cfg.get("prior_base", 1.0)),
+            prior_per_audio_second=float(cfg.get("prior_per_audio_second", 0.1)),
+        )
+
+    def observe(self, duration: float, in_flight: int, elapsed: float) -> None:
+        """Добавляет фактическое время обработки завершённой задачи."""
+        with self._lock:
+            self._samples.append((duration, float(in_flight), elapsed))
+            if len(self._samples) >= self.min_samples:
+                fitted = _least_squares(list(self._samples))
+                if fitted is not None:
+                    self._coefficients = fitted
+
+    def estimate(self, duration: Optional[float], in_flight: int) -> float:
+        """Ожидаемое время обработки в секундах. Неизвестная длительность - средняя по окну."""
+        with self._lock:
+            a, b, c = self._coefficients
+            if duration is None:
+                duration = (sum(s[0] for s in self._samples) / len(self._samples)) if self._samples else 0.0
+        return max(self.min_eta, a + b * duration + c * in_flight)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            a, b, c = self._coefficients
+            return {
+                "samples": len(self._samples),
+                "base": round(a, 4),
+                "per_audio_second": round(b, 4),
+                "per_job_in_flight": round(c, 4),
+            }
+
+
+def _least_squares(samples: List[Tuple[float, float, float]]) -> Optional[Tuple[float, float, float]]:
+    """Решает нормальные уравнения (X^T X + λI) β = X^T y для признаков [1, длительность, в работе].
+
+    Небольшая регуляризация λ нужна, когда признак не меняется (например, всегда одна задача в работе).
+    """
+    xtx = [[0.0] * 3 for _ in range(3)]
+    xty = [0.0] * 3
+    for duration, in_flight, elapsed in samples:
+        row = (1.0, duration, in_flight)
+        for i in range(3):
+            xty[i] += row[i] * elapsed
+            for j in range(3):
+                xtx[i][j] += row[i] * row[j]
+    for i in range(3):
+        xtx[i][i] += 1e-3
+
+    # Метод Гаусса с выбором главного элемента
+    matrix = [xtx[i] + [xty[i]] for i in range(3)]
+    for col in range(3):
+        pivot = max(range(col, 3), key=lambda r: abs(matrix[r][col]))
+        if abs(matrix[pivot][col]) < 1e-12:
+            return None
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        for r in range(3):
+            if r != col:
+                factor = matrix[r][col] / matrix[col][col]
+                for k in range(col, 4):
+                    matrix[r][k] -= factor * matrix[col][k]
+    return tuple(matrix[i][3] / matrix[i][i] for i in range(3))
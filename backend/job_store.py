@@ -0,0 +1,152 @@
+"""Задачи транскрибации в памяти: компактная запись и ограниченный индекс завершённых.
+
+Задача живёт в jobs, пока клиент не заберёт результат. Чтобы миллион незабранных задач
+не стоил гигабайты, запись хранит поля в __slots__ (без __dict__ на каждый объект), статус -
+общими членами перечисления, а длинный текст - сжатым zlib. Завершённые задачи, которые
+никто не забрал (бот не дождался, клиент упал), FinishedJobIndex снимает по возрасту
+и по общему числу задач.
+"""
+
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from enum import Enum
+from typing import List, Optional, Sequence
+
+from audio_probe import AudioInfo
+from tenants import ClientPolicy
+from tracing import JobTrace
+
+# Тексты длиннее этого (символов) хранятся сжатыми
+TEXT_COMPRESS_THRESHOLD = 256
+
+
+class JobStatus(str, Enum):
+    """Статус задачи. Сравнивается и сериализуется в JSON как обычная строка."""
+
+    PROCESSING = "processing"
+    READY = "ready"
+    ERROR = "error"
+    CANCELLED = "cancelled"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class TranscriptionJob:
+    __slots__ = (
+        "audio_path", "transcription_path", "_status", "_text", "trace", "batch_id", "callback_url",
+        "callback_secret", "deadline", "cancelled", "segment_paths", "audio_info", "expected_done",
+        "in_flight_at_start", "source", "created_at", "client",
+    )
+
+    def __init__(self, audio_path: str, transcription_path: str, status: str = JobStatus.PROCESSING,
+                 transcription_text: Optional[str] = None, trace: Optional[JobTrace] = None,
+                 batch_id: Optional[str] = None, callback_url: Optional[str] = None,
+                 callback_secret: Optional[str] = None, deadline: Optional[float] = None,
+                 cancelled: bool = False, segment_paths: Sequence[str] = (),
+                 audio_info: Optional[AudioInfo] = None, expected_done: Optional[float] = None,
+                 in_flight_at_start: int = 0, source: str = "api", created_at: Optional[float] = None,
+                 client: Optional[ClientPolicy] = None) -> None:
+        self.audio_path = audio_path
+        self.transcription_path = transcription_path
+        self.status = status
+        self.transcription_text = transcription_text
+        self.trace = trace if trace is not None else JobTrace()
+        self.batch_id = batch_id
+        self.callback_url = callback_url
+        self.callback_secret = callback_secret
+        # Дедлайн клиента (time.monotonic); после него задача считается брошенной
+        self.deadline = deadline
+        self.cancelled = cancelled
+        # Сегменты потоковой загрузки (/api/session), если задача собрана из них; () - общий пустой кортеж
+        self.segment_paths = tuple(segment_paths)
+        # Формат, кодек и длительность по заголовкам файла (None, если не распознаны)
+        self.audio_info = audio_info
+        # Ожидаемое время готовности (time.monotonic) и число задач в работе на момент постановки
+        self.expected_done = expected_done
+        self.in_flight_at_start = in_flight_at_start
+        # Откуда пришла запись (поле source: api, telegram, batch, session...) и когда - для архива;
+        # источников единицы, поэтому строка интернируется
+        self.source = sys.intern(source)
+        self.created_at = created_at if created_at is not None else time.time()
+        # Клиент API: его вес и квоты в очереди к провайдеру
+        self.client = client
+
+    @property
+    def status(self) -> JobStatus:
+        return self._status
+
+    @status.setter
+    def status(self, value: str) -> None:
+        self._status = JobStatus(value)
+
+    @property
+    def transcription_text(self) -> Optional[str]:
+        if isinstance(self._text, bytes):
+            return zlib.decompress(self._text).decode("utf-8")
+        return self._text
+
+    @transcription_text.setter
+    def transcription_text(self, value: Optional[str]) -> None:
+        if value is not None and len(value) > TEXT_COMPRESS_THRESHOLD:
+            self._text = zlib.compress(value.encode("utf-8"), 6)
+        else:
+            self._text = value
+
+    def remaining(self) -> Optional[float]:
+        """Сколько секунд осталось до дедлайна клиента (None - дедлайна нет)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+
+class FinishedJobIndex:
+    """Завершённые, но не забранные задачи в порядке завершения.
+
+    Задача снимается, когда её результат пролежал дольше ttl или когда задач в памяти
+    больше limit (сначала самые старые). Незавершённые задачи сюда не попадают и не вытесняются.
+    """
+
+    def __init__(self, ttl: Optional[float] = 3600.0, limit: Optional[int] = 10000) -> None:
+        self.ttl = ttl
+        self.limit = limit
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "FinishedJobIndex":
+        ttl = cfg.get("result_ttl", 3600)
+        limit = cfg.get("max_jobs", 10000)
+        return cls(ttl=float(ttl) if ttl else None, limit=int(limit) if limit else None)
+
+    def add(self, job_id: str) -> None:
+        with self._lock:
+            self._finished.pop(job_id, None)
+            self._finished[job_id] = time.monotonic()
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._finished.pop(job_id, None)
+
+    def __len__(self) -> int:
+        return len(self._finished)
+
+    def evictable(self, total_jobs: int) -> List[str]:
+        """Id задач, которые пора снять: просроченные и самые старые сверх limit.
+
+        Индекс упорядочен по завершению, поэтому проверяется только его начало."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            while self._finished:
+                job_id, finished_at = next(iter(self._finished.items()))
+                expired = self.ttl is not None and now - finished_at > self.ttl
+                overflow = self.limit is not None and total_jobs - len(evicted) > self.limit
+                if not (expired or overflow):
+                    break
+                self._finished.popitem(last=False)
+                evicted.append(job_id)
+        return evicted
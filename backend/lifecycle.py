@@ -0,0 +1,254 @@
+"""Плавная остановка сервера и перезапуск без простоя.
+
+SIGTERM: новые задачи больше не принимаются (503 с Retry-After), текущие доделываются
+не дольше drain_timeout, а всё незавершённое - задачи, результаты, которые ещё не забрали,
+сессии загрузки, необработанные обновления Telegram - сохраняется в контрольную точку.
+Следующий запуск подхватывает её и продолжает работу.
+
+SIGUSR2: передача слушающего сокета. Процесс сохраняет состояние, запускает преемника
+с унаследованным дескриптором сокета и перестаёт принимать соединения. Соединения,
+пришедшие за это время, ждут в очереди ядра, поэтому клиенты не получают отказов.
+Запущенные вызовы провайдера старый процесс доводит до конца и передаёт результаты
+преемнику второй, окончательной контрольной точкой.
+"""
+
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional
+
+from werkzeug.serving import WSGIRequestHandler
+
+# Дескриптор слушающего сокета, унаследованный от предшественника
+LISTEN_FD_ENV = "PUSHTOTYPE_LISTEN_FD"
+# Канал, в который преемник пишет байт, когда начал принимать соединения
+READY_FD_ENV = "PUSHTOTYPE_READY_FD"
+# pid процесса, который передал сокет
+PREDECESSOR_ENV = "PUSHTOTYPE_PREDECESSOR_PID"
+
+CHECKPOINT_VERSION = 1
+
+
+def write_checkpoint(path: str, state: dict) -> None:
+    """Атомарно записывает контрольную точку: читатель видит старый файл или новый целиком."""
+    state = {"version": CHECKPOINT_VERSION, "pid": os.getpid(), "written_at": time.time(), **state}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump(state, handle, ensure_ascii=False)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_checkpoint(path: str) -> Optional[dict]:
+    """Контрольная точка или None, если её нет или она другой версии."""
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            state = json.load(handle)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"[Lifecycle] Не удалось прочитать контрольную точку {path}: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != CHECKPOINT_VERSION:
+        print(f"[Lifecycle] Контрольная точка {path} несовместимой версии, пропускаю")
+        return None
+    return state
+
+
+def remove_checkpoint(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def inherited_listen_socket() -> Optional[socket.socket]:
+    """Слушающий сокет, переданный предшественником (None - обычный запуск)."""
+    raw = os.environ.pop(LISTEN_FD_ENV, None)
+    if not raw:
+        return None
+    return socket.socket(fileno=int(raw))
+
+
+def predecessor_pid() -> Optional[int]:
+    raw = os.environ.get(PREDECESSOR_ENV)
+    return int(raw) if raw else None
+
+
+def predecessor_alive(pid: int) -> bool:
+    """Предшественник - родитель преемника: после его выхода процесс переподчиняется."""
+    return os.getppid() == pid
+
+
+def notify_ready() -> None:
+    """Сообщает предшественнику, что сервер начал принимать соединения."""
+    raw = os.environ.pop(READY_FD_ENV, None)
+    if not raw:
+        return
+    try:
+        os.write(int(raw), b"1")
+        os.close(int(raw))
+    except OSError as e:
+        print(f"[Lifecycle] Не удалось сообщить предшественнику о готовности: {e}")
+
+
+class Successor:
+    """Новый процесс сервера с тем же слушающим сокетом."""
+
+    def __init__(self, process: subprocess.Popen, ready_fd: int) -> None:
+        self.process = process
+        self._ready_fd = ready_fd
+
+    @classmethod
+    def spawn(cls, listen_socket: socket.socket) -> "Successor":
+        """Запускает ту же команду, что и текущий процесс, передавая ему сокет."""
+        ready_read, ready_write = os.pipe()
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(listen_socket.fileno())
+        env[READY_FD_ENV] = str(ready_write)
+        env[PREDECESSOR_ENV] = str(os.getpid())
+        try:
+            process = subprocess.Popen([sys.executable, *sys.argv], env=env,
+                                       pass_fds=(listen_socket.fileno(), ready_write))
+        finally:
+            os.close(ready_write)
+        return cls(process, ready_read)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Ждёт сигнала готовности. False - преемник упал или не успел запуститься."""
+        try:
+            readable, _, _ = select.select([self._ready_fd], [], [], timeout)
+            return bool(readable) and os.read(self._ready_fd, 1) == b"1"
+        finally:
+            os.close(self._ready_fd)
+
+    def kill(self) -> None:
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class RequestGauge:
+    """Число HTTP-запросов в обработке. Изменяющие состояние задач считаются отдельно:
+    их нужно дождаться перед снимком состояния."""
+
+    def __init__(self) -> None:
+        self._active = 0
+        self._mutating = 0
+        self._cond = threading.Condition()
+
+    def enter(self, mutating: bool) -> None:
+        with self._cond:
+            self._active += 1
+            if mutating:
+                self._mutating += 1
+
+    def exit(self, mutating: bool) -> None:
+        with self._cond:
+            self._active -= 1
+            if mutating:
+                self._mutating -= 1
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout: float, mutating_only: bool = False) -> bool:
+        """Ждёт, пока запросы (или только изменяющие) закончатся. False - не дождались."""
+        with self._cond:
+            if mutating_only:
+                return self._cond.wait_for(lambda: self._mutating == 0, max(0.0, timeout))
+            return self._cond.wait_for(lambda: self._active == 0, max(0.0, timeout))
+
+
+class ConnectionTracker:
+    """Открытые HTTP-соединения сервера.
+
+    После остановки приёма процесс не должен выходить с открытыми keep-alive соединениями:
+    запрос, отправленный клиентом по такому соединению, оборвался бы вместе с процессом.
+    close_idle() закрывает простаивающие соединения, а занятые закрываются после ответа
+    (Connection: close) - клиенты переподключаются к новому процессу.
+    """
+
+    # Сколько ждать первого запроса на соединении, принятом перед остановкой приёма, с
+    FIRST_REQUEST_GRACE = 1.0
+
+    def __init__(self) -> None:
+        self._open = 0
+        self._closing = False
+        self._cond = threading.Condition()
+        # Канал пробуждения: после close_idle() он всегда читаем
+        self._wake_read, self._wake_write = os.pipe()
+
+    @property
+    def open(self) -> int:
+        with self._cond:
+            return self._open
+
+    def opened(self) -> None:
+        with self._cond:
+            self._open += 1
+
+    def closed(self) -> None:
+        with self._cond:
+            self._open -= 1
+            self._cond.notify_all()
+
+    def close_idle(self) -> None:
+        """Больше не читать новые запросы с простаивающих соединений."""
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+        os.write(self._wake_write, b"1")
+
+    def wait_for_request(self, sock: socket.socket, first: bool) -> bool:
+        """Ждёт начала следующего запроса на соединении. False - соединение пора закрыть."""
+        readable, _, _ = select.select([sock, self._wake_read], [], [])
+        if sock in readable:
+            return True
+        if first:
+            # Клиент только что подключился и вот-вот отправит запрос
+            readable, _, _ = select.select([sock], [], [], self.FIRST_REQUEST_GRACE)
+            return bool(readable)
+        return False
+
+    def wait_closed(self, timeout: float) -> bool:
+        """Ждёт закрытия всех соединений. False - не дождались."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._open == 0, max(0.0, timeout))
+
+    def request_handler(self) -> type:
+        """Класс обработчика для make_server(request_handler=...), привязанный к этому трекеру."""
+        return type("DrainingRequestHandler", (DrainingRequestHandler,), {"tracker": self})
+
+
+class DrainingRequestHandler(WSGIRequestHandler):
+    """Обработчик werkzeug, учитывающий соединение в ConnectionTracker."""
+
+    tracker: ConnectionTracker
+
+    def setup(self) -> None:
+        super().setup()
+        self.requests_served = 0
+        self.tracker.opened()
+
+    def finish(self) -> None:
+        try:
+            super().finish()
+        finally:
+            self.tracker.closed()
+
+    def handle_one_request(self) -> None:
+        if not self.tracker.wait_for_request(self.connection, first=self.requests_served == 0):
+            self.close_connection = True
+            return
+        self.requests_served += 1
+        super().handle_one_request()
@@ -0,0 +1,153 @@
+"""Локальное форматирование коротких транскрипций без обращения к LLM.
+
+Whisper обычно уже расставляет пунктуацию; для коротких и хорошо размеченных текстов
+достаточно убрать слова-паразиты, поправить регистр и пробелы и разбить текст на абзацы.
+Длинные тексты со сплошными участками без знаков препинания по-прежнему уходят в LLM.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List
+
+
+# Звуки-заминки: удаляются везде, где стоят отдельным словом. Одиночное «м» - это метры,
+# поэтому только «мм+»; после числа не удаляется ничего («5 мм», «3 м»)
+_HESITATIONS = r"э+|э+м+|мм+|хм+|а+эм|uh+|um+|erm+|hmm+|ah+"
+# Слова-паразиты, которые удаляются только как вводные: в начале предложения или между запятыми
+_FILLERS = r"ну|короче|в общем|в общем-то|это самое|так сказать"
+# Многозначные слова: в начале предложения считаются паразитами, только если за ними запятая
+# («I mean it» и «типа того» - часть смысла)
+_COMMA_FILLERS = (r"как бы|собственно|значит|слушай|типа|so|well|like|actually|kind of|sort of|"
+                  r"you know|i mean|basically")
+_ALL_FILLERS = f"{_FILLERS}|{_COMMA_FILLERS}"
+
+_HESITATION_RE = re.compile(rf"(?<![\w-])(?<!\d\s)(?:{_HESITATIONS})(?![\w-])[,.…]*\s*", re.IGNORECASE)
+# «Ну, короче, мы решили» -> «мы решили» (паразиты подряд в начале предложения)
+_LEADING_FILLER_RE = re.compile(
+    rf"(^|[.!?…]\s+)(?:(?:{_FILLERS}),?\s+|(?:{_COMMA_FILLERS}),\s+)+", re.IGNORECASE
+)
+# «мы, короче, решили» -> «мы решили»
+_INNER_FILLER_RE = re.compile(rf",\s*(?:{_ALL_FILLERS})\s*,\s*", re.IGNORECASE)
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+# Сокращения, после которых точка не заканчивает предложение (плюс однобуквенные: инициалы, «т. е.»)
+_ABBREVIATIONS = frozenset((
+    "e.g.", "i.e.", "etc.", "vs.", "cf.", "mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "no.", "approx.",
+    "т.е.", "т.к.", "т.д.", "т.п.", "т.н.", "др.", "пр.", "см.", "напр.", "гг.", "ул.", "стр.", "рис.",
+    "им.", "проф.", "тыс.", "млн.", "млрд.", "руб.", "коп.",
+))
+_SINGLE_LETTER_RE = re.compile(r"[^\W\d_]\.")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+([,.!?…:;])")
+_REPEATED_PUNCT_RE = re.compile(r"([,;:!?])\1+|,(?=[.!?…])")
+# Отдельное «i», но не «i» из «i.e.»
+_ENGLISH_I_RE = re.compile(r"(?<![\w.])i\b(?!\.\w)")
+_WORD_RE = re.compile(r"[\w'-]+")
+# Участки без знаков препинания: слова между соседними знаками
+_RUN_SPLIT_RE = re.compile(r"[,.!?…:;—()]")
+# Предложения, которые обычно начинают новую мысль
+_PARAGRAPH_STARTERS = re.compile(
+    r"^(во-первых|во-вторых|в-третьих|во-четв|первое|второе|третье|следующ|дальше|далее|также|кроме того|"
+    r"итак|в итоге|важно|теперь|first|second|third|next|also|finally|anyway|important)",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class FormattingPolicy:
+    """Когда текст можно отформатировать локально, а когда нужен LLM."""
+    # Длиннее этого (в словах) - всегда LLM
+    local_max_words: int = 250
+    # Самый длинный участок без знаков препинания; длиннее - текст не размечен, нужен LLM
+    max_unpunctuated_words: int = 20
+    # Порог сложности: 1.0 - ровно на границе одного из лимитов
+    llm_threshold: float = 1.0
+    # Желаемая длина абзаца в символах
+    paragraph_chars: int = 400
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "FormattingPolicy":
+        return cls(
+            local_max_words=int(cfg.get("local_max_words", 250)),
+            max_unpunctuated_words=int(cfg.get("max_unpunctuated_words", 20)),
+            llm_threshold=float(cfg.get("llm_threshold", 1.0)),
+            paragraph_chars=int(cfg.get("paragraph_chars", 400)),
+        )
+
+    def complexity(self, text: str) -> float:
+        """Насколько текст выходит за пределы локального форматирования (больше 1 - выходит)."""
+        words = len(_WORD_RE.findall(text))
+        longest_run = max((len(_WORD_RE.findall(run)) for run in _RUN_SPLIT_RE.split(text)), default=0)
+        return max(words / max(1, self.local_max_words), longest_run / max(1, self.max_unpunctuated_words))
+
+    def needs_llm(self, text: str) -> bool:
+        return self.complexity(text) > self.llm_threshold
+
+
+def remove_fillers(text: str) -> str:
+    text = _HESITATION_RE.sub("", text)
+    text = _LEADING_FILLER_RE.sub(lambda m: m.group(1), text)
+    text = _INNER_FILLER_RE.sub(" ", text)
+    return text
+
+
+def _is_abbreviation(chunk: str) -> bool:
+    words = chunk.split()
+    if not words:
+        return False
+    last = words[-1].lstrip("([\"'«").lower()
+    return last in _ABBREVIATIONS or bool(_SINGLE_LETTER_RE.fullmatch(last))
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    start = 0
+    for match in _SENTENCE_SPLIT_RE.finditer(text):
+        if _is_abbreviation(text[start:match.start()]):
+            continue
+        sentences.append(text[start:match.start()])
+        start = match.end()
+    sentences.append(text[start:])
+    return [s for s in sentences if s]
+
+
+def _capitalize(sentence: str) -> str:
+    for i, ch in enumerate(sentence):
+        if ch.isalpha():
+            return sentence[:i] + ch.upper() + sentence[i + 1:]
+    return sentence
+
+
+def _normalize_sentence(sentence: str) -> str:
+    sentence = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", sentence.strip(" ,;:"))
+    sentence = _REPEATED_PUNCT_RE.sub(lambda m: m.group(1) or "", sentence)
+    if re.search(r"[a-zA-Z]", sentence):
+        sentence = _ENGLISH_I_RE.sub("I", sentence)
+    sentence = _capitalize(sentence)
+    if sentence and sentence[-1] not in ".!?…":
+        sentence += "."
+    return sentence
+
+
+def group_paragraphs(sentences: List[str], paragraph_chars: int) -> List[str]:
+    """Собирает предложения в абзацы около paragraph_chars, начиная новый на словах-связках."""
+    paragraphs: List[List[str]] = []
+    size = 0
+    for sentence in sentences:
+        starts_new = bool(_PARAGRAPH_STARTERS.match(sentence)) and size >= paragraph_chars // 3
+        if not paragraphs or size >= paragraph_chars or starts_new:
+            paragraphs.append([])
+            size = 0
+        paragraphs[-1].append(sentence)
+        size += len(sentence) + 1
+    return [" ".join(p) for p in paragraphs]
+
+
+def format_locally(text: str, policy: FormattingPolicy = FormattingPolicy()) -> str:
+    """Убирает паразиты, нормализует пунктуацию и регистр, разбивает на абзацы."""
+    text = " ".join(text.split())
+    cleaned = remove_fillers(text)
+    sentences = [s for s in (_normalize_sentence(s) for s in split_sentences(cleaned)) if s.strip(".!?… ")]
+    if not sentences:
+        # Текст целиком из паразитов - лучше вернуть как есть, чем пустоту
+        return text
+    return "\n\n".join(group_paragraphs(sentences, policy.paragraph_chars))
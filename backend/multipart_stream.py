@@ -0,0 +1,132 @@
+"""Потоковое тело multipart/form-data для загрузки аудио провайдерам.
+
+requests с files={...} собирает всё тело в памяти: на каждую одновременную загрузку
+приходится лишняя копия файла. MultipartStream заранее считает Content-Length и отдаёт
+тело кусками по chunk_size, читая файл по мере того, как сокет принимает данные, -
+пиковая память на загрузку не зависит от размера файла.
+"""
+
+import os
+import uuid
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# (имя поля, имя файла, путь или открытый бинарный файл, MIME-тип)
+FilePart = Tuple[str, str, Union[str, IO[bytes]], str]
+
+
+class UploadCancelled(Exception):
+    """Отправка тела прервана: cancelled() вернул True (задачу отменили во время загрузки)."""
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\r", " ").replace("\n", " ")
+
+
+def _remaining_size(handle: IO[bytes]) -> int:
+    """Сколько байт осталось от текущей позиции до конца файла."""
+    position = handle.tell()
+    end = handle.seek(0, os.SEEK_END)
+    handle.seek(position)
+    return end - position
+
+
+class MultipartStream:
+    """Тело запроса с известной длиной; передаётся в requests как data=.
+
+    requests видит итерируемый объект с __len__ и ставит Content-Length вместо chunked;
+    urllib3 вычитывает его через read() блоками. Файлы, переданные путём, открываются
+    при отправке и закрываются в close(); переданные объектом - читаются с текущей позиции.
+    cancelled проверяется перед каждым куском: после отмены read() бросает UploadCancelled,
+    и requests обрывает запрос, не досылая тело.
+    """
+
+    def __init__(self, fields: Optional[Dict[str, str]] = None, files: Optional[List[FilePart]] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, boundary: Optional[str] = None,
+                 cancelled: Optional[Callable[[], bool]] = None) -> None:
+        self.boundary = boundary or uuid.uuid4().hex
+        self.cancelled = cancelled
+        self.chunk_size = max(1024, chunk_size)
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        # Части тела: заголовки - байтами, файлы - открытыми дескрипторами
+        self._parts: List[Union[bytes, IO[bytes]]] = []
+        self._owned: List[IO[bytes]] = []
+        self._length = 0
+        for name, value in (fields or {}).items():
+            self._add_bytes(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+                f"{value}\r\n".encode("utf-8")
+            )
+        for name, filename, source, content_type in files or []:
+            if isinstance(source, str):
+                handle = open(source, "rb")
+                self._owned.append(handle)
+            else:
+                handle = source
+            self._add_bytes(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"; '
+                f'filename="{_quote(filename)}"\r\nContent-Type: {content_type}\r\n\r\n'.encode("utf-8")
+            )
+            self._parts.append(handle)
+            self._length += _remaining_size(handle)
+            self._add_bytes(b"\r\n")
+        self._add_bytes(f"--{self.boundary}--\r\n".encode("utf-8"))
+        self._current = 0
+        self._pending = b""
+
+    def _add_bytes(self, data: bytes) -> None:
+        # Соседние заголовки склеиваются, чтобы не отдавать крошечные куски
+        if self._parts and isinstance(self._parts[-1], bytes):
+            self._parts[-1] += data
+        else:
+            self._parts.append(data)
+        self._length += len(data)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": self.content_type, "Content-Length": str(self._length)}
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        """Следующий кусок тела не длиннее size (или chunk_size); b"" - тело закончилось."""
+        if size is None or size < 0:
+            size = self.chunk_size
+        if self.cancelled is not None and self.cancelled():
+            self.close()
+            raise UploadCancelled("загрузка отменена")
+        while not self._pending and self._current < len(self._parts):
+            part = self._parts[self._current]
+            if isinstance(part, bytes):
+                self._pending = part
+                self._current += 1
+            else:
+                chunk = part.read(self.chunk_size)
+                if chunk:
+                    self._pending = chunk
+                else:
+                    self._current += 1
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        if not chunk:
+            self.close()
+        return chunk
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        for handle in self._owned:
+            handle.close()
+        self._owned = []
+
+    def __enter__(self) -> "MultipartStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,696 @@
+#!/usr/bin/env python3
+"""Задержка и пропускная способность провайдеров транскрибации
+
+Использование:
+    python provider_probe.py                                 # OpenAI, ключ из config.json
+    python provider_probe.py --provider assemblyai --key KEY
+    python provider_probe.py --sizes 5 30 120 --concurrency 1 2 4 8 16
+    python provider_probe.py --canary 0 --interval 60        # канарейка: бесконечно, раз в минуту
+    python provider_probe.py --stub                          # без сети, против локальной заглушки
+
+Измеряет:
+- подключение: DNS, TCP, TLS, время до первого байта ответа (TTFB) и полное время запроса;
+- загрузку записей нескольких длительностей: скорость отправки, обработку у провайдера
+  и коэффициент реального времени (RTF = время обработки / длительность записи);
+- масштабирование по параллельности: задержка и запросы в секунду на каждом уровне,
+  пока провайдер не начнёт отвечать 429.
+
+Результаты пишутся спанами OTLP/JSON, как таймлайны задач сервера: в tracing.export_path
+и/или tracing.otlp_endpoint из config.json (или --export / --otlp). --stub поднимает
+локальную заглушку с API OpenAI и AssemblyAI, настраиваемым RTF, лимитом параллельности
+и скоростью приёма - так проверяется сама утилита.
+"""
+
+import argparse
+import fcntl
+import http.client
+import json
+import math
+import os
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import termios
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from multipart_stream import MultipartStream
+from tracing import SpanExporter
+
+CONFIG_PATH = os.environ.get("PUSHTOTYPE_CONFIG") or os.path.join(os.path.dirname(__file__), "..", "config.json")
+
+# Записи для проб: 16 кГц, моно, 16 бит
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+
+# Байт в очереди отправки сокета, ещё не подтверждённых получателем (есть только в Linux)
+TIOCOUTQ = getattr(termios, "TIOCOUTQ", None) if sys.platform.startswith("linux") else None
+
+PROVIDERS = {
+    "openai": "https://api.openai.com",
+    "assemblyai": "https://api.assemblyai.com",
+}
+
+
+def load_config() -> dict:
+    try:
+        with open(CONFIG_PATH, "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_wav(path: str, seconds: float) -> None:
+    """Тон 400 Гц низкой громкости: период ровно 40 сэмплов, файл собирается повторением."""
+    period = b"".join(int(3000 * math.sin(2 * math.pi * i / 40)).to_bytes(2, "little", signed=True) for i in range(40))
+    frames = int(seconds * SAMPLE_RATE)
+    with wave.open(path, "wb") as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(SAMPLE_RATE)
+        handle.writeframes(period * (frames // 40) + period[:(frames % 40) * 2])
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * share) - 1)] if ordered else 0.0
+
+
+@dataclass
+class ConnectionTimings:
+    dns_ms: float = 0.0
+    tcp_ms: float = 0.0
+    # None - соединение без TLS (заглушка)
+    tls_ms: Optional[float] = None
+    ttfb_ms: float = 0.0
+    total_ms: float = 0.0
+    status: int = 0
+    started_at: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class TranscriptionSample:
+    audio_seconds: float
+    size: int
+    status: int = 0
+    # Отправка тела, ожидание результата после неё и всё вместе, с
+    upload_s: float = 0.0
+    processing_s: float = 0.0
+    total_s: float = 0.0
+    started_at: float = 0.0
+    error: Optional[str] = None
+    rate_limit: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and 200 <= self.status < 300
+
+    @property
+    def upload_mbps(self) -> float:
+        return self.size * 8 / self.upload_s / 1e6 if self.upload_s else 0.0
+
+    @property
+    def rtf(self) -> float:
+        return self.processing_s / self.audio_seconds if self.audio_seconds else 0.0
+
+
+def probe_connection(url: str, headers: Dict[str, str], timeout: float = 10.0) -> ConnectionTimings:
+    """GET url на новом соединении с отдельным замером каждой фазы."""
+    parsed = urlparse(url)
+    secure = parsed.scheme == "https"
+    port = parsed.port or (443 if secure else 80)
+    timings = ConnectionTimings(started_at=time.time())
+    started = time.perf_counter()
+    sock = None
+    try:
+        address = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)[0]
+        resolved = time.perf_counter()
+        timings.dns_ms = (resolved - started) * 1000
+        sock = socket.socket(address[0], address[1], address[2])
+        sock.settimeout(timeout)
+        sock.connect(address[4])
+        connected = time.perf_counter()
+        timings.tcp_ms = (connected - resolved) * 1000
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname)
+            timings.tls_ms = (time.perf_counter() - connected) * 1000
+        request_started = time.perf_counter()
+        conn = http.client.HTTPConnection(parsed.hostname, port, timeout=timeout)
+        # Соединение уже открыто: http.client только отправляет запрос и разбирает ответ
+        conn.sock = sock
+        conn.request("GET", parsed.path or "/", headers=headers)
+        response = conn.getresponse()
+        timings.ttfb_ms = (time.perf_counter() - request_started) * 1000
+        response.read()
+        timings.status = response.status
+    except (OSError, http.client.HTTPException) as e:
+        timings.error = f"{type(e).__name__}: {e}"
+    finally:
+        if sock is not None:
+            sock.close()
+    timings.total_ms = (time.perf_counter() - started) * 1000
+    return timings
+
+
+def wait_acknowledged(sock: socket.socket, deadline: float) -> None:
+    """Ждёт, пока получатель подтвердит все отправленные байты (Linux: TIOCOUTQ).
+
+    Без этого загрузка «заканчивается», как только тело легло в буфер сокета, и скорость
+    для файлов размером с буфер получается завышенной. На других ОС возвращается сразу."""
+    if TIOCOUTQ is None:
+        return
+    buffer = bytearray(4)
+    while time.perf_counter() < deadline:
+        try:
+            fcntl.ioctl(sock.fileno(), TIOCOUTQ, buffer)
+        except OSError:
+            return
+        if int.from_bytes(buffer, sys.byteorder) == 0:
+            return
+        time.sleep(0.001)
+
+
+@dataclass
+class TimedResponse:
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    # Подключение (TCP + TLS), отправка тела до подтверждения и ожидание ответа после неё, с
+    connect_s: float
+    upload_s: float
+    wait_s: float
+
+
+def timed_post(url: str, headers: Dict[str, str], chunks: Iterable[bytes], length: int,
+               timeout: float) -> TimedResponse:
+    """POST на новом соединении с замером отправки тела отдельно от ожидания ответа."""
+    parsed = urlparse(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+    conn = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+    started = time.perf_counter()
+    try:
+        conn.connect()
+        connected = time.perf_counter()
+        conn.putrequest("POST", parsed.path or "/")
+        for key, value in {**headers, "Content-Length": str(length)}.items():
+            conn.putheader(key, value)
+        conn.endheaders()
+        for chunk in chunks:
+            conn.send(chunk)
+        wait_acknowledged(conn.sock, connected + timeout)
+        sent = time.perf_counter()
+        response = conn.getresponse()
+        body = response.read()
+        return TimedResponse(response.status, {k.lower(): v for k, v in response.getheaders()}, body,
+                             connect_s=connected - started, upload_s=sent - connected,
+                             wait_s=time.perf_counter() - sent)
+    finally:
+        conn.close()
+
+
+def file_chunks(path: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as handle:
+        while True:
+            chunk = handle.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def fill_sample(sample: TranscriptionSample, response: TimedResponse, started: float) -> None:
+    sample.status = response.status
+    sample.upload_s = response.upload_s
+    sample.processing_s = response.wait_s
+    sample.total_s = time.perf_counter() - started
+    sample.rate_limit = {k: v for k, v in response.headers.items() if k.startswith("x-ratelimit-")}
+    if not 200 <= response.status < 300:
+        sample.error = f"HTTP {response.status}: {response.body[:200].decode('utf-8', 'replace')}"
+
+
+class OpenAIProbe:
+    name = "openai"
+    check_path = "/v1/models"
+
+    def __init__(self, base_url: str, api_key: str, model: str = "whisper-1") -> None:
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+
+    def auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def transcribe(self, audio_path: str, seconds: float, timeout: float) -> TranscriptionSample:
+        sample = TranscriptionSample(seconds, os.path.getsize(audio_path), started_at=time.time())
+        started = time.perf_counter()
+        try:
+            with MultipartStream(fields={"model": self.model},
+                                 files=[("file", os.path.basename(audio_path), audio_path, "audio/wav")]) as body:
+                response = timed_post(f"{self.base_url}/v1/audio/transcriptions",
+                                      {**self.auth_headers(), "Content-Type": body.content_type},
+                                      body, len(body), timeout)
+            fill_sample(sample, response, started)
+        except (OSError, http.client.HTTPException) as e:
+            sample.total_s = time.perf_counter() - started
+            sample.error = f"{type(e).__name__}: {e}"
+        return sample
+
+
+class AssemblyAIProbe:
+    """Загрузка файла в /v2/upload, создание задачи и опрос до завершения."""
+
+    name = "assemblyai"
+    check_path = "/v2/transcript?limit=1"
+
+    def __init__(self, base_url: str, api_key: str, poll_interval: float = 0.5) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.poll_interval = poll_interval
+        self.http = requests.Session()
+
+    def auth_headers(self) -> Dict[str, str]:
+        return {"authorization": self.api_key}
+
+    def transcribe(self, audio_path: str, seconds: float, timeout: float) -> TranscriptionSample:
+        sample = TranscriptionSample(seconds, os.path.getsize(audio_path), started_at=time.time())
+        started = time.perf_counter()
+        deadline = started + timeout
+        try:
+            response = timed_post(f"{self.base_url}/v2/upload",
+                                  {**self.auth_headers(), "Content-Type": "application/octet-stream"},
+                                  file_chunks(audio_path), sample.size, timeout)
+            fill_sample(sample, response, started)
+            if sample.ok:
+                resp = self.http.post(f"{self.base_url}/v2/transcript", headers=self.auth_headers(),
+                                      json={"audio_url": json.loads(response.body)["upload_url"]}, timeout=timeout)
+                sample.status = resp.status_code
+                if resp.status_code != 200:
+                    sample.error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+            if sample.ok:
+                transcript_id = resp.json()["id"]
+                while True:
+                    resp = self.http.get(f"{self.base_url}/v2/transcript/{transcript_id}",
+                                         headers=self.auth_headers(), timeout=timeout)
+                    status = (resp.json() or {}).get("status") if resp.status_code == 200 else None
+                    if status == "completed":
+                        break
+                    if resp.status_code != 200 or status == "error":
+                        sample.status = resp.status_code
+                        sample.error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                        break
+                    if time.perf_counter() > deadline:
+                        sample.error = "timeout"
+                        break
+                    time.sleep(self.poll_interval)
+        except (OSError, http.client.HTTPException, requests.exceptions.RequestException,
+                ValueError, KeyError) as e:
+            sample.error = f"{type(e).__name__}: {e}"
+        # Обработка - всё после загрузки: создание задачи, очередь и распознавание
+        sample.total_s = time.perf_counter() - started
+        sample.processing_s = max(0.0, sample.total_s - sample.upload_s)
+        return sample
+
+
+PROBES = {"openai": OpenAIProbe, "assemblyai": AssemblyAIProbe}
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Маленький приёмный буфер: иначе ограничение скорости прячется в буфере ядра
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+        super().server_bind()
+
+
+class StubProvider:
+    """Локальная заглушка API OpenAI и AssemblyAI.
+
+    Обработка записи длится latency + rtf * длительность; больше limit одновременных
+    транскрибаций - 429. mbps ограничивает скорость приёма тела (0 - без ограничения)."""
+
+    def __init__(self, rtf: float = 0.05, latency: float = 0.05, limit: int = 4, mbps: float = 0.0) -> None:
+        self.rtf = rtf
+        self.latency = latency
+        self.limit = limit
+        self.mbps = mbps
+        self._slots = threading.BoundedSemaphore(limit)
+        self._transcripts: Dict[str, float] = {}
+        self._uploads: Dict[str, int] = {}
+        self._server = _StubServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "StubProvider":
+        threading.Thread(target=self._server.serve_forever, name="probe-stub", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def processing_time(self, size: int) -> float:
+        return self.latency + self.rtf * size / BYTES_PER_SECOND
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                if self.path.startswith("/v1/models"):
+                    return self._json(200, {"data": [{"id": "whisper-1"}]})
+                if self.path.startswith("/v2/transcript/"):
+                    ready_at = stub._transcripts.get(self.path.rsplit("/", 1)[-1])
+                    if ready_at is None:
+                        return self._json(404, {"error": "not found"})
+                    done = time.monotonic() >= ready_at
+                    return self._json(200, {"status": "completed" if done else "processing",
+                                            "text": "stub" if done else None})
+                if self.path.startswith("/v2/transcript"):
+                    return self._json(200, {"transcripts": []})
+                return self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if not self._authorized():
+                    self._drain()
+                    return
+                if self.path == "/v1/audio/transcriptions":
+                    if not stub._slots.acquire(blocking=False):
+                        self._drain()
+                        return self._json(429, {"error": {"message": "Rate limit reached"}},
+                                          {"x-ratelimit-limit-requests": str(stub.limit), "Retry-After": "1"})
+                    try:
+                        size = self._drain()
+                        time.sleep(stub.processing_time(size))
+                    finally:
+                        stub._slots.release()
+                    return self._json(200, {"text": "stub"}, {"x-ratelimit-limit-requests": str(stub.limit)})
+                if self.path == "/v2/upload":
+                    upload_id = uuid.uuid4().hex
+                    stub._uploads[upload_id] = self._drain()
+                    return self._json(200, {"upload_url": f"stub://{upload_id}"})
+                if self.path == "/v2/transcript":
+                    length = int(self.headers.get("Content-Length") or 0)
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    size = stub._uploads.get(str(payload.get("audio_url", "")).rsplit("/", 1)[-1], 0)
+                    transcript_id = uuid.uuid4().hex
+                    stub._transcripts[transcript_id] = time.monotonic() + stub.processing_time(size)
+                    return self._json(200, {"id": transcript_id, "status": "queued"})
+                self._drain()
+                return self._json(404, {"error": "not found"})
+
+            def _authorized(self) -> bool:
+                if self.headers.get("Authorization"):
+                    return True
+                self._json(401, {"error": "missing key"})
+                return False
+
+            def _drain(self) -> int:
+                """Вычитывает тело (с ограничением скорости) и возвращает его размер."""
+                remaining = int(self.headers.get("Content-Length") or 0)
+                received = 0
+                started = time.perf_counter()
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, 64 * 1024))
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    remaining -= len(chunk)
+                    if stub.mbps:
+                        ahead = received * 8 / (stub.mbps * 1e6) - (time.perf_counter() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                return received
+
+            def _json(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class SpanRecorder:
+    """Спаны одного прогона (одна трасса) в формате JobTrace.to_otlp_spans."""
+
+    def __init__(self, provider: str, run: int) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.root_id = os.urandom(8).hex()
+        self.provider = provider
+        self.run = run
+        self.started_at = time.time()
+        self.spans: List[dict] = []
+
+    def add(self, name: str, start: float, end: float, attributes: Dict[str, object],
+            parent: Optional[str] = None) -> str:
+        span_id = os.urandom(8).hex()
+        self.spans.append({
+            "traceId": self.trace_id,
+            "spanId": span_id,
+            "parentSpanId": parent or self.root_id,
+            "name": name,
+            "kind": 3,  # SPAN_KIND_CLIENT
+            "startTimeUnixNano": str(int(start * 1e9)),
+            "endTimeUnixNano": str(int(end * 1e9)),
+            "attributes": _attributes({"probe.provider": self.provider, **attributes}),
+        })
+        return span_id
+
+    def finish(self, ok: bool) -> List[dict]:
+        root = {
+            "traceId": self.trace_id,
+            "spanId": self.root_id,
+            "name": "provider_probe",
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(self.started_at * 1e9)),
+            "endTimeUnixNano": str(int(time.time() * 1e9)),
+            "attributes": _attributes({"probe.provider": self.provider, "probe.run": self.run, "probe.ok": ok}),
+        }
+        return [root, *self.spans]
+
+
+def _attributes(values: Dict[str, object]) -> List[dict]:
+    result = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": round(value, 6)}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+def record_connection(recorder: SpanRecorder, timings: ConnectionTimings) -> None:
+    start = timings.started_at
+    parent = recorder.add("connection", start, start + timings.total_ms / 1000, {
+        "http.status_code": timings.status or None, "error": timings.error})
+    offset = start
+    for name, value in (("dns", timings.dns_ms), ("tcp", timings.tcp_ms), ("tls", timings.tls_ms),
+                        ("ttfb", timings.ttfb_ms)):
+        if value is None:
+            continue
+        recorder.add(name, offset, offset + value / 1000, {"duration_ms": value}, parent)
+        offset += value / 1000
+
+
+def record_transcription(recorder: SpanRecorder, sample: TranscriptionSample, name: str = "transcription",
+                         parent: Optional[str] = None, extra: Optional[Dict[str, object]] = None) -> None:
+    span_id = recorder.add(name, sample.started_at, sample.started_at + sample.total_s, {
+        "audio.seconds": sample.audio_seconds,
+        "audio.bytes": sample.size,
+        "http.status_code": sample.status or None,
+        "upload.mbps": sample.upload_mbps,
+        "transcription.rtf": sample.rtf,
+        "error": sample.error,
+        **(extra or {}),
+    }, parent)
+    recorder.add("upload", sample.started_at, sample.started_at + sample.upload_s, {}, span_id)
+    recorder.add("processing", sample.started_at + sample.upload_s, sample.started_at + sample.total_s, {}, span_id)
+
+
+def format_connection(timings: ConnectionTimings) -> str:
+    if timings.error:
+        return f"ошибка {timings.error}"
+    tls = f"{timings.tls_ms:.1f}" if timings.tls_ms is not None else "-"
+    return (f"DNS {timings.dns_ms:.1f} мс, TCP {timings.tcp_ms:.1f} мс, TLS {tls} мс, "
+            f"TTFB {timings.ttfb_ms:.1f} мс, всего {timings.total_ms:.1f} мс (HTTP {timings.status})")
+
+
+def format_sample(sample: TranscriptionSample) -> str:
+    if not sample.ok:
+        return f"{sample.audio_seconds:>6.0f} с: ошибка {sample.error}"
+    return (f"{sample.audio_seconds:>6.0f} с ({sample.size / 1e6:.2f} МБ): загрузка {sample.upload_s:.2f} с "
+            f"({sample.upload_mbps:.1f} Мбит/с), обработка {sample.processing_s:.2f} с, "
+            f"RTF {sample.rtf:.3f}, всего {sample.total_s:.2f} с")
+
+
+def concurrency_scan(probe, recorder: SpanRecorder, audio_path: str, seconds: float, levels: List[int],
+                     rounds: int, timeout: float) -> bool:
+    """Уровни параллельности по возрастанию; останавливается на первом уровне с 429."""
+    ok = True
+    for level in levels:
+        started_at = time.time()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            samples = list(pool.map(lambda _: probe.transcribe(audio_path, seconds, timeout), range(level * rounds)))
+        wall = time.perf_counter() - started
+        limited = sum(1 for sample in samples if sample.status == 429)
+        failed = [sample for sample in samples if not sample.ok and sample.status != 429]
+        latencies = [sample.total_s for sample in samples if sample.ok]
+        throughput = len(latencies) / wall if wall else 0.0
+        p50 = statistics.median(latencies) if latencies else 0.0
+        p95 = percentile(latencies, 0.95)
+        limit = next((s.rate_limit.get("x-ratelimit-limit-requests") for s in samples if s.rate_limit), None)
+        span_id = recorder.add(f"concurrency[{level}]", started_at, started_at + wall, {
+            "concurrency": level, "requests": len(samples), "requests_per_second": throughput,
+            "latency_p50_s": p50, "latency_p95_s": p95, "rate_limited": limited, "failed": len(failed),
+            "rate_limit.requests": limit,
+        })
+        for sample in samples:
+            record_transcription(recorder, sample, "request", span_id)
+        print(f"   x{level:<3} {throughput:6.2f} запр/с, p50 {p50:.2f} с, p95 {p95:.2f} с"
+              + (f", 429: {limited}" if limited else "") + (f", ошибок: {len(failed)}" if failed else ""))
+        if failed:
+            ok = False
+            print(f"      {failed[0].error}")
+        if limited:
+            print(f"   Лимит провайдера достигнут на {level} одновременных запросах"
+                  + (f" (x-ratelimit-limit-requests: {limit})" if limit else ""))
+            break
+    return ok
+
+
+def run_once(probe, exporter: SpanExporter, run: int, audio: Dict[float, str], args, full: bool) -> bool:
+    recorder = SpanRecorder(probe.name, run)
+    timings = probe_connection(f"{probe.base_url}{probe.check_path}", probe.auth_headers(), args.timeout)
+    record_connection(recorder, timings)
+    ok = timings.error is None and timings.status < 500 and timings.status not in (401, 403)
+    sizes = sorted(audio) if full else [min(audio)]
+    samples = []
+    if ok:
+        for seconds in sizes:
+            sample = probe.transcribe(audio[seconds], seconds, args.timeout)
+            record_transcription(recorder, sample)
+            samples.append(sample)
+            ok = ok and sample.ok
+    if full:
+        print(f"\n🔌 Подключение: {format_connection(timings)}")
+        if timings.status in (401, 403):
+            print("   Ключ отклонён провайдером")
+        if samples:
+            print("\n📤 Транскрибация:")
+            for sample in samples:
+                print(f"   {format_sample(sample)}")
+        if ok and args.concurrency:
+            print(f"\n⚡️ Параллельность ({min(audio):.0f} с, по {args.rounds} запроса на поток):")
+            ok = concurrency_scan(probe, recorder, audio[min(audio)], min(audio), sorted(args.concurrency),
+                                  args.rounds, args.timeout)
+    else:
+        sample = samples[0] if samples else None
+        print(f"[{time.strftime('%H:%M:%S')}] #{run} {'OK ' if ok else 'FAIL'} "
+              f"TTFB {timings.ttfb_ms:.0f} мс, "
+              + (format_sample(sample).strip() if sample else format_connection(timings)), flush=True)
+    exporter.export(recorder.finish(ok), background=False)
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Задержка и пропускная способность провайдера транскрибации")
+    parser.add_argument("--provider", choices=sorted(PROBES), default="openai")
+    parser.add_argument("--key", help="API-ключ (по умолчанию api_keys.<provider> из config.json)")
+    parser.add_argument("--base-url", help="адрес API вместо стандартного")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[5, 30, 120], help="длительности записей, с")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 2, 4, 8],
+                        help="уровни параллельности (без значений - не проверять)")
+    parser.add_argument("--rounds", type=int, default=2, help="запросов на поток на каждом уровне")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--canary", type=int, metavar="N",
+                        help="режим канарейки: N коротких прогонов (0 - бесконечно)")
+    parser.add_argument("--interval", type=float, default=60.0, help="пауза между прогонами канарейки, с")
+    parser.add_argument("--export", help="JSONL-файл для спанов (по умолчанию tracing.export_path)")
+    parser.add_argument("--otlp", help="OTLP/HTTP коллектор (по умолчанию tracing.otlp_endpoint)")
+    parser.add_argument("--stub", action="store_true", help="локальная заглушка провайдера вместо сети")
+    parser.add_argument("--stub-rtf", type=float, default=0.05)
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="с")
+    parser.add_argument("--stub-limit", type=int, default=4, help="одновременных транскрибаций до 429")
+    parser.add_argument("--stub-mbps", type=float, default=0.0, help="скорость приёма заглушки (0 - без ограничения)")
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    tracing_cfg = config.get("tracing") or {}
+    exporter = SpanExporter(export_path=args.export or tracing_cfg.get("export_path"),
+                            otlp_endpoint=args.otlp or tracing_cfg.get("otlp_endpoint"),
+                            service_name="pushtotype-provider-probe")
+    stub = None
+    base_url = args.base_url or PROVIDERS[args.provider]
+    api_key = args.key or (config.get("api_keys") or {}).get(args.provider, "")
+    if args.stub:
+        stub = StubProvider(args.stub_rtf, args.stub_latency, args.stub_limit, args.stub_mbps).start()
+        base_url = stub.base_url
+        api_key = api_key or "stub-key"
+    if not api_key:
+        print(f"❌ Нет ключа: передайте --key или задайте api_keys.{args.provider} в config.json")
+        return 2
+
+    probe = PROBES[args.provider](base_url, api_key)
+    print(f"🔍 {args.provider} ({base_url}), ключ {api_key[:6]}...{api_key[-4:]}")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = {}
+            for seconds in args.sizes:
+                audio[seconds] = os.path.join(tmp, f"probe-{seconds:g}s.wav")
+                write_wav(audio[seconds], seconds)
+            if args.canary is None:
+                ok = run_once(probe, exporter, 1, audio, args, full=True)
+            else:
+                ok = True
+                run = 0
+                while args.canary == 0 or run < args.canary:
+                    if run:
+                        time.sleep(args.interval)
+                    run += 1
+                    ok = run_once(probe, exporter, run, audio, args, full=False) and ok
+    except KeyboardInterrupt:
+        ok = False
+    finally:
+        if stub is not None:
+            stub.stop()
+    if exporter.enabled:
+        print(f"\n📈 Спаны: {exporter.export_path or exporter.otlp_endpoint}")
+    print("\n✅ Провайдер отвечает" if ok else "\n❌ Были ошибки")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
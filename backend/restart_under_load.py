@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Перезапуски сервера под нагрузкой: теряются ли запросы и задачи
+
+Использование:
+    python restart_under_load.py                      # передача сокета (SIGUSR2), 3 перезапуска
+    python restart_under_load.py --mode term          # SIGTERM и запуск нового процесса
+    python restart_under_load.py --clients 16 --restarts 5 --duration 40
+
+Сервер запускается отдельным процессом с временным конфигом (движок fake, порт выбирается
+свободный, контрольная точка во временной папке). Клиенты в цикле загружают запись и опрашивают
+результат, как приложение: 503 с Retry-After повторяют, а ошибки соединения, 404 по своей
+задаче и 5xx считают отказами. Код выхода 1, если были отказы.
+"""
+
+import argparse
+import glob
+import json
+import os
+import signal
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import Counter
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Сервер пишет записи и транскрипции в backend/data/<id>.*; после прогона их удаляем
+DATA_DIR = os.path.join(BACKEND_DIR, "data")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_wav(path: str, seconds: float = 1.0, rate: int = 16000) -> None:
+    with wave.open(path, "wb") as handle:
+        handle.setnchannels(1)
+        handle.setsampwidth(2)
+        handle.setframerate(rate)
+        handle.writeframes(struct.pack("<h", 0) * int(seconds * rate))
+
+
+def process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class ServerProcess:
+    """Текущий процесс сервера. После SIGUSR2 это уже не наш потомок, поэтому pid берём из /readyz."""
+
+    def __init__(self, base_url: str, env: dict, log) -> None:
+        self.base_url = base_url
+        self.env = env
+        self.log = log
+        self.children = []
+
+    def start(self) -> int:
+        process = subprocess.Popen([sys.executable, "server.py"], cwd=BACKEND_DIR, env=self.env,
+                                   stdout=self.log, stderr=subprocess.STDOUT)
+        self.children.append(process)
+        return self.wait_ready(exclude=None)
+
+    def wait_ready(self, exclude, timeout: float = 30.0) -> int:
+        """Ждёт, пока на порту ответит процесс с pid, отличным от exclude."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                pid = requests.get(f"{self.base_url}/readyz", timeout=2).json().get("pid")
+                if pid and pid != exclude:
+                    return pid
+            except (requests.exceptions.RequestException, ValueError):
+                pass
+            time.sleep(0.05)
+        raise RuntimeError("сервер не ответил на /readyz")
+
+    def wait_exit(self, pid: int, timeout: float = 60.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for child in self.children:
+                child.poll()
+            if not process_exists(pid):
+                return True
+            time.sleep(0.05)
+        return False
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.latencies = []
+        self.recording_ids = []
+
+    def add(self, key: str, latency: float = None) -> None:
+        with self.lock:
+            self.counts[key] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+
+def client_loop(base_url: str, audio_path: str, stop: threading.Event, stats: Stats) -> None:
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.monotonic()
+        try:
+            while True:
+                with open(audio_path, "rb") as handle:
+                    resp = session.post(f"{base_url}/api/audio", files={"audio": ("rec.wav", handle, "audio/wav")},
+                                        timeout=30)
+                if resp.status_code != 503:
+                    break
+                stats.add("upload_retried")
+                time.sleep(float(resp.headers.get("Retry-After", 1)))
+            if resp.status_code != 200:
+                stats.add(f"upload_{resp.status_code}")
+                continue
+            recording_id = resp.json()["recording_id"]
+            with stats.lock:
+                stats.recording_ids.append(recording_id)
+            poll_after = resp.json().get("poll_after", 0.5)
+            while True:
+                time.sleep(min(max(poll_after, 0.1), 2.0))
+                resp = session.get(f"{base_url}/api/transcription/{recording_id}", timeout=30)
+                if resp.status_code == 404:
+                    stats.add("lost")
+                    break
+                if resp.status_code != 200:
+                    stats.add(f"poll_{resp.status_code}")
+                    break
+                body = resp.json()
+                if body["status"] == "ready":
+                    stats.add("completed", time.monotonic() - started)
+                    break
+                if body["status"] == "error":
+                    stats.add("job_error")
+                    break
+                poll_after = body.get("poll_after", 0.5)
+        except requests.exceptions.RequestException as e:
+            stats.add(f"connection_error:{type(e).__name__}")
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перезапуски сервера под нагрузкой")
+    parser.add_argument("--mode", choices=("handoff", "term"), default="handoff",
+                        help="handoff - SIGUSR2 (передача сокета), term - SIGTERM и новый процесс")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность нагрузки, с")
+    parser.add_argument("--restarts", type=int, default=3)
+    parser.add_argument("--fake-delay", type=float, default=1.5, help="время «транскрибации» одной записи, с")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "config.json")
+        with open(config_path, "w", encoding="utf-8") as handle:
+            json.dump({
+                "backend": {"host": "127.0.0.1", "port": port, "base_url": base_url},
+                "api_keys": {"openai": "", "telegram_bot": ""},
+                "transcription": {"engine": "fake", "fake_delay": args.fake_delay},
+                "shutdown": {"checkpoint_path": os.path.join(tmp, "checkpoint.json")},
+            }, handle)
+        audio_path = os.path.join(tmp, "rec.wav")
+        write_wav(audio_path)
+        log_path = os.path.join(tmp, "server.log")
+        env = {**os.environ, "PUSHTOTYPE_CONFIG": config_path, "PYTHONUNBUFFERED": "1"}
+        env.pop("PORT", None)
+
+        with open(log_path, "w", encoding="utf-8") as log:
+            server = ServerProcess(base_url, env, log)
+            pid = server.start()
+            print(f"🚀 Сервер {pid} на {base_url}, режим {args.mode}, клиентов {args.clients}")
+
+            stats = Stats()
+            stop = threading.Event()
+            clients = [threading.Thread(target=client_loop, args=(base_url, audio_path, stop, stats), daemon=True)
+                       for _ in range(args.clients)]
+            for client in clients:
+                client.start()
+
+            interval = args.duration / (args.restarts + 1)
+            for restart in range(args.restarts):
+                time.sleep(interval)
+                started = time.monotonic()
+                if args.mode == "handoff":
+                    os.kill(pid, signal.SIGUSR2)
+                    new_pid = server.wait_ready(exclude=pid)
+                    exited = server.wait_exit(pid)
+                else:
+                    os.kill(pid, signal.SIGTERM)
+                    exited = server.wait_exit(pid)
+                    new_pid = server.start()
+                print(f"🔁 Перезапуск {restart + 1}: {pid} -> {new_pid} за {time.monotonic() - started:.1f} с"
+                      f"{'' if exited else ' (старый процесс не завершился)'}")
+                pid = new_pid
+            time.sleep(interval)
+
+            stop.set()
+            for client in clients:
+                client.join(timeout=60)
+            os.kill(pid, signal.SIGTERM)
+            server.wait_exit(pid)
+
+        with open(log_path, encoding="utf-8") as handle:
+            lifecycle_lines = [line.rstrip() for line in handle if "[Lifecycle]" in line]
+
+    for recording_id in stats.recording_ids:
+        for path in glob.glob(os.path.join(DATA_DIR, f"{recording_id}.*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    counts = stats.counts
+    failures = {key: value for key, value in counts.items()
+                if key not in ("completed", "upload_retried")}
+    print(f"\n✅ Завершено задач: {counts['completed']}, повторов загрузки после 503: {counts['upload_retried']}")
+    if stats.latencies:
+        ordered = sorted(stats.latencies)
+        print(f"⏱  Загрузка -> результат: медиана {statistics.median(ordered):.2f} с, "
+              f"p95 {ordered[int(len(ordered) * 0.95) - 1]:.2f} с, максимум {ordered[-1]:.2f} с")
+    print("\n".join(f"   {line}" for line in lifecycle_lines))
+    if failures:
+        print(f"❌ Отказы: {failures}")
+        sys.exit(1)
+    print("✅ Отказов и потерянных задач нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,374 @@
+import time
+
+# Замер времени импорта модуля (включая Flask/requests) для /readyz
+IMPORT_STARTED = time.monotonic()
+
+import hmac
 import json
+import math
 import os
+import re
+import signal
 import threading
-import time
 import uuid
-from dataclasses import dataclass
-from typing import Dict, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
 
 # import assemblyai as aai
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory, stream_with_context
 import requests
 
+from audio_probe import AUDIO_MIME_TYPES, probe_audio, probe_segments, sniff_stream
+from circuit_breaker import BreakerRegistry, CircuitOpenError, ProviderTimeout, ProviderUnavailable
+from chat_router import ChatRouter, RouteDecision
+from chat_sessions import ChatSession, ChatSessionStore, estimate_tokens
+from debug_tools import AllocationTracker, SamplingProfiler, format_collapsed, request_labels, thread_dump
+from eta import CompletionEstimator
+from job_store import FinishedJobIndex, JobStatus, TranscriptionJob
+from lifecycle import (ConnectionTracker, RequestGauge, Successor, inherited_listen_socket, notify_ready, predecessor_alive,
+                       predecessor_pid, read_checkpoint, remove_checkpoint, write_checkpoint)
+from multipart_stream import DEFAULT_CHUNK_SIZE, MultipartStream, UploadCancelled
+from tracing import JobTrace, SpanExporter
+from transcript_archive import TranscriptArchive
+from supervisor import Supervisor
+from tenants import ClientPolicy, ClientRegistry, FairScheduler
+from webhooks import WebhookDelivery, WebhookDispatcher
+
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.json")
+CONFIG_PATH = os.environ.get("PUSHTOTYPE_CONFIG") or os.path.join(os.path.dirname(__file__), "..", "config.json")
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Длительность этапов запуска, мс
+startup_timings: Dict[str, float] = {}
+
 # Load config and initialize AssemblyAI
+_config_started = time.monotonic()
 with open(CONFIG_PATH, "r", encoding="utf-8") as f:
     config = json.load(f)
+startup_timings["config_ms"] = round((time.monotonic() - _config_started) * 1000, 3)
 
 # aai.settings.api_key = config["api_keys"]["assemblyai"]
 OPENAI_API_KEY = config["api_keys"].get("openai", "")
 OPENAI_MODEL = (config.get("openai") or {}).get("model", "gpt-4o-mini")
 USE_WEB_SEARCH = (config.get("openai") or {}).get("use_web_search", False)
+# Выбор модели и веб-поиска для каждого запроса (OPENAI_MODEL и USE_WEB_SEARCH - значения по умолчанию)
+chat_router = ChatRouter.from_config(config.get("router") or {}, OPENAI_MODEL, USE_WEB_SEARCH)
+CHAT_SYSTEM_PROMPT = "Ты лаконично и понятно отвечаешь на вопросы пользователя."
+# Многоходовые чат-сессии /api/chat (session_id)
+chat_sessions = ChatSessionStore.from_config(config.get("chat_sessions") or {})
+
+# Движок транскрибации: openai (Whisper API) или fake (локальная проверка без сети)
+TRANSCRIPTION_CONFIG = config.get("transcription") or {}
+TRANSCRIPTION_ENGINE = TRANSCRIPTION_CONFIG.get("engine", "openai")
+FAKE_ENGINE_DELAY = float(TRANSCRIPTION_CONFIG.get("fake_delay", 0.5))
+# Таймаут запроса к провайдеру, секунд (отсчитывается после получения слота в очереди)
+PROVIDER_TIMEOUT = float(TRANSCRIPTION_CONFIG.get("provider_timeout", 60))
+# Резервные движки: используются, если у основного разомкнут автомат или провайдер недоступен
+FALLBACK_ENGINES = list(TRANSCRIPTION_CONFIG.get("fallback_engines") or [])
+# Размер куска при потоковой отправке аудио провайдеру (байт)
+UPLOAD_CHUNK_SIZE = int(TRANSCRIPTION_CONFIG.get("upload_chunk_size", DEFAULT_CHUNK_SIZE))
+# Записи длиннее этого (секунд, по заголовкам контейнера) отклоняются с 413; None - без ограничения
+MAX_AUDIO_SECONDS = TRANSCRIPTION_CONFIG.get("max_audio_seconds")
+# Незавершённые сессии потоковой загрузки удаляются после этого простоя
+SESSION_IDLE_TIMEOUT = float((config.get("sessions") or {}).get("idle_timeout", 300))
+
+# Экспорт таймлайнов задач в формате OpenTelemetry (опционально)
+trace_exporter = SpanExporter.from_config(config.get("tracing") or {})
+# Сколько таймлайнов уже выданных задач хранить для /trace
+FINISHED_TRACES_LIMIT = int((config.get("tracing") or {}).get("keep_finished", 1000))
+
+# Оценка времени завершения задач: подсказывает клиентам, когда опрашивать результат
+ETA_CONFIG = config.get("eta") or {}
+completion_estimator = CompletionEstimator.from_config(ETA_CONFIG)
+# Интервал опроса, если задача не успела к оценке, и верхняя граница подсказки
+OVERDUE_POLL_INTERVAL = float(ETA_CONFIG.get("overdue_poll", 0.5))
+MAX_POLL_AFTER = float(ETA_CONFIG.get("max_poll_after", 30))
+
+# Доставка результатов на callback_url клиентов
+webhook_dispatcher = WebhookDispatcher.from_config(config.get("webhooks") or {})
+
+# Автоматы защиты по провайдеру и эндпоинту: при деградации запросы отклоняются сразу
+provider_breakers = BreakerRegistry.from_config(config.get("circuit_breaker") or {})
+
+# Архив транскрипций с поиском (/api/search): включается явно, archive.enabled
+ARCHIVE_CONFIG = config.get("archive") or {}
+archive = (TranscriptArchive.from_config(ARCHIVE_CONFIG, os.path.join(DATA_DIR, "archive"))
+           if ARCHIVE_CONFIG.get("enabled") else None)
+SEARCH_MAX_RESULTS = int(ARCHIVE_CONFIG.get("max_results", 50))
+
+# Клиенты API (ключи, веса, квоты) и справедливые очереди перед вызовами провайдеров
+client_registry = ClientRegistry.from_config(config.get("clients") or {})
+SCHEDULER_CONFIG = config.get("scheduler") or {}
+transcription_scheduler = FairScheduler("transcription", int(SCHEDULER_CONFIG.get("transcription_slots", 16)))
+chat_scheduler = FairScheduler("chat", int(SCHEDULER_CONFIG.get("chat_slots", 4)))
+# Стоимость записи неизвестной длительности в очереди транскрибации, секунд аудио
+DEFAULT_AUDIO_COST = float(SCHEDULER_CONFIG.get("default_audio_cost", 30))
+
+# Многопроцессный режим (--workers N): номер этого воркера и префикс id его задач.
+# Id задач, сессий и пакетов начинаются с w<номер>-, и запросы по ним пересылаются владельцу
+WORKERS_CONFIG = config.get("workers") or {}
+WORKER_COUNT = 1
+WORKER_ID = 0
+WORKER_PREFIX = ""
+# Воркер N принимает пересланные запросы на 127.0.0.1:internal_base_port + N
+INTERNAL_BASE_PORT = int(WORKERS_CONFIG.get("internal_base_port", 0))
+FORWARD_TIMEOUT = float(WORKERS_CONFIG.get("forward_timeout", 60))
+FORWARDED_HEADER = "X-PushToType-Forwarded-By"
+# Секрет пересылки между воркерами: создаётся до fork, поэтому общий у всех воркеров одного запуска
+# и неизвестен внешним клиентам. Без него заголовок пересылки игнорируется
+INTERNAL_SECRET_HEADER = "X-PushToType-Internal-Secret"
+INTERNAL_SECRET = os.urandom(16).hex()
+_WORKER_ID_RE = re.compile(r"^w(\d+)-")
+# Пул соединений для пересылки между воркерами
+internal_http = requests.Session()
+
+# Плавная остановка (SIGTERM) и передача сокета новому процессу (SIGUSR2), см. lifecycle.py
+SHUTDOWN_CONFIG = config.get("shutdown") or {}
+# Сколько ждать завершения текущих задач перед сохранением контрольной точки
+DRAIN_TIMEOUT = float(SHUTDOWN_CONFIG.get("drain_timeout", 30))
+# Сколько ждать, пока преемник начнёт принимать соединения
+HANDOFF_TIMEOUT = float(SHUTDOWN_CONFIG.get("handoff_timeout", 30))
+CHECKPOINT_PATH = SHUTDOWN_CONFIG.get("checkpoint_path") or os.path.join(DATA_DIR, "checkpoint.json")
+# None - обычная работа, "stopping" - остановка по SIGTERM, "handoff" - передача сокета преемнику
+drain_mode: Optional[str] = None
+# Адрес преемника, когда он уже принимает соединения; до этого запросы ждут handoff_decided
+handoff_target: Optional[str] = None
+handoff_decided = threading.Event()
+request_gauge = RequestGauge()
+# Keep-alive соединения публичного сервера: процесс не выходит, пока они открыты
+connection_tracker = ConnectionTracker()
+_drain_thread: Optional[threading.Thread] = None
+
+# Диагностические /debug/* (профилировщик, потоки, память): выключены, пока не задан debug.enabled и token
+DEBUG_CONFIG = config.get("debug") or {}
+DEBUG_TOKEN = str(DEBUG_CONFIG.get("token") or "") if DEBUG_CONFIG.get("enabled") else ""
+if DEBUG_CONFIG.get("enabled") and not DEBUG_TOKEN:
+    print("[Debug] debug.enabled без debug.token - диагностические эндпоинты не включены")
+MAX_PROFILE_SECONDS = float(DEBUG_CONFIG.get("max_profile_seconds", 60))
+profiler = SamplingProfiler()
+allocation_tracker = AllocationTracker()
+
+# Общая сессия с пулом соединений к провайдерам: TLS-рукопожатие делается один раз
+provider_http = requests.Session()
+
+# Состояние компонентов для /readyz: pending / ready / disabled / failed: <причина>
+component_states: Dict[str, str] = {
+    "config": "ready",
+    "storage": "ready" if os.access(DATA_DIR, os.W_OK) else "failed: DATA_DIR недоступна для записи",
+    "openai": "pending" if OPENAI_API_KEY else "disabled",
+    "telegram": "pending",
+    "archive": "pending" if archive is not None else "disabled",
+}
+# Без этих компонентов сервер не может принимать задачи
+REQUIRED_COMPONENTS = ("config", "storage")
 
 app = Flask(__name__)
 
 
+def new_id() -> str:
+    """Id задачи, сессии или пакета; в многопроцессном режиме с номером воркера-владельца."""
+    return f"{WORKER_PREFIX}{uuid.uuid4()}"
+
+
+def owner_worker() -> Optional[int]:
+    """Номер воркера, которому принадлежит объект запроса (None - обработать здесь)."""
+    if request.path == "/telegram/webhook":
+        # Бот в webhook-режиме работает в каждом воркере; повтор доставки того же обновления
+        # попадает к тому же воркеру, и его журнал отсеивает дубль
+        update_id = (request.get_json(silent=True) or {}).get("update_id")
+        return update_id % WORKER_COUNT if isinstance(update_id, int) else None
+    candidates = list((request.view_args or {}).values())
+    if request.method == "POST" and request.path == "/api/chat":
+        candidates.append((request.get_json(silent=True) or {}).get("session_id"))
+    if request.method == "POST" and request.path == "/api/ask":
+        # Тело сначала кэшируется, чтобы после разбора формы его можно было переслать владельцу
+        request.get_data(cache=True)
+        candidates.append(request.form.get("session_id"))
+    for value in candidates:
+        match = _WORKER_ID_RE.match(str(value or ""))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+# Запросы, создающие новую работу: во время остановки на них отвечает 503
+NEW_WORK_ENDPOINTS = ("/api/audio", "/api/ask", "/api/batch", "/api/session", "/telegram/webhook")
+# Запросы, которые не меняют задачи, сессии и пакеты: их не ждём перед снимком состояния
+READ_ONLY_ENDPOINTS = ("/api/chat", "/api/search", "/api/usage", "/healthz", "/readyz")
+
+
+@app.before_request
+def drain_gate():
+    """Во время остановки не принимает новую работу; после передачи сокета пересылает всё преемнику."""
+    if drain_mode is None or request.path in ("/healthz", "/readyz"):
+        return None
+    if drain_mode == "handoff":
+        # Пока неясно, кто обслужит запрос (преемник или мы, если передача не удалась), он ждёт
+        handoff_decided.wait(HANDOFF_TIMEOUT + DRAIN_TIMEOUT)
+        if handoff_target is not None:
+            return forward_request(handoff_target, "Преемник")
+        return None
+    if request.method == "POST" and request.path in NEW_WORK_ENDPOINTS:
+        return jsonify({"error": "Server is restarting"}), 503, {"Retry-After": "1"}
+    return None
+
+
+@app.before_request
+def count_request():
+    g.mutating = request.path not in READ_ONLY_ENDPOINTS and not request.path.startswith("/debug/")
+    request_gauge.enter(g.mutating)
+    g.counted = True
+
+
+@app.teardown_request
+def uncount_request(exc):
+    if getattr(g, "counted", False):
+        g.counted = False
+        request_gauge.exit(g.mutating)
+
+
+@app.after_request
+def close_connection_while_draining(response):
+    # Клиенты с keep-alive переподключаются и попадают на новый процесс
+    if drain_mode is not None:
+        response.headers["Connection"] = "close"
+    return response
+
+
+def request_api_key() -> Optional[str]:
+    auth = request.headers.get("Authorization", "")
+    if auth.lower().startswith("bearer "):
+        return auth[7:].strip() or None
+    return request.headers.get("X-API-Key") or None
+
+
+@app.before_request
+def identify_client():
+    """Клиент по API-ключу для всех /api/*; неизвестный ключ (или его отсутствие при require_key) - 401."""
+    if not request.path.startswith("/api/"):
+        return None
+    client = client_registry.identify(request_api_key())
+    if client is None:
+        return jsonify({"error": "Invalid or missing API key"}), 401
+    g.client = client
+    return None
+
+
+def current_client() -> ClientPolicy:
+    return getattr(g, "client", None) or client_registry.anonymous
+
+
+def forwarded_by_worker() -> bool:
+    """Запрос переслан другим воркером: пришёл на внутренний адрес этого воркера и несёт секрет запуска.
+
+    Заголовок пересылки от внешних клиентов (на публичном порту или без секрета) не действует."""
+    if WORKER_COUNT <= 1 or not request.headers.get(FORWARDED_HEADER):
+        return False
+    if request.environ.get("SERVER_PORT") != str(INTERNAL_BASE_PORT + WORKER_ID):
+        return False
+    return hmac.compare_digest(request.headers.get(INTERNAL_SECRET_HEADER, "").encode(), INTERNAL_SECRET.encode())
+
+
+def rate_limited_response():
+    """429, если клиент исчерпал квоту на создание задач. None - запрос принят.
+
+    Запрос, пересланный другим воркером, уже учтён там."""
+    if forwarded_by_worker():
+        return None
+    retry_after = client_registry.admit(current_client())
+    if not retry_after:
+        return None
+    response = jsonify({"error": "Rate limit exceeded", "retry_after": round(retry_after, 1)})
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response, 429
+
+
+@app.before_request
+def route_to_owner_worker():
+    """Задачи и сессии живут в памяти воркера, который их создал: чужие запросы пересылаем."""
+    if WORKER_COUNT <= 1 or forwarded_by_worker():
+        return None
+    owner = owner_worker()
+    if owner is None or owner == WORKER_ID or owner >= WORKER_COUNT:
+        return None
+    return forward_to_worker(owner)
+
+
+def forward_to_worker(owner: int):
+    return forward_request(f"http://127.0.0.1:{INTERNAL_BASE_PORT + owner}", f"Воркер {owner}",
+                           {FORWARDED_HEADER: str(WORKER_ID), INTERNAL_SECRET_HEADER: INTERNAL_SECRET})
+
+
+def forward_request(base_url: str, target: str, extra_headers: Optional[Dict[str, str]] = None):
+    """Проксирует текущий запрос на base_url и возвращает его ответ."""
+    url = f"{base_url}{request.full_path.rstrip('?')}"
+    # Служебные заголовки пересылки клиента не передаём дальше: их выставляет только сам бэкенд
+    dropped = ("host", "content-length", FORWARDED_HEADER.lower(), INTERNAL_SECRET_HEADER.lower())
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in dropped}
+    headers.update(extra_headers or {})
+    try:
+        resp = internal_http.request(request.method, url, headers=headers, data=request.get_data(),
+                                     timeout=FORWARD_TIMEOUT, allow_redirects=False)
+    except requests.exceptions.RequestException as e:
+        print(f"[Workers] {target} не ответил на пересылку {request.path}: {e}")
+        return jsonify({"error": "Owner worker unavailable"}), 503, {"Retry-After": "1"}
+    excluded = ("connection", "content-encoding", "content-length", "transfer-encoding")
+    return Response(resp.content, resp.status_code,
+                    [(k, v) for k, v in resp.headers.items() if k.lower() not in excluded])
+
+
 @dataclass
-class TranscriptionJob:
+class TranscriptionBatch:
+    job_ids: List[str] = field(default_factory=list)
+    # Результаты в порядке завершения; cursor в /api/batch/<id> - индекс в этом списке
+    results: List[dict] = field(default_factory=list)
+
+
+@dataclass
+class SessionSegment:
     audio_path: str
-    transcription_path: str
-    status: str = "processing"
-    transcription_text: Optional[str] = None
+    text: Optional[str] = None
+    error: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+@dataclass
+class UploadSession:
+    """Запись, которая загружается частями, пока пользователь ещё держит клавишу."""
+    trace: JobTrace = field(default_factory=JobTrace)
+    segments: List[SessionSegment] = field(default_factory=list)
+    deadline: Optional[float] = None
+    source: str = "session"
+    created_at: float = field(default_factory=time.time)
+    client: Optional[ClientPolicy] = None
+    last_activity: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Сессия удалена или её задача отменена: сегменты обрывают вызовы провайдера
+    cancelled: threading.Event = field(default_factory=threading.Event)
 
 
 jobs: Dict[str, TranscriptionJob] = {}
+batches: Dict[str, TranscriptionBatch] = {}
+batches_lock = threading.Lock()
+sessions: Dict[str, UploadSession] = {}
+# Завершённые, но не забранные задачи: снимаются через jobs.result_ttl секунд или сверх jobs.max_jobs
+finished_jobs = FinishedJobIndex.from_config(config.get("jobs") or {})
+# Таймлайны задач, которые уже забрали и удалили из jobs
+finished_traces: "OrderedDict[str, JobTrace]" = OrderedDict()
+finished_traces_lock = threading.Lock()
+
+
+def retire_trace(job_id: str, trace: JobTrace) -> None:
+    """Сохраняет таймлайн забранной задачи и экспортирует его спаны."""
+    with finished_traces_lock:
+        finished_traces[job_id] = trace
+        while len(finished_traces) > FINISHED_TRACES_LIMIT:
+            finished_traces.popitem(last=False)
+    trace_exporter.export(trace.to_otlp_spans(job_id))
 
 
 @app.get("/files/<path:filename>")
@@ -126,40 +458,312 @@ def serve_file(filename: str):
 #             handle.write(job.transcription_text)
 
 
-def transcribe_with_whisper_openai(job_id: str) -> bool:
-    """Основная транскрибация через OpenAI Whisper API. Возвращает True при успехе."""
+def transcribe_with_whisper_openai(audio_path: str, timeout: float = 60.0, trace: Optional[JobTrace] = None,
+                                   cancelled: Optional[Callable[[], bool]] = None) -> Optional[str]:
+    """Основная транскрибация через OpenAI Whisper API. Возвращает текст или None при ошибке.
+
+    После cancelled() загрузка обрывается на следующем куске, а уже полученный ответ закрывается."""
     if not OPENAI_API_KEY:
-        return False
+        return None
 
-    job = jobs[job_id]
     try:
-        with open(job.audio_path, "rb") as f:
-            resp = requests.post(
+        # Тело отдаётся кусками по мере отправки: файл не копируется в память целиком
+        with MultipartStream(
+            fields={"model": "whisper-1"},  # автоопределение языка по умолчанию
+            files=[("file", os.path.basename(audio_path), audio_path,
+                    AUDIO_MIME_TYPES.get(os.path.splitext(audio_path)[1].lstrip(".").lower(), "application/octet-stream"))],
+            chunk_size=UPLOAD_CHUNK_SIZE,
+            cancelled=cancelled,
+        ) as body:
+            if trace is not None:
+                trace.mark("provider_request_sent")
+            # stream=True: возвращаемся сразу после заголовков, чтобы отметить первый байт ответа
+            resp = provider_http.post(
                 "https://api.openai.com/v1/audio/transcriptions",
-                headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-                files={"file": f},
-                data={"model": "whisper-1"},  # автоопределение языка по умолчанию
-                timeout=60,
+                headers={"Authorization": f"Bearer {OPENAI_API_KEY}", **body.headers},
+                data=body,
+                timeout=(min(10.0, timeout), timeout),
+                stream=True,
             )
+        if cancelled is not None and cancelled():
+            # Соединение закрывается, а не возвращается в пул с недочитанным ответом
+            resp.close()
+            return None
+        if trace is not None:
+            trace.mark("first_byte")
         if resp.status_code == 200:
             data = resp.json() or {}
-            text = data.get("text") or ""
-            job.transcription_text = text if text else "Транскрипция пуста"
-            job.status = "ready"
-            with open(job.transcription_path, "w", encoding="utf-8") as handle:
-                handle.write(job.transcription_text)
-            return True
-        else:
-            # Логируем и даём шанс резерву
-            print(f"[Whisper] {resp.status_code}: {resp.text}")
-            return False
+            return data.get("text") or ""
+        # Логируем и даём шанс резерву
+        print(f"[Whisper] {resp.status_code}: {resp.text}")
+        if resp.status_code >= 500 or resp.status_code == 429:
+            raise ProviderUnavailable(f"HTTP {resp.status_code}")
+        return None
+    except ProviderUnavailable:
+        raise
+    except UploadCancelled:
+        print("[Whisper] Загрузка прервана: задача отменена")
+        return None
+    except requests.exceptions.Timeout as e:
+        print(f"[Whisper] Провайдер не ответил: {e}")
+        raise ProviderTimeout(str(e)) from e
+    except requests.exceptions.ConnectionError as e:
+        print(f"[Whisper] Провайдер не ответил: {e}")
+        raise ProviderUnavailable(str(e)) from e
     except Exception as e:
         print(f"[Whisper] Ошибка: {e}")
+        return None
+
+
+def transcribe_with_fake_engine(audio_path: str, timeout: float = 60.0, trace: Optional[JobTrace] = None,
+                                cancelled: Optional[Callable[[], bool]] = None) -> Optional[str]:
+    """Локальный движок без сети для проверки API: ждёт fake_delay и описывает файл."""
+    if trace is not None:
+        trace.mark("provider_request_sent")
+    size = os.path.getsize(audio_path)
+    waited = 0.0
+    # Ожидание кусками, как загрузка у настоящего движка: отмена прерывает его
+    while waited < min(FAKE_ENGINE_DELAY, timeout):
+        if cancelled is not None and cancelled():
+            return None
+        step = min(0.05, min(FAKE_ENGINE_DELAY, timeout) - waited)
+        time.sleep(step)
+        waited += step
+    if FAKE_ENGINE_DELAY > timeout:
+        raise ProviderTimeout(f"нет ответа за {timeout:.1f} с")
+    if trace is not None:
+        trace.mark("first_byte")
+    return f"[fake] {os.path.basename(audio_path)}: {size} байт"
+
+
+TRANSCRIPTION_ENGINES = {
+    "openai": transcribe_with_whisper_openai,
+    "fake": transcribe_with_fake_engine,
+}
+# Ключ автомата защиты для каждого движка: провайдер:эндпоинт
+ENGINE_ENDPOINTS = {
+    "openai": "openai:audio/transcriptions",
+    "fake": "fake:transcriptions",
+}
+if TRANSCRIPTION_ENGINE not in TRANSCRIPTION_ENGINES:
+    print(f"⚠️  Неизвестный движок транскрибации '{TRANSCRIPTION_ENGINE}', использую openai")
+    TRANSCRIPTION_ENGINE = "openai"
+for _name in FALLBACK_ENGINES:
+    if _name not in TRANSCRIPTION_ENGINES:
+        print(f"⚠️  Неизвестный резервный движок '{_name}', пропускаю")
+
+
+def engine_chain() -> List[str]:
+    """Основной движок и резервные в порядке предпочтения."""
+    chain = [TRANSCRIPTION_ENGINE]
+    for name in FALLBACK_ENGINES:
+        if name in TRANSCRIPTION_ENGINES and name not in chain:
+            chain.append(name)
+    return chain
+
+
+def transcribe_file(audio_path: str, timeout: float = PROVIDER_TIMEOUT, trace: Optional[JobTrace] = None,
+                    client_bound: bool = False, cancelled: Optional[Callable[[], bool]] = None) -> Optional[str]:
+    """Транскрибирует файл настроенным движком (transcription.engine в конфиге).
+
+    Движки с разомкнутым автоматом пропускаются без запроса; при сбое провайдера пробуется
+    следующий из transcription.fallback_engines в пределах того же таймаута.
+    Если разомкнуты все автоматы, бросает CircuitOpenError.
+    client_bound - таймаут урезан дедлайном клиента: тогда таймаут не считается сбоем провайдера.
+    Отменённый (cancelled()) вызов возвращает None и не учитывается автоматом ни как успех, ни как сбой;
+    занятый им пробный слот half-open возвращается автомату.
+    """
+    deadline = time.monotonic() + timeout
+    rejected: List[CircuitOpenError] = []
+    for name in engine_chain():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (cancelled is not None and cancelled()):
+            break
+        breaker = provider_breakers.get(ENGINE_ENDPOINTS.get(name, name))
+        if not breaker.allow():
+            rejected.append(CircuitOpenError(breaker.name, breaker.retry_after()))
+            continue
+        started = time.monotonic()
+        ok: Optional[bool] = False
+        try:
+            text = TRANSCRIPTION_ENGINES[name](audio_path, timeout=remaining, trace=trace, cancelled=cancelled)
+            # None без исключения - ошибка запроса (например, битый файл), а не провайдера
+            ok = True
+            return text
+        except ProviderTimeout as e:
+            print(f"[Transcription] {name}: провайдер не ответил за {remaining:.1f} с ({e})")
+            if client_bound:
+                # Провайдеру не дали полного таймаута - это дедлайн клиента, а не сбой
+                ok = None
+        except ProviderUnavailable as e:
+            print(f"[Transcription] {name}: провайдер недоступен ({e})")
+        except Exception:
+            if cancelled is not None and cancelled():
+                # Файлы отменённой задачи удаляются под работающим движком - это не ошибка
+                return None
+            raise
+        finally:
+            if cancelled is not None and cancelled():
+                ok = None
+            if ok is not None:
+                breaker.record(ok, time.monotonic() - started)
+            else:
+                breaker.release_trial()
+    if rejected and len(rejected) == len(engine_chain()):
+        raise min(rejected, key=lambda e: e.retry_after)
+    return None
+
+
+# Автоматы движков создаются сразу, чтобы их состояние было видно в /readyz с запуска
+for _name in engine_chain():
+    provider_breakers.get(ENGINE_ENDPOINTS.get(_name, _name))
+
+
+def transcribe_for_client(client: Optional[ClientPolicy], audio_path: str, timeout: float = PROVIDER_TIMEOUT,
+                          trace: Optional[JobTrace] = None, audio_seconds: Optional[float] = None,
+                          cancelled: Optional[Callable[[], bool]] = None,
+                          deadline: Optional[float] = None) -> Optional[str]:
+    """transcribe_file через справедливую очередь.
+
+    Ожидание слота ограничено только дедлайном клиента (deadline, time.monotonic()); после
+    получения слота провайдер получает полный timeout, урезанный лишь тем же дедлайном.
+    """
+    client = client or client_registry.anonymous
+    wait_limit = None if deadline is None else max(0.0, deadline - time.monotonic())
+    waited = transcription_scheduler.acquire(client, cost=audio_seconds or DEFAULT_AUDIO_COST, timeout=wait_limit)
+    if waited is None:
+        client_registry.record_wait(client.name, wait_limit or 0.0)
+        print(f"[Scheduler] {client.name}: слот к провайдеру не освободился до дедлайна клиента")
+        return None
+    client_registry.record_wait(client.name, waited)
+    try:
+        if cancelled is not None and cancelled():
+            return None
+        client_bound = False
+        if deadline is not None and deadline - time.monotonic() < timeout:
+            timeout = deadline - time.monotonic()
+            client_bound = True
+            if timeout <= 0:
+                return None
+        if cancelled is None:
+            text = transcribe_file(audio_path, timeout=timeout, trace=trace, client_bound=client_bound)
+        else:
+            text = call_until_cancelled(
+                lambda: transcribe_file(audio_path, timeout=timeout, trace=trace, client_bound=client_bound,
+                                        cancelled=cancelled),
+                cancelled,
+            )
+    finally:
+        transcription_scheduler.release(client)
+    if text is not None:
+        client_registry.record_audio(client.name, audio_seconds)
+    return text
+
+
+# Как часто поток задачи проверяет отмену, пока ждёт провайдера, секунд
+CANCEL_POLL_INTERVAL = 0.1
+
+
+def call_until_cancelled(func: Callable[[], Optional[str]], cancelled: Callable[[], bool]) -> Optional[str]:
+    """Выполняет func в отдельном потоке; после cancelled() возвращает None, не дожидаясь его.
+
+    Так слот очереди освобождается сразу после отмены. Поток с запросом сам оборвёт загрузку
+    или закроет ответ, а его результат отбрасывается."""
+    outcome: dict = {}
+    done = threading.Event()
+
+    def run() -> None:
+        try:
+            outcome["value"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    # То же имя потока: профилировщик относит запрос к задаче
+    threading.Thread(target=run, name=threading.current_thread().name, daemon=True).start()
+    while not done.wait(CANCEL_POLL_INTERVAL):
+        if cancelled():
+            return None
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("value")
+
+
+def transcription_unavailable_response():
+    """503 до создания задачи, если у всех движков разомкнут автомат. None - движок доступен."""
+    breakers = [provider_breakers.get(ENGINE_ENDPOINTS.get(name, name)) for name in engine_chain()]
+    if any(breaker.would_allow() for breaker in breakers):
+        return None
+    retry_after = min(breaker.retry_after() for breaker in breakers)
+    response = jsonify({
+        "error": "Transcription provider unavailable",
+        "circuits": {breaker.name: breaker.state for breaker in breakers},
+        "retry_after": round(retry_after, 1),
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def transcribe_job(job_id: str) -> bool:
+    """Транскрибирует задачу и сохраняет результат. Возвращает True при успехе."""
+    job = jobs[job_id]
+    if job.cancelled:
+        return False
+    remaining = job.remaining()
+    if remaining is not None and remaining <= 0:
         return False
 
+    try:
+        # Не ждём дольше, чем клиент готов ждать результат
+        text = transcribe_for_client(job.client, job.audio_path, trace=job.trace,
+                                     audio_seconds=job.audio_info.duration if job.audio_info else None,
+                                     cancelled=lambda: job.cancelled, deadline=job.deadline)
+    except CircuitOpenError as e:
+        print(f"[Transcription] Задача {job_id} отклонена без запроса: {e}")
+        job.status = JobStatus.ERROR
+        job.transcription_text = f"Провайдер транскрибации временно недоступен, повторите через {math.ceil(e.retry_after)} с"
+        return False
+    if text is None or job.cancelled:
+        # При отмене во время запроса результат никому не нужен
+        return False
+    complete_job(job, text)
+    return True
+
 
-def call_openai_chat(question: str) -> str:
-    """Вызывает OpenAI Responses API для получения ответа на вопрос."""
+def complete_job(job: "TranscriptionJob", text: str) -> None:
+    job.transcription_text = text if text else "Транскрипция пуста"
+    job.status = JobStatus.READY
+    job.trace.mark("completed")
+    with open(job.transcription_path, "w", encoding="utf-8") as handle:
+        handle.write(job.transcription_text)
+    if text and archive is not None:
+        archive_transcription(job, text)
+
+
+def archive_transcription(job: "TranscriptionJob", text: str) -> None:
+    """Сохраняет результат в архив. Ошибка архива не должна ронять задачу."""
+    try:
+        archive.add(
+            os.path.splitext(os.path.basename(job.transcription_path))[0],
+            text,
+            created_at=job.created_at,
+            source=job.source,
+            duration=job.audio_info.duration if job.audio_info else None,
+        )
+    except (OSError, ValueError) as e:
+        print(f"[Archive] Не удалось сохранить транскрипцию: {e}")
+
+
+def call_openai_chat(question: str, session: Optional[ChatSession] = None,
+                     route: Optional[RouteDecision] = None, client_name: Optional[str] = None) -> str:
+    """Вызывает OpenAI Responses API для получения ответа на вопрос.
+
+    С сессией вопрос продолжает разговор: пока цепочка жива, отправляются только сам вопрос
+    и previous_response_id, иначе - локальное окно истории со сводкой.
+    Модель и веб-поиск берутся из route (по умолчанию - решение chat_router).
+    """
     import traceback
     import json as json_module
     
@@ -168,6 +772,8 @@ def call_openai_chat(question: str) -> str:
         return "OpenAI API key отсутствует"
     
     url = "https://api.openai.com/v1/responses"
+    if route is None:
+        route = chat_router.route(question)
     
     try:
         # Пробуем сначала с messages (как в Chat Completions)
@@ -178,17 +784,29 @@ def call_openai_chat(question: str) -> str:
         }
         
         # Responses API использует input вместо messages
-        payload = {
-            "model": OPENAI_MODEL,
-            "input": [
-                {"role": "system", "content": "Ты лаконично и понятно отвечаешь на вопросы пользователя."},
+        if session is not None and session.previous_response_id:
+            # Системный промпт и история уже в цепочке на стороне OpenAI
+            chat_input = [{"role": "user", "content": question}]
+        elif session is not None:
+            chat_input = session.context_input(CHAT_SYSTEM_PROMPT) + [{"role": "user", "content": question}]
+        else:
+            chat_input = [
+                {"role": "system", "content": CHAT_SYSTEM_PROMPT},
                 {"role": "user", "content": question},
-            ],
+            ]
+        payload = {
+            "model": route.model,
+            "input": chat_input,
             "temperature": 0.2,
         }
+        if session is not None:
+            if session.previous_response_id:
+                payload["previous_response_id"] = session.previous_response_id
+            # Ответ должен храниться у OpenAI, чтобы следующий вопрос мог на него сослаться
+            payload["store"] = True
         
         # Добавляем веб-поиск если включен в конфиге
-        if USE_WEB_SEARCH:
+        if route.web_search:
             payload["tools"] = [
                 {
                     "type": "web_search"
@@ -197,8 +815,8 @@ def call_openai_chat(question: str) -> str:
         
         print(f"[Responses API] 📤 Отправляю запрос:")
         print(f"  URL: {url}")
-        print(f"  Модель: {OPENAI_MODEL}")
-        print(f"  Web search: {USE_WEB_SEARCH}")
+        print(f"  Модель: {route.model}")
+        print(f"  Web search: {route.web_search}")
         print(f"  Вопрос: {question[:100]}..." if len(question) > 100 else f"  Вопрос: {question}")
         # Логируем payload без чувствительных данных
         safe_payload = {k: v for k, v in payload.items()}
@@ -207,7 +825,17 @@ def call_openai_chat(question: str) -> str:
         # Восстанавливаем полный ключ для запроса
         headers["Authorization"] = f"Bearer {OPENAI_API_KEY}"
         
-        resp = requests.post(url, headers=headers, json=payload, timeout=60)
+        breaker = provider_breakers.get("openai:responses")
+        if not breaker.allow():
+            print(f"[Responses API] ❌ Автомат разомкнут, запрос не отправляю")
+            return f"Chat error 503: провайдер временно недоступен, повторите через {math.ceil(breaker.retry_after())} с"
+        started = time.monotonic()
+        try:
+            resp = provider_http.post(url, headers=headers, json=payload, timeout=60)
+        except requests.exceptions.RequestException:
+            breaker.record(False, time.monotonic() - started)
+            raise
+        breaker.record(resp.status_code < 500 and resp.status_code != 429, time.monotonic() - started)
         
         print(f"[Responses API] 📥 Получен ответ:")
         print(f"  Статус: {resp.status_code}")
@@ -218,6 +846,12 @@ def call_openai_chat(question: str) -> str:
             print(f"[Responses API] ❌ Ошибка HTTP {resp.status_code}:")
             print(f"  Полный ответ: {error_text[:1000]}")
             
+            # Предыдущий ответ истёк или недоступен - повторяем один раз с локальной историей
+            if "previous_response_id" in payload and resp.status_code in (400, 404):
+                print(f"[Responses API] ⚠️  Цепочка ответов недоступна, повторяю с локальной историей")
+                session.reset_chain()
+                return call_openai_chat(question, session, route, client_name)
+            
             # Пробуем распарсить JSON ошибки
             try:
                 error_json = resp.json()
@@ -326,6 +960,20 @@ def call_openai_chat(question: str) -> str:
         answer = answer.strip() if answer else "Пустой ответ"
         print(f"[Responses API] ✅ Извлеченный ответ ({len(answer)} символов): {answer[:200]}..." if len(answer) > 200 else f"[Responses API] ✅ Извлеченный ответ: {answer}")
         
+        usage = data.get("usage") or {}
+        if usage:
+            cached = (usage.get("input_tokens_details") or {}).get("cached_tokens", 0)
+            print(f"[Responses API] Токены: вход {usage.get('input_tokens')} (из кэша {cached}), выход {usage.get('output_tokens')}")
+            if client_name:
+                client_registry.record_tokens(client_name, usage.get("input_tokens") or 0, usage.get("output_tokens") or 0)
+        if session is not None and answer != "Пустой ответ":
+            # Размер цепочки: весь вход этого запроса плюс ответ
+            chain_tokens = (usage.get("input_tokens") or 0) + (usage.get("output_tokens") or 0)
+            if not chain_tokens:
+                chain_tokens = sum(estimate_tokens(item["content"]) for item in chat_input) + estimate_tokens(answer)
+                chain_tokens += session.chain_tokens if "previous_response_id" in payload else 0
+            session.record_exchange(question, answer, data.get("id"), chain_tokens, chat_sessions.token_budget)
+        
         return answer
         
     except requests.exceptions.Timeout:
@@ -346,61 +994,497 @@ def call_openai_chat(question: str) -> str:
         return f"Chat exception: {error_msg}"
 
 
-@app.post("/api/audio")
-def receive_audio():
-    if "audio" not in request.files:
-        return jsonify({"error": "Missing audio"}), 400
+def save_upload(audio_file, name: str) -> str:
+    """Сохраняет загрузку в DATA_DIR с расширением по содержимому.
+
+    Whisper определяет формат по имени файла, поэтому OGG не должен называться .m4a.
+    Если формат не распознан, расширение клиента берётся только из белого списка AUDIO_MIME_TYPES:
+    иначе «x.txt» совпал бы с файлом результата, а произвольное расширение ушло бы провайдеру.
+    """
+    default = os.path.splitext(audio_file.filename or "")[1].lstrip(".").lower()
+    ext, _ = sniff_stream(audio_file.stream, default=default if default in AUDIO_MIME_TYPES else "m4a")
+    audio_path = os.path.join(DATA_DIR, f"{name}.{ext}")
+    audio_file.save(audio_path)
+    return audio_path
 
-    audio_file = request.files["audio"]
-    if audio_file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
 
-    job_id = str(uuid.uuid4())
-    audio_path = os.path.join(DATA_DIR, f"{job_id}.m4a")
+def create_job(audio_file, trace: JobTrace, batch_id: Optional[str] = None,
+               callback_url: Optional[str] = None, callback_secret: Optional[str] = None,
+               source: str = "api") -> str:
+    """Сохраняет загруженный файл и регистрирует задачу. Возвращает job_id."""
+    job_id = new_id()
     transcription_path = os.path.join(DATA_DIR, f"{job_id}.txt")
 
-    audio_file.save(audio_path)
+    audio_path = save_upload(audio_file, job_id)
+    trace.mark("persisted")
 
     jobs[job_id] = TranscriptionJob(
         audio_path=audio_path,
         transcription_path=transcription_path,
+        trace=trace,
+        batch_id=batch_id,
+        callback_url=callback_url,
+        callback_secret=callback_secret,
+        audio_info=probe_audio(audio_path),
+        source=source,
+        client=current_client(),
     )
+    return job_id
 
-    def _worker():
-        try:
-            # Всегда используем OpenAI для транскрибации (убрали fallback на AssemblyAI для ускорения)
-            ok = transcribe_with_whisper_openai(job_id)
-            if not ok:
-                # Если OpenAI не сработал, просто устанавливаем ошибку
-                if job_id in jobs:
-                    jobs[job_id].status = "error"
+
+def exceeds_audio_limit(job: TranscriptionJob) -> bool:
+    """Запись длиннее transcription.max_audio_seconds. Неизвестная длительность не отклоняется."""
+    if MAX_AUDIO_SECONDS is None or job.audio_info is None or job.audio_info.duration is None:
+        return False
+    return job.audio_info.duration > float(MAX_AUDIO_SECONDS)
+
+
+def audio_too_long_response(job: TranscriptionJob):
+    return jsonify({
+        "error": "Audio too long",
+        "duration": round(job.audio_info.duration, 3),
+        "max_audio_seconds": float(MAX_AUDIO_SECONDS),
+    }), 413
+
+
+def run_transcription_job(job_id: str) -> None:
+    """Тело фонового потока транскрибации одной задачи."""
+    job = jobs.get(job_id)
+    try:
+        # Всегда используем OpenAI для транскрибации (убрали fallback на AssemblyAI для ускорения)
+        ok = transcribe_job(job_id)
+        if ok:
+            record_processing_time(jobs.get(job_id))
+        if not ok:
+            # Если OpenAI не сработал, просто устанавливаем ошибку
+            if job_id in jobs and not jobs[job_id].cancelled:
+                if jobs[job_id].status != JobStatus.ERROR:
                     jobs[job_id].transcription_text = "Ошибка транскрибации через OpenAI"
-                    try:
-                        with open(jobs[job_id].transcription_path, "w", encoding="utf-8") as handle:
-                            handle.write(jobs[job_id].transcription_text)
-                    except:
-                        pass
-            # Закомментирован fallback на AssemblyAI для ускорения
-            # if not ok:
-            #     transcribe_with_assemblyai(job_id)
-        except Exception as e:
-            print(f"[Transcription Worker] Критическая ошибка в worker потоке: {e}")
-            import traceback
-            traceback.print_exc()
-            # Устанавливаем статус ошибки для job
-            if job_id in jobs:
-                jobs[job_id].status = "error"
-                jobs[job_id].transcription_text = f"Критическая ошибка транскрибации: {str(e)}"
+                jobs[job_id].status = JobStatus.ERROR
                 try:
                     with open(jobs[job_id].transcription_path, "w", encoding="utf-8") as handle:
                         handle.write(jobs[job_id].transcription_text)
                 except:
                     pass
+        # Закомментирован fallback на AssemblyAI для ускорения
+        # if not ok:
+        #     transcribe_with_assemblyai(job_id)
+    except Exception as e:
+        if job is not None and job.cancelled:
+            # Отменённая задача уже снята вместе с файлами: исключение движка - не ошибка
+            return
+        print(f"[Transcription Worker] Критическая ошибка в worker потоке: {e}")
+        import traceback
+        traceback.print_exc()
+        # Устанавливаем статус ошибки для job
+        if job_id in jobs:
+            jobs[job_id].status = JobStatus.ERROR
+            jobs[job_id].transcription_text = f"Критическая ошибка транскрибации: {str(e)}"
+            try:
+                with open(jobs[job_id].transcription_path, "w", encoding="utf-8") as handle:
+                    handle.write(jobs[job_id].transcription_text)
+            except:
+                pass
+    finally:
+        finish_job(job_id)
 
-    thread = threading.Thread(target=_worker, daemon=True)
+
+def start_job(job_id: str) -> None:
+    ensure_job_reaper()
+    thread = threading.Thread(target=run_transcription_job, args=(job_id,), name=f"job-{job_id}", daemon=True)
+    job = jobs[job_id]
+    job.trace.mark("queued")
+    schedule_eta(job, job.audio_info.duration if job.audio_info else None)
     thread.start()
 
-    return jsonify({"recording_id": job_id})
+
+def jobs_in_flight() -> int:
+    return sum(1 for job in list(jobs.values()) if job.status == JobStatus.PROCESSING and not job.cancelled)
+
+
+def schedule_eta(job: TranscriptionJob, audio_seconds: Optional[float]) -> None:
+    """Запоминает, когда задача должна быть готова, по длительности аудио и загрузке."""
+    job.in_flight_at_start = jobs_in_flight()
+    job.expected_done = time.monotonic() + completion_estimator.estimate(audio_seconds, job.in_flight_at_start)
+
+
+def record_processing_time(job: Optional[TranscriptionJob]) -> None:
+    """Обучает модель ETA на фактическом времени от постановки в очередь до готовности."""
+    if job is None or job.audio_info is None or job.audio_info.duration is None:
+        return
+    marks = job.trace.marks
+    if "queued" in marks and "completed" in marks:
+        completion_estimator.observe(job.audio_info.duration, job.in_flight_at_start,
+                                     marks["completed"] - marks["queued"])
+
+
+def poll_hint(job: TranscriptionJob) -> dict:
+    """Сколько осталось до готовности и через сколько секунд имеет смысл спросить снова."""
+    if job.expected_done is None:
+        return {}
+    eta = max(0.0, job.expected_done - time.monotonic())
+    # Задача опаздывает относительно оценки - опрашиваем часто, но не непрерывно
+    poll_after = eta if eta > 0 else OVERDUE_POLL_INTERVAL
+    remaining = job.remaining()
+    if remaining is not None:
+        poll_after = min(poll_after, max(remaining, OVERDUE_POLL_INTERVAL))
+    poll_after = min(poll_after, MAX_POLL_AFTER)
+    return {"eta_seconds": round(eta, 2), "poll_after": round(poll_after, 2)}
+
+
+def processing_response(payload: dict, job: TranscriptionJob):
+    """Ответ для незавершённой задачи с подсказкой опроса (в теле и в Retry-After)."""
+    hint = poll_hint(job)
+    response = jsonify({**payload, **hint})
+    if hint:
+        response.headers["Retry-After"] = str(max(1, math.ceil(hint["poll_after"])))
+    return response
+
+
+def finish_job(job_id: str) -> None:
+    """Вызывается, когда задача перешла в конечный статус (ready/error)."""
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    # Ошибочные ветки тоже считаются завершением задачи
+    job.trace.mark("completed")
+    finished_jobs.add(job_id)
+    if job.batch_id:
+        with batches_lock:
+            batch = batches.get(job.batch_id)
+            if batch is not None:
+                batch.results.append(job_result(job_id, job))
+    submit_callback(job_id, job)
+    evict_unfetched_jobs()
+
+
+def evict_unfetched_jobs() -> None:
+    """Снимает результаты, которые никто не забрал: старше jobs.result_ttl и сверх jobs.max_jobs."""
+    if handoff_target is not None:
+        # Задачи уже принадлежат преемнику
+        return
+    evicted = 0
+    for job_id in finished_jobs.evictable(len(jobs)):
+        job = jobs.get(job_id)
+        if job is not None:
+            release_job(job_id, job)
+            evicted += 1
+    if evicted:
+        print(f"[Jobs] Снято незабранных результатов: {evicted}, задач в памяти: {len(jobs)}")
+
+
+def submit_callback(job_id: str, job: TranscriptionJob) -> None:
+    # После передачи сокета результат доставит преемник
+    if job.callback_url and handoff_target is None:
+        webhook_dispatcher.submit(WebhookDelivery(
+            url=job.callback_url,
+            payload=job_result(job_id, job),
+            secret=job.callback_secret,
+            on_delivered=lambda: release_delivered_job(job_id),
+        ))
+
+
+def job_result(job_id: str, job: TranscriptionJob) -> dict:
+    if job.status == JobStatus.ERROR:
+        return {"recording_id": job_id, "status": job.status, "error": job.transcription_text}
+    return {"recording_id": job_id, "status": job.status, "transcription": job.transcription_text or ""}
+
+
+def release_job(job_id: str, job: TranscriptionJob) -> None:
+    """Удаляет аудио и задачу после того, как клиент забрал результат."""
+    # Cleanup audio once transcription is retrieved
+    for path in [job.audio_path, *job.segment_paths]:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # Remove job from store to avoid repeated cleanup
+    jobs.pop(job_id, None)
+    finished_jobs.discard(job_id)
+    retire_trace(job_id, job.trace)
+
+
+def cancel_job(job_id: str, reason: str) -> bool:
+    """Отменяет задачу и сразу удаляет её файлы. Поток провайдера увидит флаг cancelled."""
+    job = jobs.pop(job_id, None)
+    if job is None:
+        return False
+    finished_jobs.discard(job_id)
+    job.cancelled = True
+    was_processing = job.status == JobStatus.PROCESSING
+    job.status = JobStatus.CANCELLED
+    job.trace.mark("cancelled")
+    for path in [job.audio_path, job.transcription_path, *job.segment_paths]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if job.batch_id and was_processing:
+        with batches_lock:
+            batch = batches.get(job.batch_id)
+            if batch is not None:
+                batch.results.append({"recording_id": job_id, "status": JobStatus.CANCELLED, "error": reason})
+    retire_trace(job_id, job.trace)
+    print(f"[Jobs] Задача {job_id} отменена: {reason}")
+    return True
+
+
+JOB_REAPER_INTERVAL = 1.0
+_job_reaper_started = False
+_job_reaper_lock = threading.Lock()
+
+
+def ensure_job_reaper() -> None:
+    """Запускает (один раз) поток, снимающий задачи с истёкшим дедлайном клиента и незабранные результаты."""
+    global _job_reaper_started
+    with _job_reaper_lock:
+        if _job_reaper_started:
+            return
+        _job_reaper_started = True
+    threading.Thread(target=_reap_expired_jobs, name="job-reaper", daemon=True).start()
+
+
+def _reap_expired_jobs() -> None:
+    while True:
+        time.sleep(JOB_REAPER_INTERVAL)
+        if handoff_target is not None:
+            # Задачи и сессии уже принадлежат преемнику: их файлы не трогаем
+            continue
+        now = time.monotonic()
+        for job_id, job in list(jobs.items()):
+            if job.deadline is not None and job.deadline <= now:
+                cancel_job(job_id, "Истёк дедлайн клиента")
+        evict_unfetched_jobs()
+        for session_id, session in list(sessions.items()):
+            expired = session.deadline is not None and session.deadline <= now
+            if expired or now - session.last_activity > SESSION_IDLE_TIMEOUT:
+                discard_session(session_id)
+
+
+def parse_deadline(form) -> Optional[float]:
+    """Поле timeout (секунды, сколько клиент готов ждать) -> дедлайн в time.monotonic()."""
+    raw = (form.get("timeout") or "").strip()
+    if not raw:
+        return None
+    seconds = float(raw)
+    if seconds <= 0:
+        raise ValueError("timeout must be positive")
+    return time.monotonic() + seconds
+
+
+def parse_source(form, default: str) -> str:
+    """Поле source (кто прислал запись) для архива: короткий идентификатор или default."""
+    raw = (form.get("source") or "").strip().lower()
+    return raw if re.fullmatch(r"[a-z0-9_.-]{1,32}", raw) else default
+
+
+def release_delivered_job(job_id: str) -> None:
+    """Результат доставлен через webhook - опрашивать задачу больше не нужно."""
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    job.trace.mark("result_fetched")
+    release_job(job_id, job)
+
+
+@app.post("/api/audio")
+def receive_audio():
+    trace = JobTrace()
+    if "audio" not in request.files:
+        return jsonify({"error": "Missing audio"}), 400
+
+    audio_file = request.files["audio"]
+    if audio_file.filename == "":
+        return jsonify({"error": "Empty filename"}), 400
+    # Опционально: куда отправить результат вместо опроса /api/transcription
+    callback_url = (request.form.get("callback_url") or "").strip() or None
+    callback_secret = request.form.get("callback_secret") or None
+    callback_error = webhook_dispatcher.url_error(callback_url) if callback_url else None
+    if callback_error is not None:
+        return jsonify({"error": "Invalid callback_url", "detail": callback_error}), 400
+    try:
+        deadline = parse_deadline(request.form)
+    except ValueError:
+        return jsonify({"error": "Invalid timeout"}), 400
+    # Квота списывается только за запрос, который создаст задачу
+    unavailable = transcription_unavailable_response()
+    if unavailable is not None:
+        return unavailable
+    limited = rate_limited_response()
+    if limited is not None:
+        return limited
+
+    job_id = create_job(audio_file, trace, callback_url=callback_url, callback_secret=callback_secret,
+                        source=parse_source(request.form, "api"))
+    job = jobs[job_id]
+    if exceeds_audio_limit(job):
+        release_job(job_id, job)
+        return audio_too_long_response(job)
+    job.deadline = deadline
+    start_job(job_id)
+
+    response = {"recording_id": job_id}
+    if job.audio_info is not None:
+        response["audio"] = job.audio_info.to_dict()
+    return processing_response(response, job)
+
+
+def discard_session(session_id: str) -> bool:
+    """Удаляет незавершённую сессию и её сегменты."""
+    session = sessions.pop(session_id, None)
+    if session is None:
+        return False
+    session.cancelled.set()
+    for segment in session.segments:
+        try:
+            os.remove(segment.audio_path)
+        except OSError:
+            pass
+    print(f"[Sessions] Сессия {session_id} удалена")
+    return True
+
+
+def add_session_segment(session_id: str, session: UploadSession, audio_file) -> int:
+    """Сохраняет очередной сегмент и сразу отправляет его на транскрибацию."""
+    with session.lock:
+        index = len(session.segments)
+        segment = SessionSegment(audio_path=save_upload(audio_file, f"{session_id}-{index}"))
+        session.segments.append(segment)
+        session.last_activity = time.monotonic()
+    ensure_job_reaper()
+    threading.Thread(target=_transcribe_segment, args=(session, segment), name=f"segment-{session_id}-{index}",
+                     daemon=True).start()
+    return index
+
+
+def _transcribe_segment(session: UploadSession, segment: SessionSegment) -> None:
+    try:
+        # Таймлайн сессии отмечает отправку первого сегмента к провайдеру
+        info = probe_audio(segment.audio_path)
+        segment.text = transcribe_for_client(session.client, segment.audio_path, trace=session.trace,
+                                             audio_seconds=info.duration if info else None,
+                                             cancelled=session.cancelled.is_set, deadline=session.deadline)
+    except Exception as e:
+        if session.cancelled.is_set():
+            # Файлы сегмента удалены вместе с сессией: исключение движка - не ошибка
+            return
+        print(f"[Sessions] Ошибка транскрибации сегмента {segment.audio_path}: {e}")
+        segment.error = str(e)
+    finally:
+        segment.done.set()
+
+
+def run_session_job(job_id: str, session: UploadSession) -> None:
+    """Собирает текст задачи из сегментов, которые транскрибировались по мере загрузки."""
+    try:
+        job = jobs.get(job_id)
+        if job is None:
+            return
+        texts = []
+        for segment in session.segments:
+            # Отмена задачи (в том числе по дедлайну клиента) будит ожидание, а не ждёт сегмент
+            while not segment.done.wait(CANCEL_POLL_INTERVAL):
+                if job.cancelled:
+                    break
+            if job.cancelled:
+                # Сегменты, которые ещё распознаются, обрывают свои вызовы провайдера
+                session.cancelled.set()
+                return
+            if segment.text is None:
+                job.status = JobStatus.ERROR
+                job.transcription_text = "Ошибка транскрибации сегмента записи" + (
+                    f": {segment.error}" if segment.error else "")
+                with open(job.transcription_path, "w", encoding="utf-8") as handle:
+                    handle.write(job.transcription_text)
+                return
+            if segment.text.strip():
+                texts.append(segment.text.strip())
+        complete_job(job, " ".join(texts))
+    except Exception as e:
+        print(f"[Sessions] Критическая ошибка сборки задачи {job_id}: {e}")
+        job = jobs.get(job_id)
+        if job is not None:
+            job.status = JobStatus.ERROR
+            job.transcription_text = f"Критическая ошибка транскрибации: {str(e)}"
+    finally:
+        finish_job(job_id)
+
+
+@app.post("/api/session")
+def open_session():
+    """Открывает сессию потоковой загрузки. Поле timeout работает как в /api/audio."""
+    try:
+        deadline = parse_deadline(request.form)
+    except ValueError:
+        return jsonify({"error": "Invalid timeout"}), 400
+    unavailable = transcription_unavailable_response()
+    if unavailable is not None:
+        return unavailable
+    limited = rate_limited_response()
+    if limited is not None:
+        return limited
+    session_id = new_id()
+    sessions[session_id] = UploadSession(deadline=deadline, source=parse_source(request.form, "session"),
+                                         client=current_client())
+    return jsonify({"session_id": session_id})
+
+
+@app.post("/api/session/<session_id>/chunk")
+def append_session_chunk(session_id: str):
+    """Принимает очередной самостоятельный сегмент записи (целый аудиофайл) в поле audio."""
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    audio_file = request.files.get("audio")
+    if audio_file is None or audio_file.filename == "":
+        return jsonify({"error": "Missing audio"}), 400
+    index = add_session_segment(session_id, session, audio_file)
+    return jsonify({"session_id": session_id, "segment": index})
+
+
+@app.post("/api/session/<session_id>/finalize")
+def finalize_session(session_id: str):
+    """Закрывает сессию (можно приложить последний сегмент) и превращает её в обычную задачу."""
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown session"}), 404
+    audio_file = request.files.get("audio")
+    if audio_file is not None and audio_file.filename:
+        add_session_segment(session_id, session, audio_file)
+    sessions.pop(session_id, None)
+    if not session.segments:
+        return jsonify({"error": "Missing audio"}), 400
+
+    session.trace.mark("persisted")
+    segment_paths = [segment.audio_path for segment in session.segments]
+    jobs[session_id] = TranscriptionJob(
+        audio_path=segment_paths[0],
+        transcription_path=os.path.join(DATA_DIR, f"{session_id}.txt"),
+        trace=session.trace,
+        deadline=session.deadline,
+        segment_paths=segment_paths[1:],
+        audio_info=probe_segments(segment_paths),
+        source=session.source,
+        created_at=session.created_at,
+        client=session.client,
+    )
+    session.trace.mark("queued")
+    # Остальные сегменты уже распознаются - ждать осталось в основном хвост
+    tail = session.segments[-1].audio_path
+    tail_info = probe_audio(tail) if len(segment_paths) > 1 else jobs[session_id].audio_info
+    schedule_eta(jobs[session_id], tail_info.duration if tail_info else None)
+    threading.Thread(target=run_session_job, args=(session_id, session), name=f"job-{session_id}",
+                     daemon=True).start()
+    return processing_response({"recording_id": session_id}, jobs[session_id])
+
+
+@app.delete("/api/session/<session_id>")
+def delete_session(session_id: str):
+    if not discard_session(session_id):
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify({"session_id": session_id, "status": "cancelled"})
 
 
 @app.get("/api/transcription/<job_id>")
@@ -409,31 +1493,170 @@ def get_transcription(job_id: str):
     if not job:
         return jsonify({"error": "Unknown job"}), 404
 
-    if job.status == "error":
+    job.trace.mark("first_poll")
+    if job.status == JobStatus.ERROR:
+        if job.trace.mark("result_fetched"):
+            trace_exporter.export(job.trace.to_otlp_spans(job_id))
         return jsonify({"status": job.status, "error": job.transcription_text}), 200
-    if job.status != "ready":
-        return jsonify({"status": job.status})
+    if job.status != JobStatus.READY:
+        return processing_response({"status": job.status}, job)
 
     transcription = job.transcription_text or ""
-
-    # Cleanup audio once transcription is retrieved
-    if os.path.exists(job.audio_path):
-        try:
-            os.remove(job.audio_path)
-        except OSError:
-            pass
+    job.trace.mark("result_fetched")
 
     response = jsonify({
         "status": job.status,
         "transcription": transcription,
     })
 
-    # Remove job from store to avoid repeated cleanup
-    jobs.pop(job_id, None)
+    release_job(job_id, job)
 
     return response
 
 
+@app.post("/api/batch")
+def receive_batch():
+    """Принимает несколько файлов (поле audio, повторяется) одним multipart-запросом."""
+    received = JobTrace()
+    audio_files = [f for f in request.files.getlist("audio") if f.filename]
+    if not audio_files:
+        return jsonify({"error": "Missing audio"}), 400
+    unavailable = transcription_unavailable_response()
+    if unavailable is not None:
+        return unavailable
+    try:
+        deadline = parse_deadline(request.form)
+    except ValueError:
+        return jsonify({"error": "Invalid timeout"}), 400
+    limited = rate_limited_response()
+    if limited is not None:
+        return limited
+
+    batch_id = new_id()
+    batch = TranscriptionBatch()
+    with batches_lock:
+        batches[batch_id] = batch
+
+    for audio_file in audio_files:
+        # Все файлы пакета пришли одним запросом
+        job_id = create_job(audio_file, received.clone(), batch_id=batch_id,
+                            source=parse_source(request.form, "batch"))
+        jobs[job_id].deadline = deadline
+        batch.job_ids.append(job_id)
+        if exceeds_audio_limit(jobs[job_id]):
+            # Пакет принимается целиком или не принимается вовсе
+            rejected = jobs[job_id]
+            for created_id in batch.job_ids:
+                release_job(created_id, jobs[created_id])
+            with batches_lock:
+                batches.pop(batch_id, None)
+            return audio_too_long_response(rejected)
+    for job_id in batch.job_ids:
+        start_job(job_id)
+
+    return jsonify({"batch_id": batch_id, "recording_ids": batch.job_ids})
+
+
+@app.get("/api/batch/<batch_id>")
+def get_batch(batch_id: str):
+    """Готовые результаты пакета в порядке завершения, начиная с позиции cursor."""
+    try:
+        cursor = max(0, int(request.args.get("cursor", 0)))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    with batches_lock:
+        batch = batches.get(batch_id)
+        if batch is None:
+            return jsonify({"error": "Unknown batch"}), 404
+        # Снимок под тем же замком, под которым потоки задач дописывают результаты
+        completed = len(batch.results)
+        items = batch.results[cursor:completed]
+        next_cursor = cursor + len(items)
+        total = len(batch.job_ids)
+        done = completed == total
+        # Пакет удаляется, когда клиент дочитал все результаты
+        if done and next_cursor >= total:
+            batches.pop(batch_id, None)
+
+    for item in items:
+        job = jobs.get(item["recording_id"])
+        if job is not None:
+            job.trace.mark("first_poll")
+            job.trace.mark("result_fetched")
+            release_job(item["recording_id"], job)
+
+    return jsonify({
+        "batch_id": batch_id,
+        "total": total,
+        "completed": completed,
+        "items": items,
+        "next_cursor": next_cursor,
+        "done": done,
+    })
+
+
+@app.delete("/api/transcription/<job_id>")
+def delete_transcription(job_id: str):
+    """Отмена задачи клиентом: результат больше не нужен, файлы удаляются сразу."""
+    if not cancel_job(job_id, "Отменено клиентом"):
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"recording_id": job_id, "status": "cancelled"})
+
+
+@app.get("/api/transcription/<job_id>/trace")
+def get_transcription_trace(job_id: str):
+    """Таймлайн задачи: когда пришёл запрос, ушёл к провайдеру, был забран клиентом и т.д."""
+    job = jobs.get(job_id)
+    if job is not None:
+        response = {"recording_id": job_id, "status": job.status, **job.trace.to_dict()}
+        if job.audio_info is not None:
+            response["audio"] = job.audio_info.to_dict()
+        return jsonify(response)
+
+    with finished_traces_lock:
+        trace = finished_traces.get(job_id)
+    if trace is None:
+        return jsonify({"error": "Unknown job"}), 404
+    status = "cancelled" if "cancelled" in trace.marks else "fetched"
+    return jsonify({"recording_id": job_id, "status": status, **trace.to_dict()})
+
+
+def is_chat_answer(answer: str) -> bool:
+    """call_openai_chat возвращает ошибки текстом; отличаем их от ответа модели."""
+    return not answer.startswith(("Chat error", "Chat exception", "OpenAI API key", "Ошибка парсинга", "Пустой ответ"))
+
+
+def route_question(question: str, params) -> RouteDecision:
+    """Решение роутера с подсказками клиента: kind (format/summary/ask), model и web_search."""
+    web_search = params.get("web_search")
+    return chat_router.route(
+        question,
+        kind=params.get("kind"),
+        model=(params.get("model") or "").strip() or None,
+        web_search=None if web_search is None else str(web_search).lower() in ("1", "true", "yes"),
+    )
+
+
+def answer_question(question: str, route: RouteDecision, session_id: Optional[str] = None,
+                    new_session: bool = False) -> dict:
+    """Ответ модели: {"answer": ...}, для разговора с состоянием ещё и session_id."""
+    started = time.monotonic()
+    # session_id продолжает разговор, session: true начинает новый; без них запрос без состояния
+    if not (session_id or new_session):
+        answer = scheduled_chat(question, route=route)
+        chat_router.record(route, question, (time.monotonic() - started) * 1000, is_chat_answer(answer))
+        return {"answer": answer}
+    session, created = chat_sessions.get_or_create(session_id)
+    if created and session_id:
+        print(f"[Chat] Сессия {session_id} не найдена или истекла, начинаю новую")
+    # Вопросы одной сессии выполняются по очереди, чтобы цепочка не ветвилась
+    with session.lock:
+        answer = scheduled_chat(question, session, route)
+    chat_router.record(route, question, (time.monotonic() - started) * 1000, is_chat_answer(answer))
+    return {"answer": answer, "session_id": session.session_id}
+
+
 @app.post("/api/chat")
 def chat_endpoint():
     try:
@@ -441,36 +1664,825 @@ def chat_endpoint():
         question = (payload.get("question") or "").strip()
         if not question:
             return jsonify({"answer": "Ошибка: вопрос не указан"}), 200
-        answer = call_openai_chat(question)
+        route = route_question(question, payload)
+        limited = rate_limited_response()
+        if limited is not None:
+            return limited
         # Всегда возвращаем {"answer": "..."} даже при ошибках, чтобы фронтенд мог декодировать
-        return jsonify({"answer": answer})
+        return jsonify(answer_question(question, route, payload.get("session_id"), bool(payload.get("session"))))
     except Exception as e:
         # При исключении тоже возвращаем в формате answer, чтобы фронтенд мог декодировать
         return jsonify({"answer": f"Ошибка сервера: {str(e)}"}), 200
 
 
-def start_telegram_bot():
-    """Запускает телеграм бота в отдельном потоке"""
+@app.post("/api/ask")
+def ask_endpoint():
+    """Голосовой вопрос за один запрос: запись -> транскрибация -> ответ модели.
+
+    Без stream ответ приходит одним JSON. С stream=1 (или Accept: application/x-ndjson)
+    события идут строками NDJSON по мере готовности: accepted, transcription, answer.
+    """
+    trace = JobTrace()
+    if "audio" not in request.files:
+        return jsonify({"error": "Missing audio"}), 400
+
+    audio_file = request.files["audio"]
+    if audio_file.filename == "":
+        return jsonify({"error": "Empty filename"}), 400
+    try:
+        deadline = parse_deadline(request.form)
+    except ValueError:
+        return jsonify({"error": "Invalid timeout"}), 400
+    unavailable = transcription_unavailable_response()
+    if unavailable is not None:
+        return unavailable
+    limited = rate_limited_response()
+    if limited is not None:
+        return limited
+
+    job_id = create_job(audio_file, trace, source=parse_source(request.form, "ask"))
+    job = jobs[job_id]
+    if exceeds_audio_limit(job):
+        release_job(job_id, job)
+        return audio_too_long_response(job)
+    job.deadline = deadline
+    # Поля формы копируются: генератор читает их уже после разбора запроса
+    params = request.form.to_dict()
+    events = ask_events(job_id, job, params)
+
+    stream = str(params.get("stream") or request.args.get("stream") or "").lower() in ("1", "true", "yes")
+    if stream or "application/x-ndjson" in request.headers.get("Accept", ""):
+        lines = (json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        # X-Accel-Buffering: обратный прокси не должен копить строки до конца ответа
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    result = {"recording_id": job_id}
+    for event in events:
+        kind = event.pop("event")
+        if kind == "error":
+            return jsonify({"recording_id": job_id, **event}), 502
+        if kind != "accepted":
+            result.update(event)
+    return jsonify(result)
+
+
+def ask_events(job_id: str, job: TranscriptionJob, params: dict):
+    """Этапы /api/ask: транскрибация в потоке запроса, затем вопрос к модели с текстом записи."""
+    ensure_job_reaper()
+    job.trace.mark("queued")
+    schedule_eta(job, job.audio_info.duration if job.audio_info else None)
+    accepted = {"event": "accepted", "recording_id": job_id, **poll_hint(job)}
+    if job.audio_info is not None:
+        accepted["audio"] = job.audio_info.to_dict()
+    yield accepted
+
+    run_transcription_job(job_id)
+    if jobs.get(job_id) is not job:
+        # Задачу отменил дедлайн клиента, файлы уже удалены
+        yield {"event": "error", "error": "Задача отменена"}
+        return
+    job.trace.mark("result_fetched")
+    release_job(job_id, job)
+    if job.status != JobStatus.READY:
+        yield {"event": "error", "error": job.transcription_text or "Ошибка транскрибации"}
+        return
+    question = (job.transcription_text or "").strip()
+    yield {"event": "transcription", "transcription": question}
+
+    if not question:
+        yield {"event": "answer", "answer": "Ошибка: вопрос не распознан"}
+        return
+    try:
+        answer = answer_question(question, route_question(question, params), params.get("session_id"),
+                                 str(params.get("session") or "").lower() in ("1", "true", "yes"))
+    except Exception as e:
+        # Как и /api/chat: ошибка сервера приходит текстом ответа
+        answer = {"answer": f"Ошибка сервера: {str(e)}"}
+    yield {"event": "answer", **answer}
+
+
+def scheduled_chat(question: str, session: Optional[ChatSession] = None,
+                   route: Optional[RouteDecision] = None) -> str:
+    """call_openai_chat через справедливую очередь клиента."""
+    client = current_client()
+    waited = chat_scheduler.acquire(client, timeout=60.0)
+    if waited is None:
+        client_registry.record_wait(client.name, 60.0)
+        return "Chat error: сервер перегружен, повторите позже"
+    client_registry.record_wait(client.name, waited)
+    try:
+        return call_openai_chat(question, session, route, client.name)
+    finally:
+        chat_scheduler.release(client)
+
+
+@app.delete("/api/chat/<session_id>")
+def delete_chat_session(session_id: str):
+    """Завершает чат-сессию: следующий вопрос начнёт разговор заново."""
+    if not chat_sessions.discard(session_id):
+        return jsonify({"error": "Unknown session"}), 404
+    return jsonify({"session_id": session_id, "status": "closed"})
+
+
+@app.get("/api/usage")
+def client_usage():
+    """Потребление клиента (секунды аудио, токены, ожидание в очереди). Админ видит всех клиентов."""
+    client = current_client()
+    if client.admin:
+        return jsonify({
+            "client": client.name,
+            "usage": client_registry.usage(),
+            "schedulers": {
+                "transcription": transcription_scheduler.snapshot(),
+                "chat": chat_scheduler.snapshot(),
+            },
+        })
+    return jsonify({"client": client.name, "usage": client_registry.usage(client.name)[client.name]})
+
+
+def parse_search_time(raw: Optional[str], end_of_day: bool = False) -> Optional[float]:
+    """since/until: unix-время или ISO-дата/время (локальное). Дата без времени в until - весь день."""
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(raw)
+    if end_of_day and len(raw) == 10:
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
+
+@app.get("/api/search")
+def search_archive():
+    """Поиск по архиву: q (слова, префиксы со *), since, until, source, limit."""
+    if archive is None:
+        return jsonify({"error": "Archive is disabled"}), 404
+    if not archive.loaded:
+        return jsonify({"error": "Archive is loading"}), 503, {"Retry-After": "1"}
+    try:
+        since = parse_search_time(request.args.get("since"))
+        until = parse_search_time(request.args.get("until"), end_of_day=True)
+        limit = min(max(1, int(request.args.get("limit", 20))), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return jsonify({"error": "Invalid since, until or limit"}), 400
+    query = request.args.get("q", "")
+    started = time.perf_counter()
+    total, hits = archive.search(query, since=since, until=until,
+                                 source=request.args.get("source") or None, limit=limit)
+    return jsonify({
+        "query": query,
+        "total": total,
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        "results": [hit.to_dict() for hit in hits],
+    })
+
+
+def load_archive() -> None:
+    """Строит индекс архива в фоне; до окончания /api/search отвечает 503."""
+    started = time.monotonic()
+    try:
+        archive.load()
+        component_states["archive"] = "ready"
+    except OSError as e:
+        component_states["archive"] = f"failed: {e}"
+    startup_timings["archive_load_ms"] = round((time.monotonic() - started) * 1000, 3)
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: процесс жив и обслуживает HTTP."""
+    return jsonify({"status": "ok", "uptime_s": round(time.monotonic() - IMPORT_STARTED, 3)})
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: готовность по компонентам. 503, пока обязательные компоненты не готовы."""
+    ready = all(component_states.get(name) == "ready" for name in REQUIRED_COMPONENTS)
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "pid": os.getpid(),
+        "components": dict(component_states),
+        "startup": startup_timings,
+        # Разомкнутый автомат не делает сервер неготовым: задачи отклоняются быстро или уходят в резерв
+        "circuits": provider_breakers.snapshot(),
+    }
+    if WORKER_COUNT > 1:
+        body["worker"] = {"id": WORKER_ID, "count": WORKER_COUNT, "pid": os.getpid()}
+    return jsonify(body), (200 if ready else 503)
+
+
+def debug_guard():
+    """Проверка токена диагностики; ?worker=N пересылает запрос воркеру N. None - обработать здесь."""
+    token = request.headers.get("X-Debug-Token") or ""
+    auth = request.headers.get("Authorization", "")
+    if not token and auth.lower().startswith("bearer "):
+        token = auth[7:].strip()
+    if not hmac.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+        return jsonify({"error": "Invalid or missing debug token"}), 401
+    worker = request.args.get("worker", type=int)
+    if worker is not None and WORKER_COUNT > 1 and worker != WORKER_ID and not forwarded_by_worker():
+        if not 0 <= worker < WORKER_COUNT:
+            return jsonify({"error": "Unknown worker"}), 404
+        return forward_to_worker(worker)
+    return None
+
+
+def debug_profile():
+    """Сэмплирующий профилировщик: seconds (по умолчанию 10), interval_ms (5), idle=0 - без ожидающих потоков.
+
+    Ответ - свёрнутые стеки «корень;...;лист число» для flamegraph.pl или speedscope."""
+    denied = debug_guard()
+    if denied is not None:
+        return denied
+    seconds = min(max(request.args.get("seconds", 10.0, type=float), 0.1), MAX_PROFILE_SECONDS)
+    interval = min(max(request.args.get("interval_ms", 5.0, type=float), 1.0), 1000.0) / 1000
+    result = profiler.profile(seconds, interval, include_idle=request.args.get("idle", "1") != "0")
+    if result is None:
+        return jsonify({"error": "Profiling already in progress"}), 409
+    print(f"[Debug] Профиль {result['elapsed']:.1f} с: {result['samples']} сэмплов, "
+          f"{len(result['stacks'])} стеков")
+    return Response(format_collapsed(result["stacks"]), mimetype="text/plain",
+                    headers={"X-Profile-Samples": str(result["samples"])})
+
+
+def debug_threads():
+    """Стеки всех потоков и задача (статус, последний этап) или запрос, который обслуживает каждый."""
+    denied = debug_guard()
+    if denied is not None:
+        return denied
+    threads = thread_dump()
+    for thread in threads:
+        job = jobs.get(thread["job"]) if thread["job"] else None
+        if job is not None:
+            thread["job_status"] = job.status
+            thread["job_stage"] = max(job.trace.marks, key=job.trace.marks.get)
+    if request.args.get("format") == "text":
+        lines = []
+        for thread in threads:
+            about = thread["job"] or thread["request"]
+            lines.append(f"--- {thread['name']} ({thread['ident']})" + (f" [{about}]" if about else ""))
+            lines.extend(f"    {frame}" for frame in thread["stack"])
+        return Response("\n".join(lines) + "\n", mimetype="text/plain")
+    return jsonify({"pid": os.getpid(), "threads": threads})
+
+
+def debug_memory():
+    """Первый GET включает tracemalloc (frames - глубина стека), следующие возвращают топ-N роста
+    памяти с прошлого снимка (top, key: lineno / filename / traceback). DELETE выключает трассировку."""
+    denied = debug_guard()
+    if denied is not None:
+        return denied
+    if request.method == "DELETE":
+        allocation_tracker.stop()
+        return jsonify({"tracing": False})
+    if not allocation_tracker.tracing:
+        allocation_tracker.start(request.args.get("frames", 1, type=int))
+        print("[Debug] tracemalloc включён")
+        return jsonify({"tracing": True, "started": True})
+    key_type = request.args.get("key", "lineno")
+    if key_type not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "key must be lineno, filename or traceback"}), 400
+    return jsonify({"tracing": True, **allocation_tracker.diff(request.args.get("top", 20, type=int), key_type)})
+
+
+def label_request_thread():
+    request_labels[threading.get_ident()] = f"{request.method} {request.path}"
+
+
+def unlabel_request_thread(exc):
+    request_labels.pop(threading.get_ident(), None)
+
+
+# Без debug.enabled маршрутов и хуков нет вовсе: на обычные запросы диагностика не влияет
+if DEBUG_TOKEN:
+    app.add_url_rule("/debug/profile", view_func=debug_profile, methods=["GET"])
+    app.add_url_rule("/debug/threads", view_func=debug_threads, methods=["GET"])
+    app.add_url_rule("/debug/memory", view_func=debug_memory, methods=["GET", "DELETE"])
+    app.before_request(label_request_thread)
+    app.teardown_request(unlabel_request_thread)
+
+
+def prewarm_provider_connections() -> None:
+    """Заранее открывает TLS-соединение к OpenAI, чтобы первая задача не платила за рукопожатие."""
+    if not OPENAI_API_KEY:
+        return
+    started = time.monotonic()
+    try:
+        # Ответ не важен (без ключа будет 401) - важно, что соединение осталось в пуле
+        provider_http.head("https://api.openai.com/v1/models", timeout=5)
+        component_states["openai"] = "ready"
+    except requests.exceptions.RequestException as e:
+        component_states["openai"] = f"failed: {e}"
+    startup_timings["openai_prewarm_ms"] = round((time.monotonic() - started) * 1000, 3)
+
+
+def set_telegram_state(state: str) -> None:
+    component_states["telegram"] = state
+
+
+TELEGRAM_CONFIG = config.get("telegram") or {}
+# В webhook-режиме бот запускается в каждом воркере (getUpdates из нескольких процессов конфликтовал бы);
+# условие совпадает с telegram_bot.WEBHOOK_MODE
+TELEGRAM_WEBHOOK_MODE = (TELEGRAM_CONFIG.get("mode") == "webhook" and bool(TELEGRAM_CONFIG.get("webhook_url"))
+                         and bool(TELEGRAM_CONFIG.get("secret_token")))
+# Приёмник обновлений Telegram в webhook-режиме; задаётся при запуске бота
+telegram_webhook_handler: Optional[Callable[[Optional[dict], Optional[str]], int]] = None
+
+
+@app.post("/telegram/webhook")
+def telegram_webhook():
+    """Точка приёма обновлений Telegram (telegram.mode = webhook)."""
+    if telegram_webhook_handler is None:
+        if component_states.get("telegram") == "pending":
+            # Бот ещё запускается (например, ждёт остановки предшественника): Telegram повторит
+            return jsonify({"error": "Bot is starting"}), 503, {"Retry-After": "1"}
+        return jsonify({"error": "Webhook mode is disabled"}), 404
+    status = telegram_webhook_handler(
+        request.get_json(silent=True),
+        request.headers.get("X-Telegram-Bot-Api-Secret-Token"),
+    )
+    return jsonify({"ok": status == 200}), status
+
+
+def start_telegram_bot(restored: Optional[dict] = None):
+    """Запускает телеграм бота в отдельном потоке. restored - журнал обновлений из контрольной точки."""
+    global telegram_webhook_handler, telegram_module
     try:
-        # Небольшая задержка, чтобы Flask успел запуститься
-        time.sleep(2)
+        # Стек python-telegram-bot импортируем лениво, уже после старта HTTP-сервера
+        started = time.monotonic()
         print("🔄 Инициализация Telegram бота...", flush=True)
-        from telegram_bot import run_bot
+        import telegram_bot
+        startup_timings["telegram_import_ms"] = round((time.monotonic() - started) * 1000, 3)
+        if telegram_bot.WEBHOOK_MODE:
+            telegram_webhook_handler = telegram_bot.submit_webhook_update
         print("✅ Модуль telegram_bot загружен, запускаю бота...", flush=True)
-        run_bot()
+        telegram_module = telegram_bot
+        # Webhook у Telegram регистрирует один процесс
+        telegram_bot.run_bot(on_state=set_telegram_state, restored=restored, register_webhook=WORKER_ID == 0)
     except Exception as e:
+        set_telegram_state(f"failed: {e}")
         print(f"❌ Ошибка запуска Telegram бота: {e}", flush=True)
         import traceback
         traceback.print_exc()
 
 
+# Модуль telegram_bot после запуска бота: остановка получения обновлений и их журнал
+telegram_module = None
+# Журнал обновлений из контрольной точки, пока бот его не подхватил
+restored_telegram_state: Optional[dict] = None
+
+
+def telegram_checkpoint() -> Optional[dict]:
+    if telegram_module is not None:
+        return telegram_module.update_journal.snapshot()
+    return restored_telegram_state
+
+
+def checkpoint_path() -> str:
+    """В многопроцессном режиме у каждого воркера своя контрольная точка."""
+    if WORKER_COUNT <= 1:
+        return CHECKPOINT_PATH
+    root, ext = os.path.splitext(CHECKPOINT_PATH)
+    return f"{root}-w{WORKER_ID}{ext}"
+
+
+def deadline_to_wall(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else time.time() + (deadline - time.monotonic())
+
+
+def wall_to_deadline(at: Optional[float]) -> Optional[float]:
+    return None if at is None else time.monotonic() + (at - time.time())
+
+
+def job_checkpoint(job: TranscriptionJob) -> dict:
+    eta = job.expected_done - time.monotonic() if job.expected_done is not None else None
+    return {
+        "audio_path": job.audio_path,
+        "transcription_path": job.transcription_path,
+        "status": job.status,
+        "transcription_text": job.transcription_text,
+        "batch_id": job.batch_id,
+        "callback_url": job.callback_url,
+        "callback_secret": job.callback_secret,
+        "deadline_at": deadline_to_wall(job.deadline),
+        "segment_paths": job.segment_paths,
+        "source": job.source,
+        "created_at": job.created_at,
+        "client": job.client.name if job.client else None,
+        "eta_seconds": max(0.0, eta) if eta is not None else None,
+    }
+
+
+def job_from_checkpoint(data: dict) -> TranscriptionJob:
+    paths = [data["audio_path"], *(data.get("segment_paths") or [])]
+    audio_info = None
+    if all(os.path.exists(path) for path in paths):
+        audio_info = probe_segments(paths) if len(paths) > 1 else probe_audio(paths[0])
+    job = TranscriptionJob(
+        audio_path=data["audio_path"],
+        transcription_path=data["transcription_path"],
+        status=data.get("status", JobStatus.PROCESSING),
+        transcription_text=data.get("transcription_text"),
+        batch_id=data.get("batch_id"),
+        callback_url=data.get("callback_url"),
+        callback_secret=data.get("callback_secret"),
+        deadline=wall_to_deadline(data.get("deadline_at")),
+        segment_paths=paths[1:],
+        audio_info=audio_info,
+        source=data.get("source", "api"),
+        created_at=data.get("created_at") or time.time(),
+        client=client_registry.find(data.get("client")),
+    )
+    job.trace.mark("persisted")
+    return job
+
+
+def session_checkpoint(session: UploadSession) -> dict:
+    return {
+        "segments": [{"audio_path": segment.audio_path, "text": segment.text, "error": segment.error}
+                     for segment in session.segments],
+        "deadline_at": deadline_to_wall(session.deadline),
+        "source": session.source,
+        "created_at": session.created_at,
+        "client": session.client.name if session.client else None,
+    }
+
+
+def restore_session(session_id: str, data: dict) -> None:
+    session = UploadSession(deadline=wall_to_deadline(data.get("deadline_at")),
+                            source=data.get("source", "session"),
+                            created_at=data.get("created_at") or time.time(),
+                            client=client_registry.find(data.get("client")))
+    for item in data.get("segments") or []:
+        segment = SessionSegment(audio_path=item["audio_path"], text=item.get("text"), error=item.get("error"))
+        session.segments.append(segment)
+        if segment.text is not None or segment.error is not None:
+            segment.done.set()
+        elif not os.path.exists(segment.audio_path):
+            segment.error = "Сегмент потерян при перезапуске сервера"
+            segment.done.set()
+        else:
+            # Сегмент не успел распознаться до остановки - распознаём заново
+            threading.Thread(target=_transcribe_segment, args=(session, segment),
+                             name=f"segment-{session_id}-{len(session.segments) - 1}", daemon=True).start()
+    sessions[session_id] = session
+
+
+def capture_state() -> dict:
+    """Снимок задач, пакетов и сессий для контрольной точки."""
+    with batches_lock:
+        batch_state = {batch_id: {"job_ids": list(batch.job_ids), "results": list(batch.results)}
+                       for batch_id, batch in batches.items()}
+    return {
+        "jobs": {job_id: job_checkpoint(job) for job_id, job in list(jobs.items()) if not job.cancelled},
+        "batches": batch_state,
+        "sessions": {session_id: session_checkpoint(session) for session_id, session in list(sessions.items())},
+    }
+
+
+def save_checkpoint(phase: str) -> None:
+    state = capture_state()
+    state["phase"] = phase
+    state["telegram"] = telegram_checkpoint()
+    path = checkpoint_path()
+    write_checkpoint(path, state)
+    pending = len((state["telegram"] or {}).get("pending") or [])
+    print(f"[Lifecycle] Контрольная точка {path} ({phase}): задач {len(state['jobs'])}, "
+          f"сессий {len(state['sessions'])}, пакетов {len(state['batches'])}, обновлений Telegram {pending}",
+          flush=True)
+
+
+def fail_restored_job(job_id: str, job: TranscriptionJob, reason: str) -> None:
+    job.status = JobStatus.ERROR
+    job.transcription_text = reason
+    try:
+        with open(job.transcription_path, "w", encoding="utf-8") as handle:
+            handle.write(reason)
+    except OSError:
+        pass
+    finish_job(job_id)
+
+
+def resume_job(job_id: str) -> None:
+    """Запускает заново задачу из контрольной точки: аудио на диске, результата ещё нет."""
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    paths = [job.audio_path, *job.segment_paths]
+    if not all(os.path.exists(path) for path in paths):
+        fail_restored_job(job_id, job, "Запись потеряна при перезапуске сервера")
+        return
+    if not job.segment_paths:
+        start_job(job_id)
+        return
+    # Задача из сессии: сегменты распознаются заново параллельно, как при загрузке
+    ensure_job_reaper()
+    session = UploadSession(trace=job.trace, segments=[SessionSegment(audio_path=path) for path in paths],
+                            deadline=job.deadline, source=job.source, client=job.client)
+    job.trace.mark("queued")
+    schedule_eta(job, job.audio_info.duration if job.audio_info else None)
+    for index, segment in enumerate(session.segments):
+        threading.Thread(target=_transcribe_segment, args=(session, segment), name=f"segment-{job_id}-{index}",
+                         daemon=True).start()
+    threading.Thread(target=run_session_job, args=(job_id, session), name=f"job-{job_id}", daemon=True).start()
+
+
+def restore_checkpoint(run_bot: bool) -> None:
+    """Подхватывает контрольную точку прошлого запуска (или предшественника при передаче сокета)."""
+    global restored_telegram_state
+    path = checkpoint_path()
+    state = read_checkpoint(path)
+    predecessor = predecessor_pid()
+    adopting = (state is not None and state.get("phase") == "handoff" and predecessor is not None
+                and state.get("pid") == predecessor)
+    if state is not None:
+        remove_checkpoint(path)
+        restored_telegram_state = state.get("telegram")
+        with batches_lock:
+            for batch_id, data in (state.get("batches") or {}).items():
+                batches[batch_id] = TranscriptionBatch(job_ids=data["job_ids"], results=data["results"])
+        for session_id, data in (state.get("sessions") or {}).items():
+            restore_session(session_id, data)
+        unfinished = []
+        for job_id, data in (state.get("jobs") or {}).items():
+            job = jobs[job_id] = job_from_checkpoint(data)
+            if job.status == JobStatus.PROCESSING or job.callback_url:
+                unfinished.append(job_id)
+            if job.status != JobStatus.PROCESSING:
+                finished_jobs.add(job_id)
+            if adopting and job.status == JobStatus.PROCESSING and data.get("eta_seconds") is not None:
+                job.expected_done = time.monotonic() + data["eta_seconds"]
+        print(f"[Lifecycle] Восстановлено из {path}: задач {len(state.get('jobs') or {})}, "
+              f"сессий {len(state.get('sessions') or {})}, незавершённых {len(unfinished)}", flush=True)
+        if adopting:
+            # Вызовы провайдера доделывает предшественник: результаты придут в его последней точке
+            threading.Thread(target=adopt_from_predecessor, args=(predecessor, unfinished, run_bot),
+                             name="handoff-adopt", daemon=True).start()
+            return
+        for job_id in unfinished:
+            job = jobs[job_id]
+            if job.status == JobStatus.PROCESSING:
+                resume_job(job_id)
+            else:
+                submit_callback(job_id, job)
+    if run_bot:
+        threading.Thread(target=start_telegram_bot, args=(restored_telegram_state,), daemon=True).start()
+    else:
+        set_telegram_state("disabled")
+
+
+def adopt_from_predecessor(predecessor: int, job_ids: List[str], run_bot: bool) -> None:
+    """Ждёт последнюю контрольную точку предшественника и забирает из неё результаты."""
+    global restored_telegram_state
+    path = checkpoint_path()
+    final = None
+    while final is None:
+        state = read_checkpoint(path)
+        if state is not None and state.get("phase") == "final" and state.get("pid") == predecessor:
+            final = state
+            remove_checkpoint(path)
+        elif not predecessor_alive(predecessor):
+            # Предшественник завершился без контрольной точки: всё незавершённое запускаем сами
+            print(f"[Lifecycle] Предшественник {predecessor} завершился без контрольной точки", flush=True)
+            break
+        else:
+            time.sleep(0.2)
+    final_jobs = (final or {}).get("jobs") or {}
+    resumed = 0
+    for job_id in job_ids:
+        job = jobs.get(job_id)
+        data = final_jobs.get(job_id)
+        if job is None:
+            # Клиент отменил задачу здесь, пока предшественник её доделывал
+            if data is not None:
+                for path_to_remove in (data["transcription_path"], data["audio_path"], *data["segment_paths"]):
+                    try:
+                        os.remove(path_to_remove)
+                    except OSError:
+                        pass
+            continue
+        if final is not None and data is None:
+            # Результат уже доставлен предшественником через webhook
+            jobs.pop(job_id, None)
+            finished_jobs.discard(job_id)
+            retire_trace(job_id, job.trace)
+        elif data is not None and data["status"] in (JobStatus.READY, JobStatus.ERROR):
+            was_processing = job.status == JobStatus.PROCESSING
+            job.transcription_text = data["transcription_text"]
+            job.status = data["status"]
+            if was_processing:
+                finish_job(job_id)
+            else:
+                submit_callback(job_id, job)
+        elif job.status == JobStatus.PROCESSING:
+            resumed += 1
+            resume_job(job_id)
+        else:
+            submit_callback(job_id, job)
+    print(f"[Lifecycle] Задачи предшественника приняты: {len(job_ids)}, запущено заново {resumed}", flush=True)
+    if final is not None and final.get("telegram") is not None:
+        restored_telegram_state = final["telegram"]
+    # Бот предшественника остановлен: два getUpdates одновременно конфликтуют
+    if run_bot:
+        start_telegram_bot(restored_telegram_state)
+    else:
+        set_telegram_state("disabled")
+
+
+def work_in_progress() -> int:
+    """Задачи, сегменты сессий и обновления Telegram, которые ещё обрабатываются."""
+    busy = jobs_in_flight()
+    busy += sum(1 for session in list(sessions.values()) for segment in session.segments if not segment.done.is_set())
+    if telegram_module is not None:
+        busy += telegram_module.update_journal.pending_count()
+    return busy
+
+
+def wait_for_work(deadline: float) -> bool:
+    while time.monotonic() < deadline:
+        if not work_in_progress():
+            return True
+        time.sleep(0.2)
+    return not work_in_progress()
+
+
+def stop_receiving_telegram_updates() -> None:
+    if telegram_module is not None:
+        telegram_module.stop_receiving_updates()
+
+
+def stop_gracefully(server) -> None:
+    """SIGTERM: новые задачи получают 503, текущие доделываются, остальное - в контрольную точку."""
+    global drain_mode
+    drain_mode = "stopping"
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    print(f"[Lifecycle] Остановка: новые задачи не принимаются, жду текущие до {DRAIN_TIMEOUT:.0f} с", flush=True)
+    stop_receiving_telegram_updates()
+    if not wait_for_work(deadline):
+        print(f"[Lifecycle] Не завершено к дедлайну: {work_in_progress()} - продолжит следующий запуск", flush=True)
+    server.shutdown()
+    wait_for_connections(deadline)
+    save_checkpoint("final")
+
+
+def wait_for_connections(deadline: float) -> None:
+    """После остановки приёма закрывает простаивающие соединения и дожидается запросов на остальных."""
+    connection_tracker.close_idle()
+    if not connection_tracker.wait_closed(max(1.0, deadline - time.monotonic())):
+        print(f"[Lifecycle] Не закрылись к дедлайну соединений: {connection_tracker.open}", flush=True)
+    request_gauge.wait_idle(max(1.0, deadline - time.monotonic()))
+
+
+def loopback_url(server) -> str:
+    host, port = server.server_address[:2]
+    if host in ("0.0.0.0", ""):
+        host = "127.0.0.1"
+    elif host == "::":
+        host = "::1"
+    return f"http://[{host}]:{port}" if ":" in host else f"http://{host}:{port}"
+
+
+def hand_off(server) -> None:
+    """SIGUSR2: передаёт слушающий сокет новому процессу без простоя."""
+    global drain_mode, handoff_target
+    handoff_decided.clear()
+    drain_mode = "handoff"
+    print("[Lifecycle] Передача сокета: новые запросы ждут, дожидаюсь текущих", flush=True)
+    if not request_gauge.wait_idle(HANDOFF_TIMEOUT, mutating_only=True):
+        abort_handoff("текущие запросы не завершились")
+        return
+    save_checkpoint("handoff")
+    successor = Successor.spawn(server.socket)
+    print(f"[Lifecycle] Запущен преемник (pid {successor.pid}), жду готовности", flush=True)
+    if not successor.wait_ready(HANDOFF_TIMEOUT):
+        successor.kill()
+        remove_checkpoint(checkpoint_path())
+        abort_handoff(f"преемник не запустился за {HANDOFF_TIMEOUT:.0f} с")
+        return
+    # Сокет остаётся открытым у преемника: соединения ждут в очереди ядра и принимаются им
+    server.shutdown()
+    handoff_target = loopback_url(server)
+    # Сессии загрузки уже у преемника; их файлы теперь принадлежат ему
+    sessions.clear()
+    handoff_decided.set()
+    # Простаивающие keep-alive соединения закрываются сразу: клиенты переподключатся к преемнику
+    connection_tracker.close_idle()
+    print(f"[Lifecycle] Сокет передан преемнику {successor.pid}, доделываю вызовы провайдера", flush=True)
+    stop_receiving_telegram_updates()
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    if not wait_for_work(deadline):
+        print(f"[Lifecycle] Не завершено к дедлайну: {work_in_progress()} - запустит преемник", flush=True)
+    wait_for_connections(deadline)
+    save_checkpoint("final")
+
+
+def abort_handoff(reason: str) -> None:
+    global drain_mode, handoff_target
+    print(f"[Lifecycle] Передача сокета отменена: {reason}. Продолжаю работу", flush=True)
+    handoff_target = None
+    drain_mode = None
+    handoff_decided.set()
+
+
+def install_lifecycle_signals(server, allow_handoff: bool) -> None:
+    """SIGTERM/SIGINT - плавная остановка, SIGUSR2 - передача сокета (только в однопроцессном режиме)."""
+    def start(target):
+        def handler(signum, frame):
+            global _drain_thread
+            if _drain_thread is not None and _drain_thread.is_alive():
+                if signum == signal.SIGINT:
+                    # Повторный Ctrl+C - немедленный выход без контрольной точки
+                    print("[Lifecycle] Повторный SIGINT: выхожу без контрольной точки", flush=True)
+                    os._exit(130)
+                print(f"[Lifecycle] Сигнал {signum} проигнорирован: остановка уже идёт", flush=True)
+                return
+            if drain_mode is not None:
+                return
+            _drain_thread = threading.Thread(target=target, args=(server,), name="drain", daemon=True)
+            _drain_thread.start()
+        return handler
+
+    def handoff_unsupported(signum, frame):
+        print("[Lifecycle] SIGUSR2 поддерживается только в однопроцессном режиме", flush=True)
+
+    signal.signal(signal.SIGTERM, start(stop_gracefully))
+    signal.signal(signal.SIGINT, start(stop_gracefully))
+    signal.signal(signal.SIGUSR2, start(hand_off) if allow_handoff else handoff_unsupported)
+
+
+def serve_until_drained(server) -> None:
+    server.serve_forever()
+    # serve_forever вернулся: дожидаемся записи контрольной точки
+    if _drain_thread is not None:
+        _drain_thread.join()
+
+
+startup_timings["import_ms"] = round((time.monotonic() - IMPORT_STARTED) * 1000, 3)
+
+
+def start_background_services(run_bot: bool = True) -> None:
+    """Прогрев соединений, загрузка архива и Telegram бот стартуют в фоне и не задерживают
+    начало обслуживания. Контрольная точка прошлого запуска восстанавливается сразу."""
+    threading.Thread(target=prewarm_provider_connections, daemon=True).start()
+    if archive is not None:
+        threading.Thread(target=load_archive, daemon=True).start()
+    restore_checkpoint(run_bot)
+
+
+def run_worker(worker_id: int, listen_socket) -> None:
+    """Тело воркера в многопроцессном режиме (вызывается супервизором после fork)."""
+    from werkzeug.serving import make_server
+
+    global WORKER_ID, WORKER_PREFIX, connection_tracker
+    WORKER_ID = worker_id
+    WORKER_PREFIX = f"w{worker_id}-"
+    chat_sessions.id_prefix = WORKER_PREFIX
+    # Канал пробуждения трекера не должен быть общим с другими воркерами после fork
+    connection_tracker = ConnectionTracker()
+    # Внутренний адрес для запросов, пересланных другими воркерами
+    internal = make_server("127.0.0.1", INTERNAL_BASE_PORT + worker_id, app, threaded=True)
+    threading.Thread(target=internal.serve_forever, name="internal-http", daemon=True).start()
+    # В режиме polling бот один на все процессы, иначе getUpdates конфликтуют
+    start_background_services(run_bot=worker_id == 0 or TELEGRAM_WEBHOOK_MODE)
+    public = make_server(listen_socket.getsockname()[0], listen_socket.getsockname()[1], app,
+                         threaded=True, fd=listen_socket.fileno(),
+                         request_handler=connection_tracker.request_handler())
+    install_lifecycle_signals(public, allow_handoff=False)
+    print(f"[Workers] Воркер {worker_id} (pid {os.getpid()}) готов, внутренний порт {INTERNAL_BASE_PORT + worker_id}",
+          flush=True)
+    serve_until_drained(public)
+
+
 if __name__ == "__main__":
-    # Запускаем Telegram бота в отдельном потоке
-    telegram_bot_thread = threading.Thread(target=start_telegram_bot, daemon=True)
-    telegram_bot_thread.start()
-    
+    import argparse
+    from werkzeug.serving import make_server
+
+    parser = argparse.ArgumentParser(description="Бэкенд PushToType")
+    parser.add_argument("--workers", type=int, default=int(WORKERS_CONFIG.get("count", 1)),
+                        help="число процессов-воркеров на общем порту (по умолчанию workers.count или 1)")
+    args = parser.parse_args()
+    print(f"⏱  server.py импортирован за {startup_timings['import_ms']:.1f} мс")
+
     # Используем порт из конфига или ENV
     port = int(os.environ.get("PORT", config.get("backend", {}).get("port", 5000)))
     host = config.get("backend", {}).get("host", "0.0.0.0")
-    print(f"🚀 Запуск Flask сервера на {host}:{port}")
-    app.run(host=host, debug=False, port=port)
+    if args.workers > 1:
+        WORKER_COUNT = args.workers
+        INTERNAL_BASE_PORT = INTERNAL_BASE_PORT or port + 100
+        print(f"🚀 Запуск {WORKER_COUNT} воркеров Flask на {host}:{port}")
+        Supervisor(WORKER_COUNT, host, port, run_worker).run()
+    else:
+        # После SIGUSR2 предшественник передаёт уже открытый слушающий сокет
+        listen_socket = inherited_listen_socket()
+        server = make_server(host, port, app, threaded=True,
+                             fd=listen_socket.fileno() if listen_socket is not None else None,
+                             request_handler=connection_tracker.request_handler())
+        install_lifecycle_signals(server, allow_handoff=True)
+        start_background_services()
+        print(f"🚀 Запуск Flask сервера на {host}:{port} (pid {os.getpid()})", flush=True)
+        notify_ready()
+        serve_until_drained(server)
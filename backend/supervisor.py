@@ -0,0 +1,116 @@
+"""Многопроцессный режим: супервизор заранее запускает N воркеров на одном порту.
+
+Один процесс Python упирается в GIL на одном ядре. Супервизор делает fork воркеров после
+импорта приложения (общие страницы памяти), следит за ними и перезапускает упавших.
+Слушающий сокет: на Linux каждый воркер открывает свой с SO_REUSEPORT, и ядро само
+распределяет соединения; где это не даёт балансировки (macOS), воркеры принимают
+соединения с одного сокета, открытого супервизором до fork.
+"""
+
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+# Воркер, упавший быстрее этого после запуска, перезапускается с задержкой
+MIN_WORKER_LIFETIME = 1.0
+RESTART_BACKOFF = 2.0
+
+
+def reuse_port_balances() -> bool:
+    """SO_REUSEPORT распределяет соединения между сокетами только на Linux."""
+    return hasattr(socket, "SO_REUSEPORT") and sys.platform.startswith("linux")
+
+
+def open_listen_socket(host: str, port: int, reuse_port: bool, backlog: int = 128) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Запускает run_worker(номер, сокет) в N дочерних процессах и держит их живыми."""
+
+    def __init__(self, workers: int, host: str, port: int,
+                 run_worker: Callable[[int, socket.socket], None]) -> None:
+        self.workers = max(1, workers)
+        self.host = host
+        self.port = port
+        self.run_worker = run_worker
+        self.reuse_port = reuse_port_balances()
+        self._shared_socket: Optional[socket.socket] = None
+        self._children: Dict[int, tuple] = {}  # pid -> (номер воркера, время запуска)
+        self._stopping = False
+
+    def run(self) -> None:
+        if not self.reuse_port:
+            self._shared_socket = open_listen_socket(self.host, self.port, reuse_port=False)
+        mode = "SO_REUSEPORT" if self.reuse_port else "общий сокет"
+        print(f"[Supervisor] Запускаю {self.workers} воркеров на {self.host}:{self.port} ({mode})", flush=True)
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGUSR2, self._handoff_unsupported)
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            worker_id, started = self._children.pop(pid, (None, 0.0))
+            if worker_id is None or self._stopping:
+                continue
+            lifetime = time.monotonic() - started
+            print(f"[Supervisor] Воркер {worker_id} (pid {pid}) завершился со статусом {status}, "
+                  f"проработав {lifetime:.1f} с - перезапускаю", flush=True)
+            if lifetime < MIN_WORKER_LIFETIME:
+                time.sleep(RESTART_BACKOFF)
+            self._spawn(worker_id)
+        print("[Supervisor] Все воркеры остановлены", flush=True)
+
+    def _spawn(self, worker_id: int) -> None:
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (worker_id, time.monotonic())
+            return
+        # Дочерний процесс: сигналы по умолчанию, свой сокет или унаследованный
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        code = 0
+        try:
+            sock = self._shared_socket or open_listen_socket(self.host, self.port, reuse_port=True)
+            self.run_worker(worker_id, sock)
+        except KeyboardInterrupt:
+            pass
+        except BaseException as e:
+            print(f"[Supervisor] Воркер {worker_id} упал: {e}", flush=True)
+            code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+
+    def _stop(self, signum, frame) -> None:
+        if self._stopping:
+            return
+        self._stopping = True
+        print(f"[Supervisor] Получен сигнал {signum}, останавливаю воркеров", flush=True)
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _handoff_unsupported(self, signum, frame) -> None:
+        # Воркеры слушают порт каждый своим сокетом и владеют своими задачами: передать их целиком
+        # одним дескриптором нельзя. SIGTERM останавливает воркеров с контрольными точками
+        print("[Supervisor] SIGUSR2 (передача сокета) в многопроцессном режиме не поддерживается", flush=True)
@@ -1,24 +1,141 @@
+import asyncio
+import hmac
 import json
 import os
 import sys
+import tempfile
+import threading
 import time
-import uuid
-from typing import Optional
+from typing import IO, Callable, Dict, List, Optional, Set
 
 import requests
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import (Application, ApplicationHandlerStop, CommandHandler, ContextTypes, MessageHandler,
+                          TypeHandler, filters)
 
-# Настраиваем вывод без буферизации для немедленного логирования
-sys.stdout.reconfigure(line_buffering=True)
-sys.stderr.reconfigure(line_buffering=True)
+from audio_probe import sniff_stream
+from local_formatter import FormattingPolicy, format_locally
+from multipart_stream import MultipartStream
+from telegram_status import EditRateLimiter, StatusMessageUpdater
 
 # Загружаем конфиг
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.json")
+CONFIG_PATH = os.environ.get("PUSHTOTYPE_CONFIG") or os.path.join(os.path.dirname(__file__), "..", "config.json")
 with open(CONFIG_PATH, "r", encoding="utf-8") as f:
     config = json.load(f)
 
 TELEGRAM_BOT_TOKEN = config["api_keys"].get("telegram_bot")
+
+# Режим получения обновлений: polling (по умолчанию) или webhook через HTTP-сервер бэкенда
+TELEGRAM_CONFIG = config.get("telegram") or {}
+WEBHOOK_URL = TELEGRAM_CONFIG.get("webhook_url", "")
+WEBHOOK_SECRET = TELEGRAM_CONFIG.get("secret_token", "")
+WEBHOOK_MODE = TELEGRAM_CONFIG.get("mode", "polling") == "webhook"
+if WEBHOOK_MODE and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    print("⚠️  Для webhook-режима нужны telegram.webhook_url и telegram.secret_token, использую polling")
+    WEBHOOK_MODE = False
+# Сколько обновлений обрабатывается одновременно
+MAX_CONCURRENT_UPDATES = int(TELEGRAM_CONFIG.get("max_concurrent_updates", 8))
+
+# Файлы до этого размера скачиваются только в память; крупнее - во временный файл
+IN_MEMORY_DOWNLOAD_LIMIT = int(TELEGRAM_CONFIG.get("in_memory_download_limit", 8 * 1024 * 1024))
+
+# Ключ бота как клиента API бэкенда (clients.tenants): свой вес и квоты в очереди к провайдеру
+BACKEND_HEADERS = {"Authorization": f"Bearer {TELEGRAM_CONFIG['api_key']}"} if TELEGRAM_CONFIG.get("api_key") else {}
+
+# Короткие и уже размеченные транскрипции форматируются локально, без запроса к LLM
+FORMATTING_POLICY = FormattingPolicy.from_config(config.get("formatting") or {})
+
+# Общие лимиты правок статусных сообщений (Telegram ограничивает частоту по чату и по боту)
+STATUS_EDIT_LIMITER = EditRateLimiter(
+    per_chat_interval=float(TELEGRAM_CONFIG.get("status_edit_interval", 1.0)),
+    global_per_second=float(TELEGRAM_CONFIG.get("status_edits_per_second", 25)),
+)
+
+
+class BackendRestarting(Exception):
+    """Бэкенд перезапускается и не принимает новые задачи: обновление обработает следующий запуск."""
+
+
+class UpdateJournal:
+    """Полученные, но ещё не обработанные обновления и смещение обработанных.
+
+    getUpdates подтверждает обновления сразу при получении, поэтому незаконченные при остановке
+    сервера сохраняются в его контрольную точку и после перезапуска обрабатываются заново.
+    Обновления, которые Telegram доставит повторно, но которые уже обработаны, пропускаются.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[int, dict] = {}
+        # id последнего обработанного обновления + 1
+        self.offset = 0
+        self._restored_offset = 0
+        self._replay: Set[int] = set()
+        self._replayed: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def restore(self, state: Optional[dict]) -> List[dict]:
+        """Загружает состояние из контрольной точки. Возвращает обновления для повторной обработки."""
+        state = state or {}
+        pending = [item for item in state.get("pending") or [] if isinstance(item, dict) and "update_id" in item]
+        with self._lock:
+            self.offset = self._restored_offset = int(state.get("offset") or 0)
+            self._replay = {int(item["update_id"]) for item in pending}
+        return pending
+
+    def accept(self, update: Update) -> bool:
+        """Записывает обновление в журнал. False - повтор уже обработанного."""
+        update_id = update.update_id
+        with self._lock:
+            if update_id in self._pending:
+                # Повторная доставка webhook, пока обновление ещё обрабатывается
+                return False
+            if update_id in self._replay:
+                if update_id in self._replayed:
+                    return False
+                self._replayed.add(update_id)
+            elif update_id < self._restored_offset:
+                return False
+            self._pending[update_id] = update.to_dict()
+            return True
+
+    def finished(self, update_id: int) -> None:
+        with self._lock:
+            self._pending.pop(update_id, None)
+            self.offset = max(self.offset, update_id + 1)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"offset": self.offset, "pending": [self._pending[key] for key in sorted(self._pending)]}
+
+
+update_journal = UpdateJournal()
+
+
+class JournaledUpdateQueue(asyncio.Queue):
+    """Очередь обновлений приложения: записывает их в журнал и отбрасывает повторы."""
+
+    def put_nowait(self, item) -> None:
+        if isinstance(item, Update) and not update_journal.accept(item):
+            print(f"[Telegram] Обновление {item.update_id} уже обработано или поставлено в очередь повторно, пропускаю")
+            return
+        super().put_nowait(item)
+
+
+async def mark_update_processed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Последняя группа обработчиков: обновление обработано (в том числе с ошибкой)."""
+    update_journal.finished(update.update_id)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет блокирующий HTTP-вызов в пуле потоков, не останавливая event loop бота."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -37,45 +154,47 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
-def upload_audio_to_backend(audio_path: str) -> Optional[str]:
-    """Загружает аудио файл на бэкенд через API. Возвращает recording_id или None."""
+def upload_audio_to_backend(audio: IO[bytes], timeout_seconds: Optional[int] = None) -> Optional[dict]:
+    """Загружает аудио из буфера на бэкенд через API.
+
+    Возвращает ответ бэкенда (recording_id и подсказку poll_after) или None.
+    """
     try:
         base_url = (config["backend"]["base_url"]).rstrip("/")
         upload_url = f"{base_url}/api/audio"
         
-        print(f"[Backend] Загружаю файл на бэкенд: {upload_url}")
-        print(f"[Backend] Файл: {audio_path}, размер: {os.path.getsize(audio_path)} байт")
+        # Формат определяем по содержимому, а не по расширению: голосовые - это OGG/Opus
+        file_ext, content_type = sniff_stream(audio)
         
-        # Определяем content-type по расширению файла
-        file_ext = os.path.splitext(audio_path)[1].lower()
-        content_type = "audio/m4a"  # По умолчанию
-        if file_ext == ".ogg":
-            content_type = "audio/ogg"
-        elif file_ext == ".m4a":
-            content_type = "audio/m4a"
-        elif file_ext == ".mp3":
-            content_type = "audio/mpeg"
-        elif file_ext == ".wav":
-            content_type = "audio/wav"
+        print(f"[Backend] Загружаю файл на бэкенд: {upload_url}")
+        print(f"[Backend] Формат: {file_ext} ({content_type})")
         
-        # Бэкенд ожидает файл с именем "audio.m4a", но принимает любой формат
-        with open(audio_path, "rb") as f:
-            files = {"audio": ("audio.m4a", f, content_type)}
-            resp = requests.post(upload_url, files=files, timeout=30)
+        # source - для архива транскрипций на бэкенде
+        fields = {"source": "telegram"}
+        # Сообщаем бэкенду, сколько мы готовы ждать: после этого задача будет снята
+        if timeout_seconds:
+            fields["timeout"] = str(timeout_seconds)
+        # Тело отдаётся кусками из буфера: вторая копия файла в памяти не создаётся
+        with MultipartStream(fields=fields, files=[("audio", f"audio.{file_ext}", audio, content_type)]) as body:
+            resp = requests.post(upload_url, data=body, headers={**BACKEND_HEADERS, **body.headers}, timeout=30)
         
         print(f"[Backend] Ответ на загрузку: статус {resp.status_code}")
+        if resp.status_code == 503 and "restarting" in resp.text:
+            raise BackendRestarting()
         if resp.status_code == 200:
             data = resp.json() or {}
             recording_id = data.get("recording_id")
             if recording_id:
-                print(f"[Backend] Получен recording_id: {recording_id}")
-                return recording_id
+                print(f"[Backend] Получен recording_id: {recording_id}, ожидаемая готовность через {data.get('eta_seconds')} с")
+                return data
             else:
                 print(f"[Backend] Не получен recording_id в ответе: {data}")
                 return None
         else:
             print(f"[Backend] Ошибка загрузки: {resp.status_code} {resp.text[:200]}")
             return None
+    except BackendRestarting:
+        raise
     except Exception as e:
         print(f"[Backend] Исключение при загрузке: {e}")
         import traceback
@@ -102,8 +221,8 @@ def format_text_with_chatgpt(text: str) -> Optional[str]:
         print(f"[ChatGPT] Отправляю запрос на форматирование: {chat_url}")
         resp = requests.post(
             chat_url,
-            json={"question": prompt},
-            headers={"Content-Type": "application/json"},
+            json={"question": prompt, "kind": "format"},
+            headers={"Content-Type": "application/json", **BACKEND_HEADERS},
             timeout=60
         )
         
@@ -149,8 +268,8 @@ def create_short_summary_with_chatgpt(text: str) -> Optional[str]:
         print(f"[ChatGPT] Отправляю запрос на создание короткой версии: {chat_url}")
         resp = requests.post(
             chat_url,
-            json={"question": prompt},
-            headers={"Content-Type": "application/json"},
+            json={"question": prompt, "kind": "summary"},
+            headers={"Content-Type": "application/json", **BACKEND_HEADERS},
             timeout=60
         )
         
@@ -174,8 +293,28 @@ def create_short_summary_with_chatgpt(text: str) -> Optional[str]:
         return None
 
 
-def poll_transcription_from_backend(recording_id: str, timeout_seconds: int = 180) -> Optional[str]:
-    """Опрашивает бэкенд для получения транскрипции. Возвращает текст или None."""
+def cancel_transcription_on_backend(recording_id: str) -> None:
+    """Отменяет задачу на бэкенде, чтобы он не ждал провайдера и удалил файлы."""
+    try:
+        base_url = (config["backend"]["base_url"]).rstrip("/")
+        resp = requests.delete(f"{base_url}/api/transcription/{recording_id}", headers=BACKEND_HEADERS, timeout=10)
+        print(f"[Backend] Отмена задачи {recording_id}: статус {resp.status_code}")
+    except Exception as e:
+        print(f"[Backend] Исключение при отмене задачи: {e}")
+
+
+def hinted_poll_interval(poll_after: float, started: float, timeout_seconds: int) -> float:
+    """Интервал по подсказке бэкенда, но не короче 0.1 с и не дольше оставшегося таймаута."""
+    left = timeout_seconds - (time.time() - started)
+    return max(0.1, min(float(poll_after), left))
+
+
+def poll_transcription_from_backend(recording_id: str, timeout_seconds: int = 180,
+                                    first_poll_after: Optional[float] = None) -> Optional[str]:
+    """Опрашивает бэкенд для получения транскрипции. Возвращает текст или None.
+
+    Если бэкенд подсказал poll_after, опрос идёт к ожидаемому моменту готовности.
+    """
     try:
         base_url = (config["backend"]["base_url"]).rstrip("/")
         poll_url = f"{base_url}/api/transcription/{recording_id}"
@@ -185,15 +324,18 @@ def poll_transcription_from_backend(recording_id: str, timeout_seconds: int = 18
         started = time.time()
         poll_interval = 0.5  # Начинаем с 0.5 секунды
         max_interval = 3.0   # Максимум 3 секунды между запросами
+        if first_poll_after is not None:
+            poll_interval = hinted_poll_interval(first_poll_after, started, timeout_seconds)
         
         while True:
             if time.time() - started > timeout_seconds:
                 print(f"[Backend] Таймаут опроса ({timeout_seconds} секунд)")
+                cancel_transcription_on_backend(recording_id)
                 return None
             
             time.sleep(poll_interval)
             
-            resp = requests.get(poll_url, timeout=10)
+            resp = requests.get(poll_url, headers=BACKEND_HEADERS, timeout=10)
             print(f"[Backend] Статус опроса: {resp.status_code}")
             
             if resp.status_code == 404:
@@ -220,8 +362,11 @@ def poll_transcription_from_backend(recording_id: str, timeout_seconds: int = 18
                 # Сохраняем ошибку для показа пользователю
                 return f"ERROR:{error_msg}"
             elif status == "processing":
-                # Увеличиваем интервал опроса
-                poll_interval = min(poll_interval * 1.5, max_interval)
+                if data.get("poll_after") is not None:
+                    poll_interval = hinted_poll_interval(data["poll_after"], started, timeout_seconds)
+                else:
+                    # Увеличиваем интервал опроса
+                    poll_interval = min(poll_interval * 1.5, max_interval)
                 continue
             else:
                 print(f"[Backend] Неизвестный статус: {status}, полный ответ: {data}")
@@ -255,29 +400,16 @@ async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if message.voice:
         print(f"🎤 Получено голосовое сообщение (длительность: {message.voice.duration}с, размер: {message.voice.file_size} байт)")
         file = await context.bot.get_file(message.voice.file_id)
-        file_extension = "ogg"  # Голосовые сообщения в Telegram всегда в формате OGG
     # Проверяем аудио файл
     elif message.audio:
         print(f"🎵 Получен аудио файл: {message.audio.file_name or 'без имени'}")
         file = await context.bot.get_file(message.audio.file_id)
-        # Определяем расширение из имени файла или используем m4a по умолчанию
-        if message.audio.file_name:
-            ext = os.path.splitext(message.audio.file_name)[1].lstrip(".")
-            file_extension = ext if ext else "m4a"
-        else:
-            file_extension = "m4a"
     # Проверяем документ (аудио файл отправлен как документ)
     elif message.document:
         mime_type = getattr(message.document, 'mime_type', None)
         if mime_type and mime_type.startswith("audio/"):
             print(f"📄 Получен аудио документ: {message.document.file_name or 'без имени'}, mime_type={mime_type}")
             file = await context.bot.get_file(message.document.file_id)
-            # Определяем расширение из имени файла
-            if message.document.file_name:
-                ext = os.path.splitext(message.document.file_name)[1].lstrip(".")
-                file_extension = ext if ext else "m4a"
-            else:
-                file_extension = "m4a"
         else:
             # Это не аудио документ, игнорируем
             return
@@ -296,70 +428,68 @@ async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
             duration_info = f" ({duration}с)"
     
     status_message = await message.reply_text(f"🎤 Получено аудио сообщение{duration_info}\n🔄 Начинаю обработку...")
+    # Правки статуса идут в фоне и не задерживают обработку
+    status = StatusMessageUpdater(status_message, STATUS_EDIT_LIMITER)
     
+    # Небольшие файлы остаются в памяти, крупные документы уходят на диск - пиковая память ограничена
+    audio_buffer = tempfile.SpooledTemporaryFile(max_size=IN_MEMORY_DOWNLOAD_LIMIT, dir=DATA_DIR)
     try:
-
-        # Создаём уникальное имя файла
-        job_id = str(uuid.uuid4())
-        
-        audio_path = os.path.join(DATA_DIR, f"{job_id}.{file_extension}")
-        
         # Скачиваем файл
-        print(f"📥 Скачиваю файл в: {audio_path}")
-        await status_message.edit_text(f"🎤 Получено аудио сообщение{duration_info}\n📥 Скачиваю файл...")
-        await file.download_to_drive(custom_path=audio_path)
+        # Формат определяется по содержимому при отправке на бэкенд
+        print("📥 Скачиваю файл в буфер")
+        status.set(f"🎤 Получено аудио сообщение{duration_info}\n📥 Скачиваю файл...")
+        await file.download_to_memory(out=audio_buffer)
         
+        file_size = audio_buffer.tell()
         # Проверяем, что файл скачался
-        if not os.path.exists(audio_path):
-            await status_message.edit_text("❌ Ошибка: файл не был скачан.")
+        if file_size == 0:
+            await status.finish("❌ Ошибка: файл не был скачан.")
             return
-        
-        file_size = os.path.getsize(audio_path)
+        audio_buffer.seek(0)
         print(f"✅ Файл скачан, размер: {file_size} байт")
         
         # Обновляем статус
-        await status_message.edit_text(f"🎤 Получено аудио сообщение{duration_info}\n🔄 Загружаю на бэкенд...")
+        status.set(f"🎤 Получено аудио сообщение{duration_info}\n🔄 Загружаю на бэкенд...")
         
         # Загружаем файл на бэкенд через API (как фронтенд)
-        recording_id = upload_audio_to_backend(audio_path)
+        upload = await run_blocking(upload_audio_to_backend, audio_buffer, timeout_seconds=180)
+        # Буфер больше не нужен: освобождаем память (или временный файл) до ожидания транскрипции
+        audio_buffer.close()
         
-        if not recording_id:
-            await status_message.edit_text("❌ Ошибка: не удалось загрузить файл на бэкенд.")
-            # Удаляем временный файл
-            try:
-                if os.path.exists(audio_path):
-                    os.remove(audio_path)
-            except OSError:
-                pass
+        if not upload:
+            await status.finish("❌ Ошибка: не удалось загрузить файл на бэкенд.")
             return
+        recording_id = upload["recording_id"]
         
         # Обновляем статус
-        await status_message.edit_text(f"🎤 Получено аудио сообщение{duration_info}\n🔄 Делаю транскрипцию...")
+        status.set(f"🎤 Получено аудио сообщение{duration_info}\n🔄 Делаю транскрипцию...")
         
         # Опрашиваем бэкенд для получения транскрипции (как фронтенд)
         print(f"🔄 Ожидаю транскрипцию для recording_id: {recording_id}")
-        transcription = poll_transcription_from_backend(recording_id, timeout_seconds=180)
+        transcription = await run_blocking(poll_transcription_from_backend, recording_id, timeout_seconds=180,
+                                           first_poll_after=upload.get("poll_after"))
         
         print(f"📝 Результат транскрипции: {'получен' if transcription else 'не получен'}")
         
-        # Удаляем временный файл
-        try:
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-        except OSError:
-            pass
-        
         # Отправляем результат
         if transcription:
             # Проверяем, не является ли это ошибкой от бэкенда
             if transcription.startswith("ERROR:"):
                 error_msg = transcription[6:]  # Убираем префикс "ERROR:"
-                await status_message.edit_text(f"❌ Ошибка транскрипции:\n\n{error_msg}")
+                await status.finish(f"❌ Ошибка транскрипции:\n\n{error_msg}")
             else:
                 # Форматируем текст через ChatGPT
-                await status_message.edit_text(f"🎤 Получено аудио сообщение{duration_info}\n✅ Транскрипция получена\n🎨 Форматирую текст...")
+                status.set(f"🎤 Получено аудио сообщение{duration_info}\n✅ Транскрипция получена\n🎨 Форматирую текст...")
                 
-                formatted_text = format_text_with_chatgpt(transcription)
+                started = time.monotonic()
+                complexity = FORMATTING_POLICY.complexity(transcription)
+                if complexity > FORMATTING_POLICY.llm_threshold:
+                    formatted_text = await run_blocking(format_text_with_chatgpt, transcription)
+                    tier = "LLM"
+                else:
+                    formatted_text = format_locally(transcription, FORMATTING_POLICY)
+                    tier = "локально"
+                print(f"[Format] {tier}: сложность {complexity:.2f}, {(time.monotonic() - started) * 1000:.1f} мс")
                 
                 if not formatted_text:
                     # Если форматирование не удалось, используем оригинальную транскрипцию
@@ -367,9 +497,9 @@ async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     formatted_text = transcription
                 
                 # Создаем короткую версию
-                await status_message.edit_text(f"🎤 Получено аудио сообщение{duration_info}\n✅ Транскрипция получена\n📝 Создаю короткую версию...")
+                status.set(f"🎤 Получено аудио сообщение{duration_info}\n✅ Транскрипция получена\n📝 Создаю короткую версию...")
                 
-                short_version = create_short_summary_with_chatgpt(formatted_text)
+                short_version = await run_blocking(create_short_summary_with_chatgpt, formatted_text)
                 
                 # Отправляем обе версии
                 # Сначала короткую версию
@@ -384,30 +514,102 @@ async def process_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 # Удаляем статусное сообщение
                 try:
+                    await status.discard()
                     await status_message.delete()
                 except:
                     pass
         else:
-            await status_message.edit_text("❌ Не удалось получить транскрипцию. Попробуй ещё раз.")
+            await status.finish("❌ Не удалось получить транскрипцию. Попробуй ещё раз.")
             
+    except BackendRestarting:
+        # Обновление остаётся в журнале необработанным и попадёт в контрольную точку сервера
+        print("[Backend] Бэкенд перезапускается, сообщение будет обработано после перезапуска")
+        await status.finish("⏳ Сервер перезапускается, сообщение будет обработано сразу после перезапуска.")
+        raise ApplicationHandlerStop
     except Exception as e:
         print(f"Ошибка обработки аудио: {e}")
         try:
-            await status_message.edit_text(f"❌ Произошла ошибка: {str(e)}")
+            await status.finish(f"❌ Произошла ошибка: {str(e)}")
         except:
             await message.reply_text(f"❌ Произошла ошибка: {str(e)}")
+    finally:
+        audio_buffer.close()
 
 
-def run_bot():
-    """Запускает телеграм бота"""
+# Запущенное приложение и его event loop (нужны, чтобы передавать webhook-обновления из потоков Flask)
+_application: Optional[Application] = None
+_application_loop: Optional[asyncio.AbstractEventLoop] = None
+# Сбрасывается при остановке сервера: новые webhook-обновления получит следующий запуск
+_accepting_updates = True
+
+
+def submit_webhook_update(payload: Optional[dict], secret_header: Optional[str]) -> int:
+    """Ставит обновление из webhook в очередь приложения. Возвращает HTTP-статус для ответа Telegram."""
+    if not hmac.compare_digest((secret_header or "").encode("utf-8"), WEBHOOK_SECRET.encode("utf-8")):
+        return 403
+    if _application is None or _application_loop is None or not _accepting_updates:
+        # Бот ещё запускается: Telegram повторит доставку позже
+        return 503
+    if not isinstance(payload, dict):
+        return 400
+    try:
+        update = Update.de_json(payload, _application.bot)
+    except Exception as e:
+        print(f"[Webhook] Некорректное обновление: {e}")
+        return 400
+    future = asyncio.run_coroutine_threadsafe(_application.update_queue.put(update), _application_loop)
+    try:
+        future.result(timeout=5)
+    except Exception as e:
+        print(f"[Webhook] Не удалось поставить обновление в очередь: {e}")
+        return 503
+    return 200
+
+
+def stop_receiving_updates(timeout: float = 10.0) -> None:
+    """Перестаёт получать обновления перед остановкой сервера; полученные дообрабатываются."""
+    global _accepting_updates
+    _accepting_updates = False
+    if _application is None or _application_loop is None or WEBHOOK_MODE:
+        return
+    future = asyncio.run_coroutine_threadsafe(_application.updater.stop(), _application_loop)
+    try:
+        future.result(timeout=timeout)
+        print("[Telegram] Получение обновлений остановлено")
+    except Exception as e:
+        print(f"[Telegram] Не удалось остановить получение обновлений: {e}")
+
+
+def run_bot(on_state: Optional[Callable[[str], None]] = None, restored: Optional[dict] = None,
+            register_webhook: bool = True):
+    """Запускает телеграм бота. on_state получает состояние: ready / disabled / failed: ...
+
+    restored - состояние журнала обновлений из контрольной точки сервера.
+    register_webhook - вызывать setWebhook (в многопроцессном режиме это делает только воркер 0)."""
+    def report(state: str) -> None:
+        if on_state is not None:
+            on_state(state)
+
+    # Настраиваем вывод без буферизации для немедленного логирования
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+
     if not TELEGRAM_BOT_TOKEN:
         print("⚠️  Telegram bot token не найден в конфиге. Бот не будет запущен.")
+        report("disabled")
         return
     
     try:
         print(f"🤖 Запускаю Telegram бота с токеном: {TELEGRAM_BOT_TOKEN[:10]}...")
         # Создаём приложение
-        application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # concurrent_updates ограничивает число одновременно обрабатываемых обновлений
+        application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(MAX_CONCURRENT_UPDATES)
+            .update_queue(JournaledUpdateQueue())
+            .build()
+        )
         
         # Регистрируем обработчики
         application.add_handler(CommandHandler("start", start_command))
@@ -429,6 +631,9 @@ def run_bot():
         ))
         # Обработчик текстовых сообщений
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+        # После всех обработчиков: обновление можно не сохранять при остановке
+        application.add_handler(TypeHandler(Update, mark_update_processed), group=1)
+        replay = update_journal.restore(restored)
         
         # Запускаем бота - используем простой способ через run_polling
         # Но с отключенными сигналами для работы в потоке
@@ -447,18 +652,37 @@ def run_bot():
                 # Запускаем бота через run_polling, но в отдельном потоке
                 # Используем stop_signals=None чтобы не обрабатывать сигналы
                 async def run():
+                    global _application, _application_loop
                     await application.initialize()
                     await application.start()
-                    await application.updater.start_polling(
-                        allowed_updates=Update.ALL_TYPES,
-                        drop_pending_updates=True
-                    )
+                    if WEBHOOK_MODE and register_webhook:
+                        # Обновления приходят POST-запросами на HTTP-сервер бэкенда
+                        await application.bot.set_webhook(
+                            url=WEBHOOK_URL,
+                            secret_token=WEBHOOK_SECRET,
+                            allowed_updates=Update.ALL_TYPES,
+                            max_connections=MAX_CONCURRENT_UPDATES,
+                        )
+                        print(f"🔗 Webhook установлен: {WEBHOOK_URL}")
+                    elif not WEBHOOK_MODE:
+                        # Обновления, пришедшие, пока сервер перезапускался, не отбрасываются
+                        await application.updater.start_polling(
+                            allowed_updates=Update.ALL_TYPES,
+                            drop_pending_updates=False
+                        )
+                    _application, _application_loop = application, loop
+                    for data in replay:
+                        await application.update_queue.put(Update.de_json(data, application.bot))
+                    if replay:
+                        print(f"[Telegram] Повторно обрабатываю {len(replay)} обновлений из контрольной точки")
+                    report("ready")
                     # Ждём бесконечно
                     await asyncio.Event().wait()
                 
                 # Запускаем в новом event loop
                 loop.run_until_complete(run())
             except Exception as e:
+                report(f"failed: {e}")
                 print(f"❌ Ошибка в боте: {e}")
                 import traceback
                 traceback.print_exc()
@@ -469,6 +693,7 @@ def run_bot():
         print("🔄 Поток бота запущен...")
         
     except Exception as e:
+        report(f"failed: {e}")
         print(f"❌ Ошибка запуска Telegram бота: {e}")
         import traceback
         traceback.print_exc()
@@ -0,0 +1,118 @@
+"""Обновление статусных сообщений Telegram вне критического пути обработки.
+
+Промежуточные состояния склеиваются: если за время ожидания лимита пришло несколько
+состояний, в Telegram уходит только последнее. Лимиты соблюдаются по чату и глобально,
+RetryAfter (flood control) обрабатывается прозрачно.
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+from telegram.error import BadRequest, RetryAfter
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    # В новых версиях python-telegram-bot retry_after может быть timedelta
+    delay = error.retry_after
+    if hasattr(delay, "total_seconds"):
+        delay = delay.total_seconds()
+    return float(delay)
+
+
+class EditRateLimiter:
+    """Разносит правки во времени: не чаще per_chat_interval в чате и global_per_second всего."""
+
+    def __init__(self, per_chat_interval: float = 1.0, global_per_second: float = 25.0) -> None:
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1.0 / max(global_per_second, 0.001)
+        self._chat_next: Dict[int, float] = {}
+        self._global_next = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, chat_id: int) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            at = max(now, self._chat_next.get(chat_id, 0.0), self._global_next)
+            self._chat_next[chat_id] = at + self.per_chat_interval
+            self._global_next = at + self.global_interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def penalize(self, chat_id: int, seconds: float) -> None:
+        """Telegram попросил подождать: откладываем следующие правки в чате и глобально."""
+        resume_at = time.monotonic() + seconds
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), resume_at)
+        self._global_next = max(self._global_next, resume_at)
+
+
+class StatusMessageUpdater:
+    """Фоновая задача, которая доводит статусное сообщение до последнего заданного текста."""
+
+    def __init__(self, message, limiter: EditRateLimiter) -> None:
+        self._message = message
+        self._limiter = limiter
+        self._chat_id = message.chat_id
+        self._shown: Optional[str] = message.text
+        self._desired: Optional[str] = None
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def set(self, text: str) -> None:
+        """Задаёт новое состояние и сразу возвращает управление."""
+        if self._closed:
+            return
+        self._desired = text
+        self._wakeup.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def finish(self, text: Optional[str] = None, timeout: float = 30.0) -> None:
+        """Задаёт финальное состояние и дожидается его отправки."""
+        if text is not None:
+            self.set(text)
+        self._closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                print("[Status] Не удалось обновить статус за отведённое время")
+
+    async def discard(self) -> None:
+        """Отменяет неотправленные правки (например, перед удалением сообщения)."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._desired is not None and self._desired != self._shown:
+                await self._limiter.acquire(self._chat_id)
+                # Берём самое свежее состояние на момент отправки
+                text = self._desired
+                try:
+                    await self._message.edit_text(text)
+                    self._shown = text
+                except RetryAfter as e:
+                    delay = _retry_after_seconds(e)
+                    print(f"[Status] Flood control, жду {delay:.1f}с")
+                    self._limiter.penalize(self._chat_id, delay)
+                except BadRequest as e:
+                    if "not modified" not in str(e).lower():
+                        print(f"[Status] Ошибка правки сообщения: {e}")
+                    self._shown = text
+                except Exception as e:
+                    print(f"[Status] Ошибка правки сообщения: {e}")
+                    self._shown = text
+            if self._closed:
+                return
@@ -0,0 +1,263 @@
+"""Клиенты API: ключи, квоты и справедливое распределение запросов к провайдерам.
+
+Клиент определяется по API-ключу (Authorization: Bearer или X-API-Key). У каждого есть вес,
+лимит запросов в минуту (token bucket, сверх него - 429) и лимит одновременных запросов
+к провайдеру. FairScheduler ставит вызовы провайдера в очередь взвешенного справедливого
+обслуживания (start-time fair queuing): клиент с длинными записями или всплеском запросов
+получает свою долю пропускной способности, но не задерживает остальных.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+ANONYMOUS = "anonymous"
+
+
+@dataclass
+class ClientPolicy:
+    name: str
+    # Доля пропускной способности относительно других клиентов
+    weight: float = 1.0
+    # Сколько запросов к провайдеру клиент может выполнять одновременно (None - без ограничения)
+    max_concurrent: Optional[int] = None
+    # Сколько задач в минуту можно создать (None - без ограничения) и размер всплеска
+    requests_per_minute: Optional[float] = None
+    burst: Optional[int] = None
+    # Видит статистику всех клиентов в /api/usage
+    admin: bool = False
+
+    @classmethod
+    def from_config(cls, name: str, cfg: dict) -> "ClientPolicy":
+        max_concurrent = cfg.get("max_concurrent")
+        rpm = cfg.get("requests_per_minute")
+        burst = cfg.get("burst")
+        return cls(
+            name=name,
+            weight=max(0.01, float(cfg.get("weight", 1.0))),
+            max_concurrent=int(max_concurrent) if max_concurrent else None,
+            requests_per_minute=float(rpm) if rpm else None,
+            burst=int(burst) if burst else None,
+            admin=bool(cfg.get("admin", False)),
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: float) -> None:
+        self.rate = rate_per_second
+        self.capacity = max(1.0, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def take(self) -> float:
+        """Забирает токен. 0 - успешно, иначе через сколько секунд появится следующий."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+
+@dataclass
+class ClientUsage:
+    requests: int = 0
+    rate_limited: int = 0
+    audio_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Вызовы провайдера через планировщик и суммарное/максимальное ожидание в очереди
+    scheduled: int = 0
+    queue_wait_total: float = 0.0
+    queue_wait_max: float = 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["audio_seconds"] = round(self.audio_seconds, 3)
+        data["queue_wait_total"] = round(self.queue_wait_total, 3)
+        data["queue_wait_max"] = round(self.queue_wait_max, 3)
+        data["queue_wait_avg"] = round(self.queue_wait_total / self.scheduled, 3) if self.scheduled else 0.0
+        return data
+
+
+class ClientRegistry:
+    """Ключи клиентов, квоты на создание задач и учёт потребления."""
+
+    def __init__(self, clients: Optional[Dict[str, ClientPolicy]] = None,
+                 anonymous: Optional[ClientPolicy] = None, require_key: bool = False) -> None:
+        # Ключ -> политика; один клиент может иметь несколько ключей
+        self.clients = clients or {}
+        self.anonymous = anonymous or ClientPolicy(ANONYMOUS)
+        self.require_key = require_key
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._usage: Dict[str, ClientUsage] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "ClientRegistry":
+        clients = {}
+        for name, client_cfg in (cfg.get("tenants") or {}).items():
+            policy = ClientPolicy.from_config(name, client_cfg)
+            keys = client_cfg.get("keys") or [client_cfg.get("key")]
+            for key in keys:
+                if key:
+                    clients[key] = policy
+        return cls(
+            clients=clients,
+            anonymous=ClientPolicy.from_config(ANONYMOUS, cfg.get("anonymous") or {}),
+            require_key=bool(cfg.get("require_key", False)),
+        )
+
+    def identify(self, api_key: Optional[str]) -> Optional[ClientPolicy]:
+        """Политика клиента по ключу. None - ключ неизвестен или обязателен, но не передан."""
+        if api_key:
+            return self.clients.get(api_key)
+        return None if self.require_key else self.anonymous
+
+    def find(self, name: Optional[str]) -> ClientPolicy:
+        """Политика по имени клиента (для задач из контрольной точки); неизвестное имя - анонимная."""
+        for policy in self.clients.values():
+            if policy.name == name:
+                return policy
+        return self.anonymous
+
+    def admit(self, client: ClientPolicy) -> float:
+        """Учитывает новую задачу клиента. 0 - принята, иначе Retry-After в секундах."""
+        with self._lock:
+            usage = self._usage_for(client.name)
+            if client.requests_per_minute:
+                bucket = self._buckets.get(client.name)
+                if bucket is None:
+                    rate = client.requests_per_minute / 60.0
+                    bucket = self._buckets[client.name] = TokenBucket(
+                        rate, client.burst or max(1.0, client.requests_per_minute / 6))
+                retry_after = bucket.take()
+                if retry_after:
+                    usage.rate_limited += 1
+                    return retry_after
+            usage.requests += 1
+            return 0.0
+
+    def record_audio(self, name: str, seconds: Optional[float]) -> None:
+        if seconds:
+            with self._lock:
+                self._usage_for(name).audio_seconds += seconds
+
+    def record_tokens(self, name: str, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            usage = self._usage_for(name)
+            usage.input_tokens += input_tokens
+            usage.output_tokens += output_tokens
+
+    def record_wait(self, name: str, seconds: float) -> None:
+        with self._lock:
+            usage = self._usage_for(name)
+            usage.scheduled += 1
+            usage.queue_wait_total += seconds
+            usage.queue_wait_max = max(usage.queue_wait_max, seconds)
+
+    def usage(self, name: Optional[str] = None) -> Dict[str, dict]:
+        """Потребление одного клиента или всех (name=None)."""
+        with self._lock:
+            if name is not None:
+                return {name: self._usage_for(name).to_dict()}
+            return {client: usage.to_dict() for client, usage in self._usage.items()}
+
+    def _usage_for(self, name: str) -> ClientUsage:
+        usage = self._usage.get(name)
+        if usage is None:
+            usage = self._usage[name] = ClientUsage()
+        return usage
+
+
+class _Ticket:
+    __slots__ = ("client", "start", "finish", "granted", "abandoned")
+
+    def __init__(self, client: ClientPolicy, start: float, finish: float) -> None:
+        self.client = client
+        self.start = start
+        self.finish = finish
+        self.granted = False
+        self.abandoned = False
+
+
+class FairScheduler:
+    """Взвешенная справедливая очередь перед вызовами провайдера.
+
+    Запрос стоимостью cost получает метку начала S = max(V, F клиента) и окончания
+    F = S + cost / вес; свободный слот достаётся ожидающему с наименьшей S среди клиентов,
+    не упёршихся в свой max_concurrent. V - метка последнего запущенного запроса.
+    """
+
+    def __init__(self, name: str, capacity: int = 4) -> None:
+        self.name = name
+        self.capacity = max(1, capacity)
+        self._virtual = 0.0
+        self._finish: Dict[str, float] = {}
+        self._running: Dict[str, int] = {}
+        self._active = 0
+        self._waiting: List[Tuple[float, int, _Ticket]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def acquire(self, client: ClientPolicy, cost: float = 1.0, timeout: Optional[float] = None) -> Optional[float]:
+        """Ждёт слот. Возвращает время ожидания в секундах или None, если таймаут истёк раньше."""
+        started = time.monotonic()
+        with self._cond:
+            start = max(self._virtual, self._finish.get(client.name, 0.0))
+            ticket = _Ticket(client, start, start + max(cost, 1e-3) / client.weight)
+            self._finish[client.name] = ticket.finish
+            heapq.heappush(self._waiting, (start, next(self._counter), ticket))
+            self._dispatch()
+            if not self._cond.wait_for(lambda: ticket.granted, timeout):
+                ticket.abandoned = True
+                if self._finish.get(client.name) == ticket.finish:
+                    # Неиспользованная доля не должна отодвигать следующие запросы клиента
+                    self._finish[client.name] = ticket.start
+                return None
+        return time.monotonic() - started
+
+    def release(self, client: ClientPolicy) -> None:
+        with self._cond:
+            self._active -= 1
+            self._running[client.name] = self._running.get(client.name, 1) - 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        deferred = []
+        granted = False
+        while self._waiting and self._active < self.capacity:
+            entry = heapq.heappop(self._waiting)
+            ticket = entry[2]
+            if ticket.abandoned:
+                continue
+            limit = ticket.client.max_concurrent
+            if limit is not None and self._running.get(ticket.client.name, 0) >= limit:
+                deferred.append(entry)
+                continue
+            ticket.granted = True
+            granted = True
+            self._active += 1
+            self._running[ticket.client.name] = self._running.get(ticket.client.name, 0) + 1
+            self._virtual = max(self._virtual, ticket.start)
+        for entry in deferred:
+            heapq.heappush(self._waiting, entry)
+        if granted:
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            waiting: Dict[str, int] = {}
+            for _, _, ticket in self._waiting:
+                if not ticket.abandoned:
+                    waiting[ticket.client.name] = waiting.get(ticket.client.name, 0) + 1
+            return {
+                "capacity": self.capacity,
+                "active": self._active,
+                "running": {name: count for name, count in self._running.items() if count},
+                "waiting": waiting,
+            }
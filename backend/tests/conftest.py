@@ -0,0 +1,86 @@
+"""Общая настройка тестов: временный конфиг с локальным движком до импорта server.
+
+server.py читает конфиг при импорте, поэтому PUSHTOTYPE_CONFIG выставляется здесь,
+раньше любого тестового модуля. Файлы задач пишутся во временный каталог, а не в backend/data.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_CONFIG = {
+    "backend": {"host": "127.0.0.1", "port": 0},
+    "api_keys": {"openai": "", "telegram_bot": ""},
+    "transcription": {"engine": "fake", "fake_delay": 0.05},
+    # Приёмник webhook в тестах локальный, а loopback без allow-list запрещён
+    "webhooks": {"base_delay": 0.05, "max_delay": 0.2, "max_attempts": 4, "timeout": 5,
+                 "allowed_hosts": ["127.0.0.1"]},
+}
+
+_config_dir = tempfile.mkdtemp(prefix="pushtotype-tests-")
+_config_path = os.path.join(_config_dir, "config.json")
+with open(_config_path, "w", encoding="utf-8") as handle:
+    json.dump(TEST_CONFIG, handle)
+os.environ["PUSHTOTYPE_CONFIG"] = _config_path
+
+
+def wait_for(predicate, timeout: float = 5.0, interval: float = 0.01):
+    """Ждёт, пока predicate() не вернёт истину; возвращает её значение или None по таймауту."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(interval)
+    return None
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """Модуль server с каталогом данных во временной папке."""
+    import server
+
+    monkeypatch.setattr(server, "DATA_DIR", str(tmp_path))
+    return server
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def receiver():
+    """Локальный приёмник webhook: отвечает статусами из очереди (дальше 200) и запоминает запросы."""
+    from flask import Flask, request
+    from werkzeug.datastructures import Headers
+    from werkzeug.serving import make_server
+
+    app = Flask("webhook-receiver")
+    state = {"statuses": [], "requests": []}
+
+    @app.post("/hook")
+    def hook():
+        state["requests"].append({
+            "at": time.monotonic(),
+            "headers": Headers(request.headers.items()),
+            "body": request.get_data(),
+        })
+        # Элемент очереди - статус или (статус, заголовки)
+        status = state["statuses"].pop(0) if state["statuses"] else 200
+        return ("", *status) if isinstance(status, tuple) else ("", status)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_port}/hook"
+    yield state
+    server.shutdown()
@@ -0,0 +1,117 @@
+"""Чат-сессии /api/chat: цепочка previous_response_id и её сброс при 400/404."""
+
+import pytest
+
+from chat_sessions import ChatSession
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, data: dict) -> None:
+        self.status_code = status_code
+        self._data = data
+        self.headers = {}
+        self.text = str(data)
+
+    def json(self) -> dict:
+        return self._data
+
+
+def answer(response_id: str, text: str) -> FakeResponse:
+    return FakeResponse(200, {
+        "id": response_id,
+        "output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}],
+        "usage": {"input_tokens": 30, "output_tokens": 10},
+    })
+
+
+@pytest.fixture
+def responses_api(backend, monkeypatch):
+    """Подменяет Responses API: отдаёт ответы из очереди и запоминает отправленные payload."""
+    state = {"queue": [], "payloads": []}
+
+    def post(url, headers=None, json=None, timeout=None):
+        state["payloads"].append(json)
+        return state["queue"].pop(0)
+
+    monkeypatch.setattr(backend, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(backend.provider_http, "post", post)
+    return state
+
+
+def test_follow_up_continues_the_chain(client, responses_api):
+    responses_api["queue"] = [answer("resp_1", "Первый ответ"), answer("resp_2", "Второй ответ")]
+
+    first = client.post("/api/chat", json={"question": "Первый вопрос", "session": True}).get_json()
+    assert first["answer"] == "Первый ответ"
+    second = client.post("/api/chat", json={"question": "Второй вопрос",
+                                            "session_id": first["session_id"]}).get_json()
+
+    assert second == {"answer": "Второй ответ", "session_id": first["session_id"]}
+    follow_up = responses_api["payloads"][1]
+    assert follow_up["previous_response_id"] == "resp_1"
+    # С живой цепочкой отправляется только новый вопрос
+    assert follow_up["input"] == [{"role": "user", "content": "Второй вопрос"}]
+
+
+@pytest.mark.parametrize("status", [400, 404])
+def test_expired_chain_is_reset_and_retried_with_local_history(backend, client, responses_api, status):
+    responses_api["queue"] = [
+        answer("resp_1", "Первый ответ"),
+        FakeResponse(status, {"error": {"message": "Previous response not found"}}),
+        answer("resp_3", "Ответ без цепочки"),
+    ]
+
+    session_id = client.post("/api/chat", json={"question": "Первый вопрос", "session": True}).get_json()["session_id"]
+    reply = client.post("/api/chat", json={"question": "Второй вопрос", "session_id": session_id}).get_json()
+
+    assert reply["answer"] == "Ответ без цепочки"
+    rejected, retried = responses_api["payloads"][1:]
+    assert rejected["previous_response_id"] == "resp_1"
+    assert "previous_response_id" not in retried
+    # Повтор восстанавливает контекст из локального окна: системный промпт, прошлый обмен и вопрос
+    assert retried["input"][0]["role"] == "system"
+    assert {"role": "user", "content": "Первый вопрос"} in retried["input"]
+    assert {"role": "assistant", "content": "Первый ответ"} in retried["input"]
+    assert retried["input"][-1] == {"role": "user", "content": "Второй вопрос"}
+    # Новая цепочка начинается с ответа на повтор
+    session, created = backend.chat_sessions.get_or_create(session_id)
+    assert not created
+    assert session.previous_response_id == "resp_3"
+
+
+def test_other_errors_keep_the_chain(backend, client, responses_api):
+    responses_api["queue"] = [
+        answer("resp_1", "Первый ответ"),
+        FakeResponse(401, {"error": {"message": "Invalid key"}}),
+    ]
+
+    session_id = client.post("/api/chat", json={"question": "Первый вопрос", "session": True}).get_json()["session_id"]
+    reply = client.post("/api/chat", json={"question": "Второй вопрос", "session_id": session_id}).get_json()
+
+    assert reply["answer"] == "Chat error 401: Invalid key"
+    assert len(responses_api["payloads"]) == 2
+    session, _ = backend.chat_sessions.get_or_create(session_id)
+    assert session.previous_response_id == "resp_1"
+
+
+def test_chain_is_reset_when_it_outgrows_the_token_budget():
+    session = ChatSession("s1")
+    session.record_exchange("Вопрос", "Ответ", "resp_1", chain_tokens=50, token_budget=100)
+    assert session.previous_response_id == "resp_1"
+
+    session.record_exchange("Ещё вопрос", "Ещё ответ", "resp_2", chain_tokens=150, token_budget=100)
+    assert session.previous_response_id is None
+    assert session.chain_tokens == 0
+    assert [turn.content for turn in session.history][-2:] == ["Ещё вопрос", "Ещё ответ"]
+
+
+def test_deleted_session_starts_over(client, responses_api):
+    responses_api["queue"] = [answer("resp_1", "Первый ответ"), answer("resp_2", "Новый разговор")]
+
+    session_id = client.post("/api/chat", json={"question": "Первый вопрос", "session": True}).get_json()["session_id"]
+    assert client.delete(f"/api/chat/{session_id}").status_code == 200
+    assert client.delete(f"/api/chat/{session_id}").status_code == 404
+    reply = client.post("/api/chat", json={"question": "Снова", "session_id": session_id}).get_json()
+
+    assert reply["session_id"] != session_id
+    assert "previous_response_id" not in responses_api["payloads"][1]
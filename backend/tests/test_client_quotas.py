@@ -0,0 +1,36 @@
+"""Квоты клиентов: списываются только за запросы, которые создают задачу."""
+
+import io
+
+import pytest
+
+from tenants import ClientRegistry
+
+HEADERS = {"X-API-Key": "app-key"}
+
+
+@pytest.fixture
+def one_job_quota(backend, monkeypatch):
+    registry = ClientRegistry.from_config({"tenants": {"app": {"key": "app-key", "requests_per_minute": 1,
+                                                               "burst": 1}}})
+    monkeypatch.setattr(backend, "client_registry", registry)
+    return registry
+
+
+def audio(**fields) -> dict:
+    return {"audio": (io.BytesIO(b"\x00" * 64), "voice.m4a"), **fields}
+
+
+@pytest.mark.parametrize("endpoint, invalid", [
+    ("/api/audio", {"timeout": "-1"}),
+    ("/api/audio", {"callback_url": "ftp://example.com/hook"}),
+    ("/api/ask", {"timeout": "abc"}),
+])
+def test_rejected_request_does_not_use_quota(one_job_quota, client, endpoint, invalid):
+    for _ in range(3):
+        assert client.post(endpoint, data=audio(**invalid), headers=HEADERS).status_code == 400
+
+    assert client.post("/api/audio", data=audio(), headers=HEADERS).status_code == 200
+    limited = client.post("/api/audio", data=audio(), headers=HEADERS)
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
@@ -0,0 +1,158 @@
+"""Задачи транскрипции на локальном движке fake через тестовый клиент Flask."""
+
+import io
+import json
+import os
+import time
+
+import pytest
+
+from circuit_breaker import HALF_OPEN
+from conftest import wait_for
+
+
+def upload(client, name: str = "voice.m4a", **fields):
+    return client.post("/api/audio", data={"audio": (io.BytesIO(b"\x00" * 64), name), **fields})
+
+
+def poll_result(client, job_id: str):
+    """Опрашивает задачу, пока она в processing; None - не завершилась за таймаут."""
+    def finished():
+        result = client.get(f"/api/transcription/{job_id}").get_json()
+        return result if result["status"] != "processing" else None
+    return wait_for(finished)
+
+
+def fake_breaker_calls(backend) -> int:
+    return backend.provider_breakers.snapshot()["fake:transcriptions"]["calls"]
+
+
+@pytest.fixture
+def slow_engine(backend, monkeypatch):
+    monkeypatch.setattr(backend, "FAKE_ENGINE_DELAY", 1.0)
+    return backend
+
+
+def test_upload_poll_and_fetch(backend, client):
+    resp = upload(client)
+    assert resp.status_code == 200
+    body = resp.get_json()
+    job_id = body["recording_id"]
+    assert "eta_seconds" in body and "poll_after" in body
+    audio_path = backend.jobs[job_id].audio_path
+    assert os.path.exists(audio_path)
+
+    result = poll_result(client, job_id)
+    assert result["status"] == "ready"
+    assert result["transcription"] == f"[fake] {os.path.basename(audio_path)}: 64 байт"
+
+    # Забранная задача освобождается: аудио удалено, результат остаётся на диске
+    assert not os.path.exists(audio_path)
+    with open(os.path.join(backend.DATA_DIR, f"{job_id}.txt"), encoding="utf-8") as handle:
+        assert handle.read() == result["transcription"]
+    assert client.get(f"/api/transcription/{job_id}").status_code == 404
+    stages = [s["stage"] for s in client.get(f"/api/transcription/{job_id}/trace").get_json()["stages"]]
+    assert stages[0] == "received" and "completed" in stages and "result_fetched" in stages
+
+
+def test_processing_job_has_poll_hint(slow_engine, client):
+    job_id = upload(client).get_json()["recording_id"]
+
+    resp = client.get(f"/api/transcription/{job_id}")
+    assert resp.get_json()["status"] == "processing"
+    assert int(resp.headers["Retry-After"]) >= 1
+    client.delete(f"/api/transcription/{job_id}")
+
+
+def test_cancel_removes_files_and_is_not_a_provider_failure(slow_engine, client, capsys):
+    calls = fake_breaker_calls(slow_engine)
+    job_id = upload(client).get_json()["recording_id"]
+    audio_path = slow_engine.jobs[job_id].audio_path
+
+    assert client.delete(f"/api/transcription/{job_id}").status_code == 200
+    assert not os.path.exists(audio_path)
+    assert client.get(f"/api/transcription/{job_id}").status_code == 404
+    assert client.delete(f"/api/transcription/{job_id}").status_code == 404
+    # Слот очереди освобождается сразу, отменённый вызов автомат не учитывает
+    assert wait_for(lambda: slow_engine.transcription_scheduler._active == 0, timeout=1.0)
+    assert fake_breaker_calls(slow_engine) == calls
+    assert "Критическая ошибка" not in capsys.readouterr().out
+
+
+def test_cancelled_half_open_trial_is_returned_to_the_breaker(slow_engine, client, monkeypatch):
+    breaker = slow_engine.provider_breakers.get("fake:transcriptions")
+    monkeypatch.setattr(breaker, "_state", HALF_OPEN)
+    job_id = upload(client).get_json()["recording_id"]
+    assert wait_for(lambda: not breaker.would_allow())
+    assert upload(client).status_code == 503
+
+    client.delete(f"/api/transcription/{job_id}")
+    # Отменённый пробный запрос не решает исход half-open: слот свободен для следующего
+    assert wait_for(breaker.would_allow, timeout=1.0)
+    assert breaker.state == HALF_OPEN
+    resp = upload(client)
+    assert resp.status_code == 200
+    client.delete(f"/api/transcription/{resp.get_json()['recording_id']}")
+
+
+def test_client_deadline_drops_the_job(slow_engine, client):
+    calls = fake_breaker_calls(slow_engine)
+    job_id = upload(client, timeout="0.2").get_json()["recording_id"]
+
+    # Дедлайн урезал таймаут провайдера: это не сбой провайдера, задачу снимает уборщик
+    assert wait_for(lambda: client.get(f"/api/transcription/{job_id}").status_code == 404, timeout=5)
+    assert fake_breaker_calls(slow_engine) == calls
+
+
+def test_invalid_uploads_are_rejected(client):
+    assert client.post("/api/audio", data={}).status_code == 400
+    assert upload(client, timeout="-1").status_code == 400
+
+
+def test_unrecognised_upload_keeps_only_whitelisted_extension(backend, client):
+    job_id = upload(client, name="notes.txt").get_json()["recording_id"]
+    assert backend.jobs[job_id].audio_path.endswith(".m4a")
+    job_id = upload(client, name="song.mp3").get_json()["recording_id"]
+    assert backend.jobs[job_id].audio_path.endswith(".mp3")
+
+
+def test_batch_results_are_paged_by_cursor(client):
+    files = [(io.BytesIO(b"\x00" * 64), f"part{i}.m4a") for i in range(3)]
+    resp = client.post("/api/batch", data={"audio": files})
+    assert resp.status_code == 200
+    batch_id = resp.get_json()["batch_id"]
+
+    items = []
+    cursor = 0
+    done = False
+    for _ in range(500):
+        page = client.get(f"/api/batch/{batch_id}?cursor={cursor}").get_json()
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if page["done"] and cursor >= page["total"]:
+            done = True
+            break
+        time.sleep(0.01)
+    assert done
+    assert len(items) == 3 and all(item["status"] == "ready" for item in items)
+    assert client.get(f"/api/batch/{batch_id}").status_code == 404
+
+
+def test_ask_returns_transcription_and_answer(client):
+    resp = client.post("/api/ask", data={"audio": (io.BytesIO(b"\x00" * 64), "q.m4a")})
+    body = resp.get_json()
+
+    assert resp.status_code == 200
+    assert body["transcription"].startswith("[fake]")
+    # Без ключа OpenAI ответ - текст ошибки в поле answer
+    assert body["answer"] == "OpenAI API key отсутствует"
+    assert client.get(f"/api/transcription/{body['recording_id']}").status_code == 404
+
+
+def test_ask_streams_events_in_order(client):
+    resp = client.post("/api/ask", data={"audio": (io.BytesIO(b"\x00" * 64), "q.m4a"), "stream": "1"})
+
+    assert resp.mimetype == "application/x-ndjson"
+    events = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [event["event"] for event in events] == ["accepted", "transcription", "answer"]
+    assert events[1]["transcription"].startswith("[fake]")
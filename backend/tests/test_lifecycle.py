@@ -0,0 +1,69 @@
+"""Keep-alive соединения при остановке: простаивающие закрываются, начатые запросы доделываются."""
+
+import socket
+import threading
+import time
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from lifecycle import ConnectionTracker
+
+
+def serve(tracker: ConnectionTracker, release: threading.Event):
+    app = Flask("lifecycle-test")
+
+    @app.get("/fast")
+    def fast():
+        return "ok"
+
+    @app.get("/slow")
+    def slow():
+        release.wait(5)
+        return "slow"
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=tracker.request_handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get(sock: socket.socket, path: str) -> None:
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+
+
+def read_response(sock: socket.socket) -> bytes:
+    """Читает ответ целиком (заголовки и тело по Content-Length)."""
+    data = b""
+    while b"\r\n\r\n" not in data:
+        data += sock.recv(4096)
+    head, body = data.split(b"\r\n\r\n", 1)
+    length = int(next(line.split(b":", 1)[1] for line in head.split(b"\r\n")
+                      if line.lower().startswith(b"content-length:")))
+    while len(body) < length:
+        body += sock.recv(4096)
+    return head
+
+
+def test_idle_connection_is_closed_and_busy_one_is_awaited():
+    tracker = ConnectionTracker()
+    release = threading.Event()
+    server = serve(tracker, release)
+    address = server.server_address[:2]
+    idle = socket.create_connection(address, timeout=5)
+    busy = socket.create_connection(address, timeout=5)
+    get(idle, "/fast")
+    assert read_response(idle).startswith(b"HTTP/1.1 200")
+    get(busy, "/slow")
+    time.sleep(0.1)
+
+    server.shutdown()
+    tracker.close_idle()
+    # Простаивающее keep-alive соединение закрывается сервером, не дожидаясь клиента
+    assert idle.recv(100) == b""
+    assert not tracker.wait_closed(0.2)
+    assert tracker.open == 1
+
+    release.set()
+    assert read_response(busy).startswith(b"HTTP/1.1 200")
+    assert tracker.wait_closed(5)
+    server.server_close()
@@ -0,0 +1,28 @@
+"""Локальное форматирование: заминки удаляются, единицы измерения остаются."""
+
+import pytest
+
+from local_formatter import format_locally, remove_fillers
+
+
+@pytest.mark.parametrize("text", [
+    "Высота забора 3 м, ширина 2 м.",
+    "Около 5 м и всё.",
+    "Вес 200 г, время 30 с.",
+    "Толщина 5 мм, длина 12 м.",
+])
+def test_units_after_numbers_are_kept(text):
+    assert format_locally(text) == text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ммм, я думаю, мм, что да.", "Я думаю, что да."),
+    ("Хм, это 2 г.", "Это 2 г."),
+    ("Э, мы начали в 9 утра.", "Мы начали в 9 утра."),
+])
+def test_hesitations_are_removed(text, expected):
+    assert format_locally(text) == expected
+
+
+def test_single_m_is_not_a_hesitation():
+    assert remove_fillers("м, ну ладно") == "м, ну ладно"
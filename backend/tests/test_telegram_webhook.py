@@ -0,0 +1,99 @@
+"""Webhook-режим бота: записанные Update JSON, отправленные POST-запросом на /telegram/webhook."""
+
+import asyncio
+import threading
+
+import pytest
+
+SECRET = "webhook-secret"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Обновление с голосовым сообщением в том виде, в каком его присылает Telegram
+RECORDED_UPDATE = {
+    "update_id": 874512331,
+    "message": {
+        "message_id": 1842,
+        "date": 1760880000,
+        "chat": {"id": 51234567, "type": "private", "first_name": "Anna", "username": "anna_k"},
+        "from": {"id": 51234567, "is_bot": False, "first_name": "Anna", "username": "anna_k", "language_code": "ru"},
+        "voice": {
+            "file_id": "AwACAgIAAxkBAAIHMmZ0x9L1qQABc2V0dGVzdAACyT4AAnQ4kUt7aW9zSw",
+            "file_unique_id": "AgADyT4AAnQ4kUs",
+            "duration": 7,
+            "mime_type": "audio/ogg",
+            "file_size": 28417,
+        },
+    },
+}
+
+
+@pytest.fixture
+def bot(backend, monkeypatch):
+    """Модуль telegram_bot в webhook-режиме с приложением без сети: обновления остаются в очереди."""
+    import telegram_bot
+    from telegram.ext import Application
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    application = Application.builder().token("123456:TEST").update_queue(telegram_bot.JournaledUpdateQueue()).build()
+    monkeypatch.setattr(telegram_bot, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(telegram_bot, "update_journal", telegram_bot.UpdateJournal())
+    monkeypatch.setattr(telegram_bot, "_application", application)
+    monkeypatch.setattr(telegram_bot, "_application_loop", loop)
+    monkeypatch.setattr(telegram_bot, "_accepting_updates", True)
+    monkeypatch.setattr(backend, "telegram_webhook_handler", telegram_bot.submit_webhook_update)
+    yield telegram_bot
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+def test_update_with_secret_is_queued(bot, client):
+    resp = client.post("/telegram/webhook", json=RECORDED_UPDATE, headers={SECRET_HEADER: SECRET})
+
+    assert resp.status_code == 200
+    queue = bot._application.update_queue
+    assert queue.qsize() == 1
+    update = queue.get_nowait()
+    assert update.update_id == RECORDED_UPDATE["update_id"]
+    assert update.message.voice.file_id == RECORDED_UPDATE["message"]["voice"]["file_id"]
+    assert update.effective_chat.id == 51234567
+    # Обновление в журнале до обработки: при остановке оно попадёт в контрольную точку
+    assert bot.update_journal.pending_count() == 1
+
+
+@pytest.mark.parametrize("headers", [{}, {SECRET_HEADER: "wrong"}])
+def test_update_without_valid_secret_is_rejected(bot, client, headers):
+    resp = client.post("/telegram/webhook", json=RECORDED_UPDATE, headers=headers)
+
+    assert resp.status_code == 403
+    assert bot._application.update_queue.empty()
+
+
+def test_redelivered_update_is_queued_once(bot, client):
+    for _ in range(2):
+        resp = client.post("/telegram/webhook", json=RECORDED_UPDATE, headers={SECRET_HEADER: SECRET})
+        assert resp.status_code == 200
+    assert bot._application.update_queue.qsize() == 1
+
+
+def test_malformed_update_is_rejected(bot, client):
+    resp = client.post("/telegram/webhook", data="not json", content_type="application/json",
+                       headers={SECRET_HEADER: SECRET})
+    assert resp.status_code == 400
+
+
+def test_update_is_refused_while_stopping(bot, client, monkeypatch):
+    monkeypatch.setattr(bot, "_accepting_updates", False)
+    resp = client.post("/telegram/webhook", json=RECORDED_UPDATE, headers={SECRET_HEADER: SECRET})
+    # Telegram повторит доставку, и обновление получит следующий запуск
+    assert resp.status_code == 503
+
+
+def test_updates_are_spread_across_workers_by_update_id(backend, monkeypatch):
+    monkeypatch.setattr(backend, "WORKER_COUNT", 4)
+    for update_id in (874512331, 874512332, 874512333):
+        with backend.app.test_request_context("/telegram/webhook", method="POST",
+                                              json={**RECORDED_UPDATE, "update_id": update_id}):
+            assert backend.owner_worker() == update_id % 4
@@ -0,0 +1,92 @@
+"""Сессии потоковой загрузки /api/session на движке fake: сегменты распознаются до finalize."""
+
+import io
+import os
+
+import pytest
+
+from conftest import wait_for
+
+
+def chunk(name: str = "chunk.m4a", size: int = 64) -> dict:
+    return {"audio": (io.BytesIO(b"\x00" * size), name)}
+
+
+def open_session(client) -> str:
+    resp = client.post("/api/session", data={})
+    assert resp.status_code == 200
+    return resp.get_json()["session_id"]
+
+
+def fake_breaker_calls(backend) -> int:
+    return backend.provider_breakers.snapshot()["fake:transcriptions"]["calls"]
+
+
+@pytest.fixture
+def slow_engine(backend, monkeypatch):
+    monkeypatch.setattr(backend, "FAKE_ENGINE_DELAY", 1.0)
+    return backend
+
+
+def test_segments_are_transcribed_before_finalize(backend, client):
+    session_id = open_session(client)
+    for index, size in enumerate((64, 128)):
+        resp = client.post(f"/api/session/{session_id}/chunk", data=chunk(size=size))
+        assert resp.get_json() == {"session_id": session_id, "segment": index}
+    session = backend.sessions[session_id]
+    # Сегменты распознаются, пока запись ещё идёт
+    assert wait_for(lambda: all(segment.done.is_set() for segment in session.segments))
+    assert all(segment.text.startswith("[fake]") for segment in session.segments)
+
+    resp = client.post(f"/api/session/{session_id}/finalize", data=chunk(size=32))
+    assert resp.status_code == 200
+    assert session_id not in backend.sessions
+    result = wait_for(lambda: client.get(f"/api/transcription/{session_id}").get_json()
+                      if backend.jobs[session_id].status != "processing" else None)
+    assert result["status"] == "ready"
+    # Текст задачи - сегменты по порядку загрузки
+    sizes = [part.rsplit(": ", 1)[1] for part in result["transcription"].split("[fake] ")[1:]]
+    assert [size.strip() for size in sizes] == ["64 байт", "128 байт", "32 байт"]
+
+
+def test_unknown_or_empty_session_is_rejected(client):
+    assert client.post("/api/session/missing/chunk", data=chunk()).status_code == 404
+    assert client.post("/api/session/missing/finalize", data={}).status_code == 404
+    assert client.delete("/api/session/missing").status_code == 404
+    session_id = open_session(client)
+    assert client.post(f"/api/session/{session_id}/chunk", data={}).status_code == 400
+    assert client.post(f"/api/session/{session_id}/finalize", data={}).status_code == 400
+    assert client.post("/api/session", data={"timeout": "0"}).status_code == 400
+
+
+def test_deleting_session_aborts_running_segments(slow_engine, client):
+    calls = fake_breaker_calls(slow_engine)
+    session_id = open_session(client)
+    client.post(f"/api/session/{session_id}/chunk", data=chunk())
+    segment = slow_engine.sessions[session_id].segments[0]
+    assert wait_for(lambda: slow_engine.transcription_scheduler._active == 1)
+
+    resp = client.delete(f"/api/session/{session_id}")
+    assert resp.get_json() == {"session_id": session_id, "status": "cancelled"}
+    assert not os.path.exists(segment.audio_path)
+    # Вызов провайдера обрывается сразу, а не через fake_delay
+    assert wait_for(segment.done.is_set, timeout=0.5)
+    assert segment.text is None and segment.error is None
+    assert slow_engine.transcription_scheduler._active == 0
+    assert fake_breaker_calls(slow_engine) == calls
+
+
+def test_cancelling_finalized_session_job_wakes_it(slow_engine, client, capsys):
+    session_id = open_session(client)
+    client.post(f"/api/session/{session_id}/chunk", data=chunk())
+    session = slow_engine.sessions[session_id]
+    client.post(f"/api/session/{session_id}/finalize", data=chunk())
+    assert wait_for(lambda: slow_engine.transcription_scheduler._active == 2)
+
+    assert client.delete(f"/api/transcription/{session_id}").status_code == 200
+    # Задача сессии не ждёт сегменты: она будит их отменой, и слоты освобождаются
+    assert wait_for(session.cancelled.is_set, timeout=0.5)
+    assert wait_for(lambda: all(segment.done.is_set() for segment in session.segments), timeout=0.5)
+    assert slow_engine.transcription_scheduler._active == 0
+    assert client.get(f"/api/transcription/{session_id}").status_code == 404
+    assert "Ошибка транскрибации сегмента" not in capsys.readouterr().out
@@ -0,0 +1,171 @@
+"""Доставка результатов на callback URL: подпись HMAC и расписание повторов."""
+
+import hashlib
+import hmac
+import io
+import json
+import threading
+
+import pytest
+
+from conftest import wait_for
+from webhooks import SIGNATURE_HEADER, WebhookDelivery, WebhookDispatcher, callback_url_error, sign_payload
+
+# Приёмник слушает loopback: его нужно явно разрешить
+LOCAL_HOSTS = ("127.0.0.1",)
+
+
+def recording_dispatcher(**kwargs) -> "tuple[WebhookDispatcher, list]":
+    """Диспетчер, запоминающий задержку каждой постановки в очередь."""
+    dispatcher = WebhookDispatcher(allowed_hosts=LOCAL_HOSTS, **kwargs)
+    delays = []
+    schedule = dispatcher._schedule
+
+    def _schedule(delivery, delay):
+        delays.append(delay)
+        schedule(delivery, delay)
+
+    dispatcher._schedule = _schedule
+    return dispatcher, delays
+
+
+def test_sign_payload_is_hmac_sha256_of_body():
+    body = b'{"recording_id": "abc"}'
+    expected = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+    assert sign_payload(body, "secret") == f"sha256={expected}"
+
+
+def test_delivery_is_signed_with_secret(receiver):
+    delivered = threading.Event()
+    dispatcher = WebhookDispatcher(base_delay=0.01, allowed_hosts=LOCAL_HOSTS)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc", "status": "ready"},
+                                      secret="s3cret", on_delivered=delivered.set))
+
+    assert delivered.wait(5)
+    sent = receiver["requests"][0]
+    assert json.loads(sent["body"]) == {"recording_id": "abc", "status": "ready"}
+    assert sent["headers"][SIGNATURE_HEADER] == sign_payload(sent["body"], "s3cret")
+
+
+def test_delivery_without_secret_is_unsigned(receiver):
+    delivered = threading.Event()
+    dispatcher = WebhookDispatcher(base_delay=0.01, allowed_hosts=LOCAL_HOSTS)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc"}, on_delivered=delivered.set))
+
+    assert delivered.wait(5)
+    assert SIGNATURE_HEADER not in receiver["requests"][0]["headers"]
+
+
+def test_retries_back_off_exponentially_up_to_max_delay(receiver):
+    receiver["statuses"] = [503, 429, 500, 502]
+    delivered = threading.Event()
+    dispatcher, delays = recording_dispatcher(base_delay=0.02, max_delay=0.05, max_attempts=6)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc"}, on_delivered=delivered.set))
+
+    assert delivered.wait(5)
+    assert len(receiver["requests"]) == 5
+    # Первая попытка сразу, затем base_delay * 2^(n-1), но не больше max_delay
+    assert delays == [0.0, 0.02, 0.04, 0.05, 0.05]
+    gaps = [b["at"] - a["at"] for a, b in zip(receiver["requests"], receiver["requests"][1:])]
+    assert all(gap >= delay * 0.9 for gap, delay in zip(gaps, delays[1:]))
+
+
+def test_client_error_is_not_retried(receiver):
+    receiver["statuses"] = [400]
+    dispatcher, delays = recording_dispatcher(base_delay=0.01)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc"}))
+
+    assert wait_for(lambda: receiver["requests"])
+    assert not wait_for(lambda: len(receiver["requests"]) > 1, timeout=0.3)
+    assert delays == [0.0]
+
+
+def test_delivery_gives_up_after_max_attempts(receiver):
+    receiver["statuses"] = [500] * 10
+    dispatcher, delays = recording_dispatcher(base_delay=0.01, max_attempts=3)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc"}))
+
+    assert wait_for(lambda: len(receiver["requests"]) == 3)
+    assert not wait_for(lambda: len(receiver["requests"]) > 3, timeout=0.3)
+    assert delays == [0.0, 0.01, 0.02]
+
+
+def test_finished_job_is_posted_to_callback_and_released(client, receiver):
+    resp = client.post("/api/audio", data={
+        "audio": (io.BytesIO(b"\x00" * 64), "voice.m4a"),
+        "callback_url": receiver["url"],
+        "callback_secret": "s3cret",
+    })
+    assert resp.status_code == 200
+    job_id = resp.get_json()["recording_id"]
+
+    assert wait_for(lambda: receiver["requests"])
+    sent = receiver["requests"][0]
+    payload = json.loads(sent["body"])
+    assert payload["recording_id"] == job_id
+    assert payload["status"] == "ready"
+    assert payload["transcription"].startswith("[fake]")
+    assert sent["headers"][SIGNATURE_HEADER] == sign_payload(sent["body"], "s3cret")
+    # После доставки задачу больше не нужно опрашивать
+    assert wait_for(lambda: client.get(f"/api/transcription/{job_id}").status_code == 404)
+
+
+def test_invalid_callback_url_is_rejected(client):
+    resp = client.post("/api/audio", data={
+        "audio": (io.BytesIO(b"\x00" * 64), "voice.m4a"),
+        "callback_url": "ftp://example.com/hook",
+    })
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8080/hook",
+    "http://localhost/hook",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.10/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+    "ftp://example.com/hook",
+])
+def test_internal_callback_targets_are_refused(url):
+    assert callback_url_error(url) is not None
+
+
+def test_public_address_and_allow_list():
+    assert callback_url_error("https://93.184.216.34/hook") is None
+    # С allow-list разрешены только перечисленные хосты, в том числе внутренние
+    assert callback_url_error("http://127.0.0.1:9000/hook", ["127.0.0.1"]) is None
+    assert callback_url_error("https://93.184.216.34/hook", ["127.0.0.1"]) is not None
+
+
+def test_loopback_callback_is_rejected_without_allow_list(backend, client, monkeypatch):
+    monkeypatch.setattr(backend.webhook_dispatcher, "allowed_hosts", ())
+    resp = client.post("/api/audio", data={
+        "audio": (io.BytesIO(b"\x00" * 64), "voice.m4a"),
+        "callback_url": "http://127.0.0.1:5000/internal",
+    })
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Invalid callback_url"
+
+
+def test_delivery_to_refused_host_is_not_attempted(receiver):
+    dispatcher, delays = recording_dispatcher(base_delay=0.01)
+    dispatcher.allowed_hosts = ("hooks.example.com",)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc"}))
+
+    # Проверка повторяется при доставке: запрос не уходит и не повторяется
+    assert not wait_for(lambda: receiver["requests"], timeout=0.3)
+    assert delays == [0.0]
+
+
+def test_redirect_is_not_followed(receiver):
+    # Следование редиректу повторило бы POST на /hook вторым запросом
+    receiver["statuses"] = [(307, {"Location": receiver["url"]})]
+    dispatcher, delays = recording_dispatcher(base_delay=0.01)
+    dispatcher.submit(WebhookDelivery(receiver["url"], {"recording_id": "abc"}))
+
+    assert wait_for(lambda: receiver["requests"])
+    assert not wait_for(lambda: len(receiver["requests"]) > 1, timeout=0.3)
+    assert delays == [0.0]
@@ -0,0 +1,164 @@
+"""Таймлайн обработки задачи транскрибации и экспорт в формате OpenTelemetry."""
+
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import requests
+
+
+# Этапы в порядке прохождения задачи
+TRACE_STAGES = (
+    "received",
+    "persisted",
+    "queued",
+    "provider_request_sent",
+    "first_byte",
+    "completed",
+    "first_poll",
+    "result_fetched",
+)
+
+
+class JobTrace:
+    """Монотонные отметки времени по этапам одной задачи."""
+
+    __slots__ = ("started_wall", "started_mono", "marks")
+
+    def __init__(self) -> None:
+        # Привязываем монотонные часы к настенным, чтобы экспортировать абсолютное время
+        self.started_wall = time.time()
+        self.started_mono = time.monotonic()
+        self.marks: Dict[str, float] = {"received": self.started_mono}
+
+    def clone(self) -> "JobTrace":
+        """Копия с теми же отметками (для нескольких задач из одного запроса)."""
+        copy = JobTrace.__new__(JobTrace)
+        copy.started_wall = self.started_wall
+        copy.started_mono = self.started_mono
+        copy.marks = dict(self.marks)
+        return copy
+
+    def mark(self, stage: str) -> bool:
+        """Запоминает первое наступление этапа. Возвращает False, если этап уже был отмечен."""
+        if stage in self.marks:
+            return False
+        self.marks[stage] = time.monotonic()
+        return True
+
+    def to_dict(self) -> dict:
+        """Этапы в миллисекундах от получения запроса."""
+        ordered = self._ordered_stages()
+        stages = []
+        for stage in ordered:
+            stages.append({
+                "stage": stage,
+                "offset_ms": round((self.marks[stage] - self.started_mono) * 1000, 3),
+            })
+        durations = {}
+        for prev, cur in zip(ordered, ordered[1:]):
+            durations[f"{prev}->{cur}"] = round((self.marks[cur] - self.marks[prev]) * 1000, 3)
+        return {
+            "received_at": self.started_wall,
+            "stages": stages,
+            "durations_ms": durations,
+            "pending": [s for s in TRACE_STAGES if s not in self.marks],
+        }
+
+    def to_otlp_spans(self, job_id: str) -> List[dict]:
+        """Корневой спан задачи и дочерние спаны между соседними этапами (OTLP/JSON)."""
+        trace_id = uuid.uuid5(uuid.NAMESPACE_URL, f"pushtotype:{job_id}").hex
+        root_span_id = os.urandom(8).hex()
+        ordered = self._ordered_stages()
+        end = self.marks[ordered[-1]]
+
+        def _ns(mono: float) -> str:
+            return str(int((self.started_wall + (mono - self.started_mono)) * 1e9))
+
+        spans = [{
+            "traceId": trace_id,
+            "spanId": root_span_id,
+            "name": "transcription",
+            "kind": 2,  # SPAN_KIND_SERVER
+            "startTimeUnixNano": _ns(self.started_mono),
+            "endTimeUnixNano": _ns(end),
+            "attributes": [{"key": "pushtotype.job_id", "value": {"stringValue": job_id}}],
+        }]
+        for prev, cur in zip(ordered, ordered[1:]):
+            spans.append({
+                "traceId": trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": root_span_id,
+                "name": f"{prev}->{cur}",
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": _ns(self.marks[prev]),
+                "endTimeUnixNano": _ns(self.marks[cur]),
+            })
+        return spans
+
+    def _ordered_stages(self) -> List[str]:
+        # Сортируем по фактическому времени: этапы опроса могут идти раньше завершения
+        return sorted(self.marks, key=self.marks.get)
+
+
+class SpanExporter:
+    """Экспорт спанов в JSONL-файл и/или OTLP/HTTP коллектор. Работает в фоне."""
+
+    def __init__(self, export_path: Optional[str] = None, otlp_endpoint: Optional[str] = None,
+                 service_name: str = "pushtotype-backend") -> None:
+        self.export_path = export_path
+        self.otlp_endpoint = otlp_endpoint
+        self.service_name = service_name
+        self._file_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "SpanExporter":
+        return cls(
+            export_path=cfg.get("export_path"),
+            otlp_endpoint=cfg.get("otlp_endpoint"),
+            service_name=cfg.get("service_name", "pushtotype-backend"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.export_path or self.otlp_endpoint)
+
+    def export(self, spans: List[dict], background: bool = True) -> None:
+        """Отправляет спаны асинхронно, не задерживая ответ клиенту (background=False - сразу, для утилит)."""
+        if not self.enabled or not spans:
+            return
+        if not background:
+            self._export_sync(spans)
+            return
+        threading.Thread(target=self._export_sync, args=(spans,), daemon=True).start()
+
+    def _payload(self, spans: List[dict]) -> dict:
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}],
+                },
+                "scopeSpans": [{"scope": {"name": "pushtotype.tracing"}, "spans": spans}],
+            }]
+        }
+
+    def _export_sync(self, spans: List[dict]) -> None:
+        payload = self._payload(spans)
+        if self.export_path:
+            try:
+                line = json.dumps(payload, ensure_ascii=False)
+                with self._file_lock:
+                    with open(self.export_path, "a", encoding="utf-8") as handle:
+                        handle.write(line + "\n")
+            except OSError as e:
+                print(f"[Tracing] Не удалось записать спаны в {self.export_path}: {e}")
+        if self.otlp_endpoint:
+            try:
+                resp = requests.post(self.otlp_endpoint, json=payload, timeout=5)
+                if resp.status_code >= 300:
+                    print(f"[Tracing] Коллектор ответил {resp.status_code}: {resp.text[:200]}")
+            except requests.exceptions.RequestException as e:
+                print(f"[Tracing] Ошибка отправки в коллектор: {e}")
@@ -0,0 +1,318 @@
+"""Архив транскрипций с полнотекстовым поиском.
+
+Записи дописываются в один JSONL-файл (текст и метаданные: источник, время, длительность,
+язык). Обратный индекс держится в памяти и пополняется при каждой записи; при запуске
+он строится одним проходом по файлу. В журнал могут писать несколько процессов сервера:
+перед поиском каждый доиндексирует строки, дописанные остальными. Поиск ранжирует по BM25, поддерживает префиксы
+(«транскри*») и фильтры по дате и источнику; текст с диска читается только для выдачи.
+"""
+
+import bisect
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import IO, Dict, List, Optional, Tuple
+
+ENTRIES_NAME = "entries.jsonl"
+
+_TOKEN_RE = re.compile(r"\w+")
+_CYRILLIC_RE = re.compile(r"[а-яё]")
+_LATIN_RE = re.compile(r"[a-z]")
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Грубое определение языка по алфавиту: ru, en или None."""
+    sample = text[:2000].lower()
+    cyrillic = len(_CYRILLIC_RE.findall(sample))
+    latin = len(_LATIN_RE.findall(sample))
+    if not cyrillic and not latin:
+        return None
+    return "ru" if cyrillic >= latin else "en"
+
+
+@dataclass
+class SearchHit:
+    id: str
+    score: float
+    created_at: float
+    source: str
+    duration: Optional[float]
+    language: Optional[str]
+    snippet: str
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "score": round(self.score, 4),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.created_at)),
+            "source": self.source,
+            "duration": self.duration,
+            "language": self.language,
+            "snippet": self.snippet,
+        }
+
+
+class TranscriptArchive:
+    """Журнал записей на диске и обратный индекс в памяти.
+
+    Внутренний номер документа - порядковый номер строки в журнале. Постинги хранятся
+    в array('I') парами (номер документа, частота терма), метаданные - в параллельных
+    массивах: на сотни тысяч записей это десятки мегабайт, а не объекты на каждую запись.
+    """
+
+    def __init__(self, path: str, max_prefix_terms: int = 64, snippet_chars: int = 160) -> None:
+        self.path = path
+        self.max_prefix_terms = max_prefix_terms
+        self.snippet_chars = snippet_chars
+        self._entries_path = os.path.join(path, ENTRIES_NAME)
+        self._ids: List[str] = []
+        self._offsets = array("Q")
+        self._timestamps = array("d")
+        self._lengths = array("I")
+        self._durations = array("d")
+        self._sources: List[str] = []
+        self._languages: List[Optional[str]] = []
+        self._postings: Dict[str, array] = {}
+        # Номера записей, упорядоченные по времени: записи приходят почти по порядку,
+        # поэтому вставка обычно идёт в конец
+        self._time_keys = array("d")
+        self._time_docs = array("I")
+        self._total_length = 0
+        # Отсортированный словарь для префиксного поиска; строится при первом префиксном запросе
+        self._sorted_terms: Optional[List[str]] = None
+        self._lock = threading.RLock()
+        self._fd: Optional[int] = None
+        self._reader: Optional[IO[bytes]] = None
+        # До этого смещения журнал уже проиндексирован
+        self._indexed_end = 0
+        self.loaded = False
+
+    @classmethod
+    def from_config(cls, cfg: dict, default_path: str) -> "TranscriptArchive":
+        return cls(
+            path=cfg.get("path") or default_path,
+            max_prefix_terms=int(cfg.get("max_prefix_terms", 64)),
+            snippet_chars=int(cfg.get("snippet_chars", 160)),
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self) -> None:
+        """Строит индекс по журналу. Вызывается один раз при запуске (в фоне); add() и search()
+        до окончания загрузки ждут её на блокировке."""
+        with self._lock:
+            if self.loaded:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            # O_APPEND: строку целиком дописывает один write, даже если в журнал пишут несколько процессов
+            self._fd = os.open(self._entries_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            size = os.path.getsize(self._entries_path)
+            if size:
+                with open(self._entries_path, "rb") as handle:
+                    handle.seek(size - 1)
+                    if handle.read(1) != b"\n":
+                        # Запись оборвалась при аварии: закрываем строку, чтобы следующая не склеилась с ней
+                        os.write(self._fd, b"\n")
+            self._reader = open(self._entries_path, "rb")
+            self._refresh()
+            self.loaded = True
+            print(f"[Archive] Загружено записей: {len(self._ids)}, термов: {len(self._postings)}")
+
+    def _refresh(self) -> None:
+        """Индексирует строки, дописанные в журнал после последнего прохода (в том числе другими процессами)."""
+        if os.fstat(self._fd).st_size <= self._indexed_end:
+            return
+        self._reader.seek(self._indexed_end)
+        for line in self._reader:
+            if not line.endswith(b"\n"):
+                break  # Строку ещё дописывают
+            offset = self._indexed_end
+            self._indexed_end += len(line)
+            try:
+                self._index(json.loads(line), offset)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"[Archive] Пропущена повреждённая запись на смещении {offset}: {e}")
+
+    def _index(self, entry: dict, offset: int) -> None:
+        # Обязательные поля читаются до изменения массивов, чтобы битая запись не сдвинула их
+        entry_id, ts, tokens = entry["id"], float(entry["ts"]), tokenize(entry["text"])
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        doc = len(self._ids)
+        self._ids.append(entry_id)
+        self._offsets.append(offset)
+        self._timestamps.append(ts)
+        self._lengths.append(len(tokens))
+        duration = entry.get("duration")
+        self._durations.append(float(duration) if duration is not None else math.nan)
+        # Источники и языки повторяются в каждой записи - храним одну строку на значение
+        self._sources.append(sys.intern(entry.get("source") or "api"))
+        language = entry.get("language")
+        self._languages.append(sys.intern(language) if language else None)
+        self._total_length += len(tokens)
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = array("I")
+                if self._sorted_terms is not None:
+                    bisect.insort(self._sorted_terms, term)
+            postings.append(doc)
+            postings.append(count)
+        position = bisect.bisect_right(self._time_keys, ts)
+        self._time_keys.insert(position, ts)
+        self._time_docs.insert(position, doc)
+
+    def add(self, entry_id: str, text: str, created_at: Optional[float] = None, source: str = "api",
+            duration: Optional[float] = None, language: Optional[str] = None) -> None:
+        """Дописывает транскрипцию в журнал и сразу делает её доступной для поиска."""
+        entry = {
+            "id": entry_id,
+            "ts": round(created_at if created_at is not None else time.time(), 3),
+            "source": source,
+            "duration": round(duration, 3) if duration is not None else None,
+            "language": language or detect_language(text),
+            "text": text,
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self.load()
+            os.write(self._fd, line)
+            self._refresh()
+
+    def _expand(self, term: str) -> List[str]:
+        """Термы словаря с заданным префиксом, самые частые первыми."""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        matches = []
+        for i in range(bisect.bisect_left(terms, term), len(terms)):
+            if not terms[i].startswith(term):
+                break
+            matches.append(terms[i])
+        if len(matches) > self.max_prefix_terms:
+            matches = heapq.nlargest(self.max_prefix_terms, matches, key=lambda t: len(self._postings[t]))
+        return matches
+
+    def _parse_query(self, query: str) -> Tuple[List[str], List[str]]:
+        """Полные термы и термы из раскрытых префиксов (слово*)."""
+        exact, expanded = [], []
+        for raw in query.split():
+            prefix = raw.endswith("*")
+            tokens = tokenize(raw)
+            if not tokens:
+                continue
+            exact.extend(tokens[:-1])
+            if prefix:
+                expanded.extend(self._expand(tokens[-1]))
+            else:
+                exact.append(tokens[-1])
+        return exact, expanded
+
+    def search(self, query: str = "", since: Optional[float] = None, until: Optional[float] = None,
+               source: Optional[str] = None, limit: int = 20) -> Tuple[int, List[SearchHit]]:
+        """Возвращает (число найденных, лучшие limit записей).
+
+        Без запроса выдаются самые свежие записи, подходящие под фильтры.
+        """
+        with self._lock:
+            self.load()
+            self._refresh()
+            exact, expanded = self._parse_query(query)
+            if not exact and not expanded:
+                return self._latest(since, until, source, limit)
+
+            count = len(self._ids)
+            timestamps, sources, lengths = self._timestamps, self._sources, self._lengths
+            filtered = since is not None or until is not None or source is not None
+            low = since if since is not None else -math.inf
+            high = until if until is not None else math.inf
+            # Знаменатель BM25: tf + K1 * (1 - B + B * длина / средняя длина)
+            average_length = self._total_length / count if count else 1.0
+            base, per_token = K1 * (1 - B), K1 * B / max(average_length, 1e-9)
+
+            terms = [t for t in dict.fromkeys(exact + expanded) if t in self._postings]
+            # Термы, которые есть больше чем в половине записей, почти не влияют на порядок,
+            # но дают самые длинные списки; если в запросе есть более редкие - пропускаем их
+            selective = [t for t in terms if len(self._postings[t]) // 2 <= count // 2]
+            if selective:
+                terms = selective
+
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings[term]
+                df = len(postings) // 2
+                weight = math.log(1 + (count - df + 0.5) / (df + 0.5)) * (K1 + 1)
+                for doc, tf in zip(postings[::2], postings[1::2]):
+                    if filtered and not (low <= timestamps[doc] < high
+                                         and (source is None or sources[doc] == source)):
+                        continue
+                    scores[doc] = scores.get(doc, 0.0) + weight * tf / (tf + base + per_token * lengths[doc])
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            highlight = exact + expanded
+            return len(scores), [self._hit(doc, score, highlight) for doc, score in top]
+
+    def _latest(self, since: Optional[float], until: Optional[float], source: Optional[str],
+                limit: int) -> Tuple[int, List[SearchHit]]:
+        """Самые свежие записи в диапазоне дат - по индексу времени, без перебора всего архива."""
+        lo = bisect.bisect_left(self._time_keys, since) if since is not None else 0
+        hi = bisect.bisect_left(self._time_keys, until) if until is not None else len(self._time_keys)
+        if source is None:
+            docs = [self._time_docs[i] for i in range(hi - 1, max(lo, hi - limit) - 1, -1)]
+            return hi - lo, [self._hit(doc, 0.0, []) for doc in docs]
+        matching = [self._time_docs[i] for i in range(hi - 1, lo - 1, -1) if self._sources[self._time_docs[i]] == source]
+        return len(matching), [self._hit(doc, 0.0, []) for doc in matching[:limit]]
+
+    def _read_text(self, doc: int) -> str:
+        self._reader.seek(self._offsets[doc])
+        return json.loads(self._reader.readline())["text"]
+
+    def _hit(self, doc: int, score: float, terms: List[str]) -> SearchHit:
+        duration = self._durations[doc]
+        return SearchHit(
+            id=self._ids[doc],
+            score=score,
+            created_at=self._timestamps[doc],
+            source=self._sources[doc],
+            duration=None if math.isnan(duration) else duration,
+            language=self._languages[doc],
+            snippet=self._snippet(self._read_text(doc), terms),
+        )
+
+    def _snippet(self, text: str, terms: List[str]) -> str:
+        """Фрагмент текста вокруг первого совпадения."""
+        position = 0
+        if terms:
+            lowered = text.lower().replace("ё", "е")
+            found = [p for p in (lowered.find(term) for term in terms) if p >= 0]
+            if found:
+                position = max(0, min(found) - self.snippet_chars // 4)
+        fragment = text[position:position + self.snippet_chars].strip()
+        return ("…" if position else "") + fragment + ("…" if position + self.snippet_chars < len(text) else "")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._ids), "terms": len(self._postings)}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._reader.close()
+                self._fd = None
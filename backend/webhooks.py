@@ -0,0 +1,192 @@
+"""Асинхронная доставка результатов транскрибации на callback URL клиента."""
+
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+
+SIGNATURE_HEADER = "X-PushToType-Signature"
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """HMAC-SHA256 подпись тела запроса в формате sha256=<hex>."""
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def callback_url_error(url: str, allowed_hosts: Iterable[str] = ()) -> Optional[str]:
+    """Причина, по которой на url нельзя доставлять результаты, или None.
+
+    Без allowed_hosts разрешены только хосты, все адреса которых публичные: иначе клиент мог бы
+    заставить сервер отправлять запросы во внутреннюю сеть (loopback, частные, link-local адреса).
+    С allowed_hosts разрешены только перечисленные хосты, в том числе внутренние.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "нужен http(s) URL с хостом"
+    host = parsed.hostname.lower()
+    allowed = {item.lower() for item in allowed_hosts}
+    if allowed:
+        return None if host in allowed else f"хост {host} не в webhooks.allowed_hosts"
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, ValueError) as e:
+        return f"не удалось разрешить {host}: {e}"
+    blocked = sorted(address for address in addresses if not _is_public_address(address))
+    if blocked:
+        return f"{host} указывает на внутренний адрес {blocked[0]}"
+    return None
+
+
+@dataclass
+class WebhookDelivery:
+    url: str
+    payload: dict
+    secret: Optional[str] = None
+    attempt: int = 0
+    # Вызывается после успешной доставки (например, чтобы освободить задачу)
+    on_delivered: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+
+class WebhookDispatcher:
+    """Очередь доставки с экспоненциальными повторами и ограничением одновременных запросов.
+
+    Число одновременно выполняемых запросов равно числу рабочих потоков (max_in_flight).
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_attempts: int = 6, base_delay: float = 1.0,
+                 max_delay: float = 300.0, timeout: float = 10.0, allowed_hosts: Iterable[str] = ()) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Пусто - только публичные адреса, см. callback_url_error
+        self.allowed_hosts = tuple(allowed_hosts)
+        # Куча (время следующей попытки, порядковый номер, доставка)
+        self._queue: List[tuple] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._session = requests.Session()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "WebhookDispatcher":
+        return cls(
+            max_in_flight=int(cfg.get("max_in_flight", 4)),
+            max_attempts=int(cfg.get("max_attempts", 6)),
+            base_delay=float(cfg.get("base_delay", 1.0)),
+            max_delay=float(cfg.get("max_delay", 300.0)),
+            timeout=float(cfg.get("timeout", 10.0)),
+            allowed_hosts=cfg.get("allowed_hosts") or (),
+        )
+
+    def url_error(self, url: str) -> Optional[str]:
+        return callback_url_error(url, self.allowed_hosts)
+
+    def submit(self, delivery: WebhookDelivery) -> None:
+        self._ensure_workers()
+        self._schedule(delivery, delay=0.0)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def _ensure_workers(self) -> None:
+        # Потоки стартуют лениво, при первой доставке
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self.max_in_flight):
+                worker = threading.Thread(target=self._worker_loop, name=f"webhook-{i}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def _schedule(self, delivery: WebhookDelivery, delay: float) -> None:
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), delivery))
+            self._cond.notify()
+
+    def _next_due(self) -> WebhookDelivery:
+        with self._cond:
+            while True:
+                if self._queue:
+                    due_at = self._queue[0][0]
+                    wait = due_at - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._queue)[2]
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+
+    def _worker_loop(self) -> None:
+        while True:
+            delivery = self._next_due()
+            try:
+                outcome = self._deliver(delivery)
+            except Exception as e:
+                print(f"[Webhook] Ошибка доставки на {delivery.url}: {e}")
+                outcome = "retry"
+
+            if outcome == "delivered":
+                if delivery.on_delivered is not None:
+                    try:
+                        delivery.on_delivered()
+                    except Exception as e:
+                        print(f"[Webhook] Ошибка в on_delivered: {e}")
+                continue
+            if outcome == "rejected":
+                continue
+
+            delivery.attempt += 1
+            if delivery.attempt >= self.max_attempts:
+                print(f"[Webhook] ❌ Доставка на {delivery.url} не удалась после {delivery.attempt} попыток")
+                continue
+            delay = min(self.base_delay * (2 ** (delivery.attempt - 1)), self.max_delay)
+            print(f"[Webhook] Повтор доставки на {delivery.url} через {delay:.1f}с (попытка {delivery.attempt + 1})")
+            self._schedule(delivery, delay)
+
+    def _deliver(self, delivery: WebhookDelivery) -> str:
+        """Одна попытка доставки: delivered, retry или rejected (3xx/4xx, повторять бессмысленно)."""
+        # Адрес проверяется снова перед каждой попыткой: DNS-запись могла смениться после приёма задачи
+        error = self.url_error(delivery.url)
+        if error is not None:
+            print(f"[Webhook] Доставка на {delivery.url} запрещена: {error}")
+            return "rejected"
+        body = json.dumps(delivery.payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if delivery.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(body, delivery.secret)
+        try:
+            # Редиректы не выполняются: они увели бы запрос на непроверенный адрес
+            resp = self._session.post(delivery.url, data=body, headers=headers, timeout=self.timeout,
+                                      allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            print(f"[Webhook] Сетевая ошибка при доставке на {delivery.url}: {e}")
+            return "retry"
+        if 200 <= resp.status_code < 300:
+            print(f"[Webhook] ✅ Результат доставлен на {delivery.url}")
+            return "delivered"
+        print(f"[Webhook] {delivery.url} ответил {resp.status_code}: {resp.text[:200]}")
+        if 300 <= resp.status_code < 500 and resp.status_code not in (408, 429):
+            return "rejected"
+        return "retry"
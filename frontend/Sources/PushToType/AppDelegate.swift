@@ -21,8 +21,10 @@ final class AppDelegate: NSObject, NSApplicationDelegate {
     private var isRequestingAccessibility = false
     private var currentUploadTask: URLSessionDataTask?
     private var currentPoller: BackendClient.TranscriptionPoller?
+    private var currentAskTask: Task<Void, Never>?
     private var lastAction: RecordingAction = .sendEnter
     private var lastTranscription: String?
+    private var chatSessionId: String?
 
     func applicationDidFinishLaunching(_ notification: Notification) {
         setupStatusBar()
@@ -168,6 +170,10 @@ final class AppDelegate: NSObject, NSApplicationDelegate {
         // Дадим системе финализировать файл
         DispatchQueue.main.asyncAfter(deadline: .now() + 0.2) { [weak self] in
             guard let self else { return }
+            if self.currentAction == .ask {
+                self.askWithAudio(fileURL: recordingURL)
+                return
+            }
             self.currentUploadTask = self.backendClient.uploadAudio(fileURL: recordingURL) { [weak self] result in
                 DispatchQueue.main.async {
                     switch result {
@@ -224,6 +230,10 @@ final class AppDelegate: NSObject, NSApplicationDelegate {
         statusHUD.update(stage: .uploading)
 
         let url = AudioStorage.shared.lastRecordingURL
+        if currentAction == .ask {
+            askWithAudio(fileURL: url)
+            return
+        }
         backendClient.uploadAudio(fileURL: url) { [weak self] result in
             DispatchQueue.main.async {
                 switch result {
@@ -272,6 +282,8 @@ final class AppDelegate: NSObject, NSApplicationDelegate {
         currentUploadTask = nil
         currentPoller?.cancel()
         currentPoller = nil
+        currentAskTask?.cancel()
+        currentAskTask = nil
         // Сбрасываем HUD и состояние
         statusHUD.hideImmediately()
         // Сообщаем бэкенду/поллеру прекратить ожидание — через отдельный экземпляр poller пока не поддерживается,
@@ -280,17 +292,53 @@ final class AppDelegate: NSObject, NSApplicationDelegate {
         statusHUD.update(stage: .idle)
     }
 
+    /// Голосовой вопрос одним запросом: бэкенд сам транскрибирует запись и спрашивает модель,
+    /// вопрос показывается, как только готов текст, ответ - следом по тому же соединению
+    private func askWithAudio(fileURL: URL) {
+        let sessionId = chatWeb.isVisible ? chatSessionId : nil
+        lastTranscription = nil
+        statusHUD.update(stage: .waitingForTranscription)
+        currentAskTask = backendClient.askAudio(fileURL: fileURL, sessionId: sessionId, onTranscription: { [weak self] transcription in
+            DispatchQueue.main.async {
+                guard let self else { return }
+                self.lastTranscription = transcription
+                self.statusHUD.hideImmediately()
+                self.chatWeb.showQuestion(transcription)
+            }
+        }) { [weak self] result in
+            DispatchQueue.main.async {
+                guard let self else { return }
+                self.currentAskTask = nil
+                switch result {
+                case .success(let response):
+                    self.chatSessionId = response.session_id
+                    self.chatWeb.updateAnswer(response.answer)
+                case .failure(let error):
+                    if self.lastTranscription == nil {
+                        // Вопрос ещё не показан - ошибка загрузки или транскрибации
+                        self.statusHUD.update(stage: .error(error.localizedDescription))
+                    } else {
+                        self.chatWeb.updateAnswer("❌ Ошибка: \(error.localizedDescription)")
+                    }
+                }
+            }
+        }
+    }
+
     private func askChatAndShowAnswer(transcription: String) {
+        // Пока окно ответа открыто, вопросы продолжают одну сессию; после закрытия - новый разговор
+        let sessionId = chatWeb.isVisible ? chatSessionId : nil
         // Скрываем HUD и показываем окно с вопросом сразу
         statusHUD.hideImmediately()
         chatWeb.showQuestion(transcription)
         
         // Отправляем вопрос на бэкенд
-        backendClient.askChatGPT(question: transcription) { [weak self] result in
+        backendClient.askChatGPT(question: transcription, sessionId: sessionId) { [weak self] result in
             DispatchQueue.main.async {
                 switch result {
-                case .success(let answer):
-                    self?.chatWeb.updateAnswer(answer)
+                case .success(let response):
+                    self?.chatSessionId = response.session_id
+                    self?.chatWeb.updateAnswer(response.answer)
                 case .failure(let error):
                     // Показываем ошибку в окне
                     self?.chatWeb.updateAnswer("❌ Ошибка: \(error.localizedDescription)")
@@ -324,6 +372,10 @@ final class AppDelegate: NSObject, NSApplicationDelegate {
         statusHUD.update(stage: .uploading)
         
         let url = AudioStorage.shared.lastRecordingURL
+        if currentAction == .ask {
+            askWithAudio(fileURL: url)
+            return
+        }
         currentUploadTask = backendClient.uploadAudio(fileURL: url) { [weak self] result in
             DispatchQueue.main.async {
                 switch result {
@@ -1,21 +1,45 @@
 import Foundation
 
+/// Запрос к бэкенду с ключом клиента API, если он задан в конфиге (frontend.api_key)
+private func backendRequest(url: URL) -> URLRequest {
+    var request = URLRequest(url: url)
+    if let apiKey = Configuration.shared.apiKey, !apiKey.isEmpty {
+        request.setValue("Bearer \(apiKey)", forHTTPHeaderField: "Authorization")
+    }
+    return request
+}
+
 final class BackendClient: @unchecked Sendable {
     struct ChatResponse: Decodable {
         let answer: String
+        let session_id: String?  // Чат-сессия на бэкенде: передаётся в следующем вопросе
     }
     private struct UploadResponse: Decodable {
         let recording_id: String
+        let poll_after: Double?
     }
 
     private struct TranscriptionResponse: Decodable {
         let status: String
         let transcription: String?
         let error: String? // NEW
+        let poll_after: Double?  // Через сколько секунд задача должна быть готова (оценка сервера)
+    }
+
+    /// Строка NDJSON из /api/ask: accepted, transcription, answer или error
+    private struct AskEvent: Decodable {
+        let event: String
+        let transcription: String?
+        let answer: String?
+        let session_id: String?
+        let error: String?
     }
 
     private let baseURL: URL
     private let session: URLSession
+    // Подсказки сервера из ответа на загрузку: когда делать первый опрос
+    private var pollHints: [String: TimeInterval] = [:]
+    private let pollHintsLock = NSLock()
 
     init(baseURL: URL? = nil, session: URLSession = .shared) {
         self.baseURL = baseURL ?? Configuration.shared.backendBaseURL
@@ -31,7 +55,7 @@ final class BackendClient: @unchecked Sendable {
         let uploadURL = baseURL
             .appendingPathComponent("api")
             .appendingPathComponent("audio")
-        var request = URLRequest(url: uploadURL)
+        var request = backendRequest(url: uploadURL)
         request.httpMethod = "POST"
 
         let boundary = "Boundary-\(UUID().uuidString)"
@@ -43,6 +67,14 @@ final class BackendClient: @unchecked Sendable {
         }
 
         var body = Data()
+        // Дедлайн клиента: после него бэкенд снимает задачу и удаляет файлы
+        body.append("--\(boundary)\r\n".data(using: .utf8)!)
+        body.append("Content-Disposition: form-data; name=\"timeout\"\r\n\r\n".data(using: .utf8)!)
+        body.append("\(Int(Configuration.shared.timeout))\r\n".data(using: .utf8)!)
+        // Источник записи для архива транскрипций
+        body.append("--\(boundary)\r\n".data(using: .utf8)!)
+        body.append("Content-Disposition: form-data; name=\"source\"\r\n\r\n".data(using: .utf8)!)
+        body.append("macos\r\n".data(using: .utf8)!)
         body.append("--\(boundary)\r\n".data(using: .utf8)!)
         body.append("Content-Disposition: form-data; name=\"audio\"; filename=\"audio.m4a\"\r\n".data(using: .utf8)!)
         body.append("Content-Type: audio/m4a\r\n\r\n".data(using: .utf8)!)
@@ -74,6 +106,11 @@ final class BackendClient: @unchecked Sendable {
 
             do {
                 let decoded = try JSONDecoder().decode(UploadResponse.self, from: data)
+                if let pollAfter = decoded.poll_after {
+                    self.pollHintsLock.lock()
+                    self.pollHints[decoded.recording_id] = pollAfter
+                    self.pollHintsLock.unlock()
+                }
                 completion(.success(decoded.recording_id))
             } catch {
                 completion(.failure(error))
@@ -85,8 +122,11 @@ final class BackendClient: @unchecked Sendable {
 
     @discardableResult
     func pollTranscription(recordingId: String, completion: @escaping @Sendable (Result<String, Error>) -> Void) -> TranscriptionPoller {
+        pollHintsLock.lock()
+        let initialDelay = pollHints.removeValue(forKey: recordingId)
+        pollHintsLock.unlock()
         let poller = TranscriptionPoller(baseURL: baseURL, session: session)
-        poller.startPolling(recordingId: recordingId, completion: completion)
+        poller.startPolling(recordingId: recordingId, initialDelay: initialDelay, completion: completion)
         return poller
     }
 
@@ -98,6 +138,7 @@ final class BackendClient: @unchecked Sendable {
         private var currentPollingInterval: TimeInterval = 0.1
         private let maxPollingInterval: TimeInterval = 5.0     // Максимум 5 секунд
         private let backoffMultiplier: Double = 1.5            // Увеличение в 1.5 раза
+        private let maxHintedInterval: TimeInterval = 30.0     // Потолок для подсказки сервера
         private let timeout: TimeInterval
         private var startDate = Date()
         private var completion: (@Sendable (Result<String, Error>) -> Void)?
@@ -110,22 +151,44 @@ final class BackendClient: @unchecked Sendable {
             self.timeout = Configuration.shared.timeout
         }
 
-        func startPolling(recordingId: String, completion: @escaping @Sendable (Result<String, Error>) -> Void) {
+        func startPolling(recordingId: String, initialDelay: TimeInterval? = nil, completion: @escaping @Sendable (Result<String, Error>) -> Void) {
             self.recordingId = recordingId
             self.completion = completion
-            self.currentPollingInterval = initialPollingInterval
+            // Сервер оценил время готовности - первый опрос сразу к этому моменту
+            self.currentPollingInterval = initialDelay.map(hintedInterval) ?? initialPollingInterval
             startDate = Date()
             scheduleNextPoll()
         }
 
         func cancel() {
             DispatchQueue.main.async {
+                // Результат ещё не получен — просим бэкенд прервать задачу и освободить ресурсы
+                let shouldNotifyBackend = !self.isCancelled && self.completion != nil && !self.recordingId.isEmpty
                 self.isCancelled = true
                 self.timer?.invalidate()
                 self.timer = nil
                 self.completion = nil
+                if shouldNotifyBackend {
+                    self.deleteJobOnBackend()
+                }
             }
         }
+
+        private func deleteJobOnBackend() {
+            let url = baseURL
+                .appendingPathComponent("api")
+                .appendingPathComponent("transcription")
+                .appendingPathComponent(recordingId)
+            var request = backendRequest(url: url)
+            request.httpMethod = "DELETE"
+            session.dataTask(with: request) { _, _, error in
+                #if DEBUG
+                if let error {
+                    print("[BackendClient] cancel error for \(url): \(error.localizedDescription)")
+                }
+                #endif
+            }.resume()
+        }
         
         private func scheduleNextPoll() {
             DispatchQueue.main.async {
@@ -140,6 +203,7 @@ final class BackendClient: @unchecked Sendable {
         @objc private func handleTimer() {
             if isCancelled { return }
             if Date().timeIntervalSince(startDate) > timeout {
+                deleteJobOnBackend()
                 finish(with: .failure(NSError(domain: "PushToType", code: -3, userInfo: [NSLocalizedDescriptionKey: "Таймаут"])))
                 return
             }
@@ -148,7 +212,7 @@ final class BackendClient: @unchecked Sendable {
                 .appendingPathComponent("api")
                 .appendingPathComponent("transcription")
                 .appendingPathComponent(recordingId)
-            session.dataTask(with: url) { data, response, error in
+            session.dataTask(with: backendRequest(url: url)) { data, response, error in
                 if self.isCancelled { return }
                 if let error {
                     #if DEBUG
@@ -199,8 +263,12 @@ final class BackendClient: @unchecked Sendable {
                     #endif
                     self.finish(with: .failure(NSError(domain: "PushToType", code: -4, userInfo: [NSLocalizedDescriptionKey: message])))
                 } else {
-                    // Статус "processing" - увеличиваем интервал и планируем следующий запрос
-                    self.increasePollingInterval()
+                    // Статус "processing": следуем подсказке сервера, без неё - экспоненциальный backoff
+                    if let pollAfter = decoded.poll_after {
+                        self.currentPollingInterval = self.hintedInterval(pollAfter)
+                    } else {
+                        self.increasePollingInterval()
+                    }
                     self.scheduleNextPoll()
                 }
             }.resume()
@@ -210,6 +278,10 @@ final class BackendClient: @unchecked Sendable {
             currentPollingInterval = min(currentPollingInterval * backoffMultiplier, maxPollingInterval)
         }
 
+        private func hintedInterval(_ pollAfter: TimeInterval) -> TimeInterval {
+            min(max(pollAfter, initialPollingInterval), maxHintedInterval)
+        }
+
         private func finish(with result: Result<String, Error>) {
             DispatchQueue.main.async {
                 self.timer?.invalidate()
@@ -220,15 +292,21 @@ final class BackendClient: @unchecked Sendable {
         }
     }
 
-    func askChatGPT(question: String, completion: @escaping @Sendable (Result<String, Error>) -> Void) {
+    /// Вопрос к ChatGPT. С sessionId продолжает разговор, без него начинает новую сессию.
+    func askChatGPT(question: String, sessionId: String? = nil, completion: @escaping @Sendable (Result<ChatResponse, Error>) -> Void) {
         let url = baseURL
             .appendingPathComponent("api")
             .appendingPathComponent("chat")
-        var request = URLRequest(url: url)
+        var request = backendRequest(url: url)
         request.httpMethod = "POST"
         request.setValue("application/json", forHTTPHeaderField: "Content-Type")
 
-        let payload: [String: String] = ["question": question]
+        var payload: [String: String] = ["question": question]
+        if let sessionId {
+            payload["session_id"] = sessionId
+        } else {
+            payload["session"] = "true"
+        }
         request.httpBody = try? JSONSerialization.data(withJSONObject: payload)
 
         session.dataTask(with: request) { data, response, error in
@@ -246,10 +324,86 @@ final class BackendClient: @unchecked Sendable {
             }
             do {
                 let decoded = try JSONDecoder().decode(ChatResponse.self, from: data)
-                completion(.success(decoded.answer))
+                completion(.success(decoded))
             } catch {
                 completion(.failure(error))
             }
         }.resume()
     }
+
+    /// Голосовой вопрос одним запросом: бэкенд транскрибирует запись и сразу спрашивает модель.
+    /// onTranscription вызывается, как только готов текст вопроса; completion - с ответом модели.
+    @discardableResult
+    func askAudio(fileURL: URL, sessionId: String? = nil,
+                  onTranscription: @escaping @Sendable (String) -> Void,
+                  completion: @escaping @Sendable (Result<ChatResponse, Error>) -> Void) -> Task<Void, Never>? {
+        let url = baseURL
+            .appendingPathComponent("api")
+            .appendingPathComponent("ask")
+        var request = backendRequest(url: url)
+        request.httpMethod = "POST"
+        request.setValue("application/x-ndjson", forHTTPHeaderField: "Accept")
+
+        let boundary = "Boundary-\(UUID().uuidString)"
+        request.setValue("multipart/form-data; boundary=\(boundary)", forHTTPHeaderField: "Content-Type")
+
+        guard let audioData = try? Data(contentsOf: fileURL) else {
+            completion(.failure(NSError(domain: "PushToType", code: -1, userInfo: [NSLocalizedDescriptionKey: "Не удалось прочитать файл"])))
+            return nil
+        }
+
+        var fields = ["timeout": "\(Int(Configuration.shared.timeout))", "source": "macos"]
+        // Пока окно ответа открыто, вопрос продолжает сессию; иначе бэкенд начинает новую
+        if let sessionId {
+            fields["session_id"] = sessionId
+        } else {
+            fields["session"] = "true"
+        }
+        var body = Data()
+        for (name, value) in fields {
+            body.append("--\(boundary)\r\n".data(using: .utf8)!)
+            body.append("Content-Disposition: form-data; name=\"\(name)\"\r\n\r\n".data(using: .utf8)!)
+            body.append("\(value)\r\n".data(using: .utf8)!)
+        }
+        body.append("--\(boundary)\r\n".data(using: .utf8)!)
+        body.append("Content-Disposition: form-data; name=\"audio\"; filename=\"audio.m4a\"\r\n".data(using: .utf8)!)
+        body.append("Content-Type: audio/m4a\r\n\r\n".data(using: .utf8)!)
+        body.append(audioData)
+        body.append("\r\n--\(boundary)--\r\n".data(using: .utf8)!)
+        request.httpBody = body
+
+        let session = self.session
+        let askRequest = request
+        return Task {
+            do {
+                let (bytes, response) = try await session.bytes(for: askRequest)
+                if let http = response as? HTTPURLResponse, !(200...299).contains(http.statusCode) {
+                    completion(.failure(NSError(domain: "PushToType", code: http.statusCode, userInfo: [NSLocalizedDescriptionKey: "Ошибка загрузки аудио (HTTP \(http.statusCode))"])))
+                    return
+                }
+                // События приходят по одному на строку, по мере готовности на бэкенде
+                for try await line in bytes.lines {
+                    guard let data = line.data(using: .utf8),
+                          let event = try? JSONDecoder().decode(AskEvent.self, from: data) else { continue }
+                    switch event.event {
+                    case "transcription":
+                        onTranscription(event.transcription ?? "")
+                    case "answer":
+                        completion(.success(ChatResponse(answer: event.answer ?? "", session_id: event.session_id)))
+                        return
+                    case "error":
+                        completion(.failure(NSError(domain: "PushToType", code: -4, userInfo: [NSLocalizedDescriptionKey: event.error ?? "Ошибка транскрибации"])))
+                        return
+                    default:
+                        continue
+                    }
+                }
+                completion(.failure(NSError(domain: "PushToType", code: -6, userInfo: [NSLocalizedDescriptionKey: "Ответ оборвался"])))
+            } catch {
+                // Отмена пользователем - не ошибка
+                if Task.isCancelled { return }
+                completion(.failure(error))
+            }
+        }
+    }
 }
@@ -259,6 +259,11 @@ final class ChatWebViewController: NSObject, WKNavigationDelegate {
         webView.loadHTMLString(html, baseURL: nil)
     }
 
+    /// Окно ответа открыто: следующий вопрос продолжает текущий разговор
+    var isVisible: Bool {
+        window.isVisible
+    }
+
     func showQuestion(_ question: String) {
         // Активируем приложение, чтобы окно получило фокус
         NSApp.activate(ignoringOtherApps: true)
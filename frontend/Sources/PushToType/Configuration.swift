@@ -20,10 +20,13 @@ struct BackendConfiguration: Codable {
 struct FrontendConfiguration: Codable {
     let pollingInterval: TimeInterval
     let timeout: TimeInterval
+    // Ключ клиента API бэкенда (clients.tenants); без него приложение работает как anonymous
+    let apiKey: String?
     
     enum CodingKeys: String, CodingKey {
         case pollingInterval = "polling_interval"
         case timeout
+        case apiKey = "api_key"
     }
 }
 
@@ -72,7 +75,8 @@ final class Configuration: @unchecked Sendable {
                 ),
                 frontend: FrontendConfiguration(
                     pollingInterval: 1.5,
-                    timeout: 60
+                    timeout: 60,
+                    apiKey: nil
                 )
             )
             PTLog.write("config fallback to default http://127.0.0.1:5001")
@@ -91,5 +95,9 @@ final class Configuration: @unchecked Sendable {
         return config.frontend.timeout
     }
     
+    var apiKey: String? {
+        return config.frontend.apiKey
+    }
+    
     // Ранее здесь была настройка автоотправки, теперь управление через разные хоткеи
 }
@@ -35,6 +35,7 @@ fi
 echo "🌐 Запуск сервера... (host/port берутся из конфига или ENV)"
 echo "📋 Для остановки нажмите Ctrl+C"
 
-# Запускаем сервер (host/port определяются внутри приложения: ENV > конфиг > дефолт)
-python server.py
+# Запускаем сервер (host/port определяются внутри приложения: ENV > конфиг > дефолт;
+# аргументы передаются как есть, например --workers 4)
+python server.py "$@"
 